@@ -0,0 +1,104 @@
+"""
+Ingestion micro-benchmark: events/second through HomeAssistantClient._handle_messages.
+
+Compares the legacy path (full json.loads of every frame, then filter) with the raw-frame
+pre-filter plus the optional fast JSON backend. Most frames target non-monitored entities,
+as on a real Home Assistant instance.
+
+Usage: python -m benchmarks.bench_ingest [--events N] [--target-share 0.1]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+from unittest import mock
+
+import aiohttp
+
+from src.common import json_codec
+from src.ingestion import websocket_client
+from src.ingestion.filter import FilterManager
+from src.ingestion.websocket_client import HomeAssistantClient
+
+def make_frames(count: int, target_share: float, seed: int = 1):
+    rng = random.Random(seed)
+    attributes = {
+        "unit_of_measurement": "W",
+        "device_class": "power",
+        "friendly_name": "Some entity with a long friendly name",
+        "state_class": "measurement",
+        "icon": "mdi:flash",
+    }
+    frames = []
+    for i in range(count):
+        if rng.random() < target_share:
+            entity_id = f"sensor.knx_power_{i % 500}"
+        else:
+            entity_id = f"sensor.other_{i % 5000}"
+        state = {"entity_id": entity_id, "state": str(rng.uniform(0, 1000)),
+                 "attributes": attributes, "last_changed": "2024-01-01T00:00:00+00:00",
+                 "last_updated": "2024-01-01T00:00:00+00:00",
+                 "context": {"id": "01HABCDEF", "parent_id": None, "user_id": None}}
+        frames.append(json.dumps({
+            "id": 2, "type": "event",
+            "event": {"event_type": "state_changed",
+                      "data": {"entity_id": entity_id, "old_state": state, "new_state": state},
+                      "origin": "LOCAL", "time_fired": "2024-01-01T00:00:00+00:00",
+                      "context": {"id": "01HABCDEF", "parent_id": None, "user_id": None}}
+        }))
+    return frames
+
+class FrameSource:
+    """Stands in for aiohttp's websocket: async-iterates TEXT messages."""
+    def __init__(self, frames):
+        self._messages = [SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=f) for f in frames]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for m in self._messages:
+            yield m
+
+async def run_once(frames, prefilter: bool, fast_json: bool) -> float:
+    delivered = []
+    client = HomeAssistantClient("ws://bench/core/websocket", "token", delivered.append,
+                                 filter_manager=FilterManager(["sensor.knx*"]), prefilter=prefilter)
+    client.ws = FrameSource(frames)
+
+    async def deliver(data):
+        client.on_message_callback(data)
+
+    client._safe_callback = deliver
+    codec = json_codec.orjson if fast_json else None
+    with mock.patch.object(json_codec, "orjson", codec):
+        start = time.perf_counter()
+        await client._handle_messages()
+        # Let the dispatched callbacks run
+        await asyncio.sleep(0)
+        elapsed = time.perf_counter() - start
+    return len(frames) / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=50000)
+    parser.add_argument("--target-share", type=float, default=0.1)
+    args = parser.parse_args()
+
+    frames = make_frames(args.events, args.target_share)
+    before = asyncio.run(run_once(frames, prefilter=False, fast_json=False))
+    after = asyncio.run(run_once(frames, prefilter=True, fast_json=True))
+    print(json.dumps({
+        "benchmark": "ingest",
+        "events": args.events,
+        "target_share": args.target_share,
+        "json_backend": json_codec.BACKEND,
+        "before_events_per_s": round(before),
+        "after_events_per_s": round(after),
+        "speedup": round(after / before, 2),
+    }))
+
+if __name__ == "__main__":
+    main()
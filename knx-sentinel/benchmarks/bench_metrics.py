@@ -0,0 +1,74 @@
+"""
+Instrumentation overhead: cost per event of the metrics layer on the hot path.
+
+Measures Histogram.observe and Counter.inc in isolation, and run.handle_event for a numeric
+state_changed event with and without the kernel_seconds histogram.
+
+Usage: python -m benchmarks.bench_metrics [--events N]
+"""
+import argparse
+import json
+import logging
+import time
+
+import run
+from benchmarks.bench_pipeline import CaptureSink, make_egress, reset_kernel
+from src.common.metrics import Counter, Histogram
+from src.kernel.watchdog import WatchdogKernel
+
+def ns_per_call(fn, n: int) -> float:
+    start = time.perf_counter()
+    fn(n)
+    return (time.perf_counter() - start) / n * 1e9
+
+def handle_events(events, instrumented: bool) -> float:
+    reset_kernel(60, True)
+    run.kernel_time = Histogram() if instrumented else None
+    egress = make_egress(CaptureSink(record=False))
+    watchdog = WatchdogKernel([])
+    start = time.perf_counter()
+    for event in events:
+        run.handle_event(event, egress, watchdog, {})
+    elapsed = time.perf_counter() - start
+    run.kernel_time = None
+    return elapsed / len(events) * 1e9
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    histogram, counter = Histogram(), Counter()
+
+    def observe(n):
+        for i in range(n):
+            histogram.observe(0.0001)
+
+    def inc(n):
+        for i in range(n):
+            counter.inc()
+
+    def empty(n):
+        for i in range(n):
+            pass
+
+    loop_ns = ns_per_call(empty, args.events)
+    events = [{"type": "event", "event": {"event_type": "state_changed", "data": {
+        "entity_id": f"sensor.e{i % 500}",
+        "new_state": {"state": str(200 + i % 7), "last_updated": "t", "attributes": {}}}}}
+        for i in range(args.events)]
+    # Best of 3 to reduce noise
+    plain = min(handle_events(events, False) for _ in range(3))
+    instrumented = min(handle_events(events, True) for _ in range(3))
+    print(json.dumps({
+        "benchmark": "metrics",
+        "histogram_observe_ns": round(ns_per_call(observe, args.events) - loop_ns, 1),
+        "counter_inc_ns": round(ns_per_call(inc, args.events) - loop_ns, 1),
+        "handle_event_ns": round(plain, 1),
+        "handle_event_instrumented_ns": round(instrumented, 1),
+        "overhead_pct": round((instrumented - plain) / plain * 100, 2),
+    }))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+"""
+End-to-end pipeline benchmark: synthetic frames through the real
+HomeAssistantClient -> FilterManager -> EventDispatcher -> handle_event -> MQTTEgress path,
+with the broker replaced by a capture sink.
+
+For every combination of entity count, window size and filter pattern count it reports:
+- events_per_s: frames read from the websocket per second of wall time, until the queue is drained
+- p50/p99 ingest-to-publish latency (ms): from the frame leaving the socket to the MQTT publish call
+- cpu_s: process CPU time of the timed run
+- bytes_per_entity: kernel state retained per tracked entity (tracemalloc, separate untimed pass)
+
+Windows are pre-filled before the timed run, so the kernel works on full windows.
+By default frames are offered as fast as the pipeline takes them (maximum throughput, so
+latency includes time spent in the ingestion queue); use --rate for latency at a given load.
+Each result is one JSON line. Write them to a file with --output, and compare two runs
+(e.g. two commits) with --compare: a non-zero exit status flags a throughput regression.
+
+Usage:
+    python -m benchmarks.bench_pipeline [--entities 100,1000,10000] [--windows 60]
+        [--patterns 1,50] [--updates 5] [--output results.jsonl]
+    python -m benchmarks.bench_pipeline --compare baseline.jsonl --output current.jsonl
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import random
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import aiohttp
+
+import run
+from src.common import json_codec
+from src.egress.mqtt import MQTTEgress
+from src.ingestion.dispatcher import EventDispatcher
+from src.ingestion.filter import FilterManager
+from src.ingestion.websocket_client import HomeAssistantClient
+from src.kernel.buffer import WindowStore
+from src.kernel.math_engine import StreamingZScoreEngine, ZScoreEngine
+from src.kernel.watchdog import WatchdogKernel
+
+TARGET_PREFIX = "sensor.bench_"
+ATTRIBUTES = {
+    "unit_of_measurement": "W",
+    "device_class": "power",
+    "friendly_name": "Benchmark power sensor",
+    "state_class": "measurement",
+}
+
+class CaptureSink:
+    """Stands in for the paho client: records the publish time and payload of every message."""
+    def __init__(self, record: bool = True):
+        self.record = record
+        self.published = []
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if self.record:
+            self.published.append((time.perf_counter(), payload))
+
+    def is_connected(self):
+        return True
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+class StampedFrameSource:
+    """
+    Stands in for aiohttp's websocket: async-iterates TEXT messages, noting when each one is read.
+    With a rate (frames/s), frames are released on schedule instead of as fast as they are consumed.
+    """
+    def __init__(self, frames, rate: float = 0):
+        self._messages = [SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=f) for f in frames]
+        self.read_at = [0.0] * len(frames)
+        self.rate = rate
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        clock = time.perf_counter
+        read_at = self.read_at
+        start = clock()
+        for seq, m in enumerate(self._messages):
+            if self.rate:
+                # Like a socket read that has to wait for data, this lets the workers run
+                await asyncio.sleep(max(0.0, start + seq / self.rate - clock()))
+            read_at[seq] = clock()
+            yield m
+
+def make_patterns(count: int):
+    """One pattern matching the benchmark entities, plus decoys that never match."""
+    patterns = [TARGET_PREFIX + "*"]
+    for i in range(count - 1):
+        patterns.append(f"sensor.decoy_{i}_*" if i % 2 else f"light.decoy_{i}")
+    return patterns
+
+def make_frames(entities: int, updates: int, noise_share: float, knx_share: float, seed: int = 1):
+    """
+    Interleaved state_changed frames for `entities` target entities (`updates` each),
+    plus non-target state changes and knx_events. The sequence number of every frame is
+    carried in last_updated / time_fired, which end up in the published payload.
+    """
+    rng = random.Random(seed)
+    frames = []
+    seq = 0
+    for _ in range(updates):
+        for e in range(entities):
+            r = rng.random()
+            if r < knx_share:
+                event = {"event_type": "knx_event", "time_fired": str(seq),
+                         "data": {"destination": f"1/{e % 8}/{e % 256}", "direction": "Incoming",
+                                  "telegramtype": "GroupValueWrite", "data": [rng.randrange(256)]}}
+            else:
+                prefix = "sensor.other_" if r < knx_share + noise_share else TARGET_PREFIX
+                entity_id = f"{prefix}{e}"
+                state = {"entity_id": entity_id, "state": str(round(rng.gauss(500, 20), 2)),
+                         "attributes": ATTRIBUTES, "last_changed": str(seq), "last_updated": str(seq)}
+                event = {"event_type": "state_changed", "time_fired": str(seq),
+                         "data": {"entity_id": entity_id, "old_state": None, "new_state": state}}
+            frames.append(json.dumps({"id": 2, "type": "event", "event": event}))
+            seq += 1
+    return frames
+
+def reset_kernel(window: int, streaming: bool):
+    """Fresh global kernel state in run.py, as at agent start."""
+    run.window_store = WindowStore(window_size=window)
+    run.zscore_engine_cls = StreamingZScoreEngine if streaming else ZScoreEngine
+    run.z_engines = run.make_engine_registry()
+    run.hvac_engines = {}
+    run.batcher = None
+    run.sharded_kernel = None
+    run.deadband = None
+
+def prefill(entities: int, window: int, seed: int = 2):
+    rng = random.Random(seed)
+    for e in range(entities):
+        entity_id = f"{TARGET_PREFIX}{e}"
+        engine = run.z_engines.get(entity_id)
+        for _ in range(window):
+            engine.process(rng.gauss(500, 20))
+
+def make_egress(sink: CaptureSink) -> MQTTEgress:
+    egress = MQTTEgress({"client_id": "bench", "site_id": "bench", "mqtt_outbox_enabled": False})
+    egress.client = sink
+    return egress
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+async def timed_run(frames, patterns, workers: int, rate: float):
+    sink = CaptureSink()
+    egress = make_egress(sink)
+    watchdog = WatchdogKernel([])
+    dispatcher = EventDispatcher(lambda msg: run.handle_event(msg, egress, watchdog, {}), workers=workers)
+    client = HomeAssistantClient("ws://bench/core/websocket", "token", None,
+                                 filter_manager=FilterManager(patterns), dispatcher=dispatcher)
+    source = StampedFrameSource(frames, rate)
+    client.ws = source
+
+    dispatcher.start()
+    gc.collect()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    await client._handle_messages()
+    await dispatcher.stop(drain=True)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+
+    latencies = sorted(
+        published_at - source.read_at[int(json_codec.loads(payload)["timestamp"])]
+        for published_at, payload in sink.published
+    )
+    return elapsed, cpu, latencies
+
+def retained_bytes(frames, patterns, entities: int, window: int, streaming: bool) -> float:
+    """Kernel memory per tracked entity after the same traffic, measured with tracemalloc (untimed)."""
+    reset_kernel(window, streaming)
+    filter_mgr = FilterManager(patterns)
+    events = [e for e in map(json.loads, frames)
+              if filter_mgr.should_process(e["event"]["data"].get("entity_id", ""))]
+    egress = make_egress(CaptureSink(record=False))
+    watchdog = WatchdogKernel([])
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        prefill(entities, window)
+        for event in events:
+            run.handle_event(event, egress, watchdog, {})
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - base
+    finally:
+        tracemalloc.stop()
+    return retained / max(1, entities)
+
+def run_case(entities: int, window: int, pattern_count: int, args) -> dict:
+    frames = make_frames(entities, args.updates, args.noise_share, args.knx_share)
+    patterns = make_patterns(pattern_count)
+
+    reset_kernel(window, args.streaming)
+    prefill(entities, window)
+    elapsed, cpu, latencies = asyncio.run(timed_run(frames, patterns, args.workers, args.rate))
+    bytes_per_entity = retained_bytes(frames, patterns, entities, window, args.streaming) if args.memory else None
+
+    return {
+        "benchmark": "pipeline",
+        "entities": entities,
+        "rate": args.rate,
+        "window": window,
+        "patterns": pattern_count,
+        "events": len(frames),
+        "published": len(latencies),
+        "events_per_s": round(len(frames) / elapsed),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "cpu_s": round(cpu, 3),
+        "cpu_us_per_event": round(cpu / len(frames) * 1e6, 2),
+        "bytes_per_entity": round(bytes_per_entity) if bytes_per_entity is not None else None,
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+def compare(baseline_path: str, results, tolerance: float) -> bool:
+    """Print per-case ratios against a baseline file. Returns False on a throughput regression."""
+    with open(baseline_path) as f:
+        baseline = {}
+        for line in f:
+            if line.strip():
+                r = json.loads(line)
+                baseline[(r["entities"], r["window"], r["patterns"])] = r
+    ok = True
+    for r in results:
+        base = baseline.get((r["entities"], r["window"], r["patterns"]))
+        if base is None:
+            continue
+        ratio = r["events_per_s"] / base["events_per_s"]
+        regressed = ratio < 1 - tolerance
+        ok = ok and not regressed
+        print(json.dumps({
+            "compare": [r["entities"], r["window"], r["patterns"]],
+            "baseline_commit": base.get("commit"),
+            "events_per_s_ratio": round(ratio, 3),
+            "p99_ratio": round(r["p99_ms"] / base["p99_ms"], 3) if base["p99_ms"] else None,
+            "regressed": regressed,
+        }), file=sys.stderr)
+    return ok
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",") if v]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int_list, default=[100, 1000, 10000],
+                        help="comma-separated tracked entity counts (e.g. 100,1000,10000,50000)")
+    parser.add_argument("--windows", type=int_list, default=[60], help="comma-separated window sizes")
+    parser.add_argument("--patterns", type=int_list, default=[1, 50], help="comma-separated filter pattern counts")
+    parser.add_argument("--updates", type=int, default=5, help="timed updates per entity")
+    parser.add_argument("--noise-share", type=float, default=0.2, help="share of non-target state changes")
+    parser.add_argument("--knx-share", type=float, default=0.05, help="share of knx_event frames")
+    parser.add_argument("--workers", type=int, default=2, help="ingestion workers")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="offered load in frames/s (default 0: saturate, latency then includes queueing)")
+    parser.add_argument("--no-streaming", dest="streaming", action="store_false",
+                        help="use the recomputing ZScoreEngine instead of the streaming one")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    parser.add_argument("--output", help="append the JSON lines to this file")
+    parser.add_argument("--compare", help="baseline JSON lines file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="allowed events/s drop against the baseline (default 10%%)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    meta = {"commit": git_commit(), "python": sys.version.split()[0], "json_backend": json_codec.BACKEND,
+            "streaming": args.streaming}
+
+    results = []
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for entities in args.entities:
+            for window in args.windows:
+                for pattern_count in args.patterns:
+                    result = {**run_case(entities, window, pattern_count, args), **meta}
+                    results.append(result)
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.compare and not compare(args.compare, results, args.tolerance):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Offline replay of a websocket capture (capture_enabled) through the pipeline:
+raw pre-filter -> decode -> HomeAssistantClient routing/filter -> handle_event -> MQTTEgress,
+with the broker replaced by a recorder.
+
+Replay is deterministic: the watchdog and the deadband run on a replay clock that follows the
+capture's receive timestamps (watchdog deadlines fire at their virtual time, between frames),
+and events are handled synchronously in capture order. The same capture and options therefore
+always produce the same published messages, whatever the speed, so the output of two commits
+can be diffed to regression-test kernel changes against real site data.
+
+Not replayed: conflation, micro-batching, the sharded kernel, MQTT batching, rollups and the
+lux diagnostic (time-driven), and the outbox.
+
+Usage:
+    python -m benchmarks.replay /data/capture/frames.gz [--options options.json]
+        [--speed 0|1|N] [--output published.jsonl]
+--speed 0 (default) replays as fast as possible, 1 in real time, N at N times real time.
+"""
+import argparse
+import json
+import logging
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import run
+from benchmarks.bench_pipeline import reset_kernel
+from src.common import json_codec
+from src.egress.deadband import DeadbandFilter
+from src.egress.mqtt import MQTTEgress
+from src.ingestion.capture import read_capture_set
+from src.ingestion.filter import FilterManager
+from src.ingestion.websocket_client import HomeAssistantClient
+from src.kernel.watchdog import WatchdogKernel
+
+class ReplayClock:
+    """Clock injected into the watchdog and deadband; set to each frame's receive time."""
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+class RecordingSink:
+    """Stands in for the paho client: keeps (virtual time, topic, payload) of every publish."""
+    def __init__(self, clock: ReplayClock, on_publish: Optional[Callable[[float, str, Any], None]] = None):
+        self.clock = clock
+        self.on_publish = on_publish
+        self.count = 0
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.count += 1
+        if self.on_publish is not None:
+            self.on_publish(self.clock(), topic, payload)
+
+    def is_connected(self):
+        return True
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+def replay(records: Iterable[Tuple[float, str]], options: Dict[str, Any], speed: float = 0.0,
+           on_publish: Optional[Callable[[float, str, Any], None]] = None,
+           sleep: Callable[[float], None] = time.sleep) -> Dict[str, Any]:
+    """
+    Feed captured (received_at, frame) records through the pipeline.
+    :param speed: 0 for as fast as possible, 1 for real time, N for N times real time
+    :param on_publish: called with (virtual time, topic, payload) for every MQTT publish
+    :return: replay statistics
+    """
+    records = iter(records)
+    first = next(records, None)
+    stats = {"frames": 0, "events": 0, "published": 0, "timeouts": 0, "span_s": 0.0, "wall_s": 0.0}
+    if first is None:
+        return stats
+
+    clock = ReplayClock(first[0])
+    reset_kernel(run.window_store.window_size, options.get("zscore_streaming", True))
+    # Same engine selection and bounds as the agent, with idle eviction on the capture's clock
+    run.z_engines = run.make_engine_registry(None, options.get("kernel_max_entities", 20000),
+                                             options.get("kernel_idle_ttl_s", 86400),
+                                             options.get("kernel_engine_rules", []),
+                                             options.get("kernel_ewma_half_life_s", 3600))
+    run.z_engines.clock = clock
+    if options.get("deadband_rules"):
+        run.deadband = DeadbandFilter(options["deadband_rules"], keepalive=options.get("deadband_keepalive_s", 300),
+                                      clock=clock, max_entities=options.get("kernel_max_entities", 20000))
+
+    sink = RecordingSink(clock, on_publish)
+    egress = MQTTEgress({**options, "mqtt_outbox_enabled": False, "mqtt_batch_enabled": False})
+    egress.client = sink
+
+    watchdog_map, watchdog_addresses, watchdog_timeouts = run.parse_watchdog_entities(
+        options.get("watchdog_entities", []))
+    watchdog = WatchdogKernel(watchdog_addresses, timeout=options.get("watchdog_timeout", 70),
+                              timeouts=watchdog_timeouts, clock=clock)
+
+    def on_timeout(entity_id: str):
+        stats["timeouts"] += 1
+        egress.publish("telemetry", watchdog_map.get(entity_id, entity_id), {
+            "value": 0.0,
+            "timestamp": clock(),
+            "status": "timeout",
+            "msg": "Watchdog triggered: No heartbeat received"
+        })
+
+    client = HomeAssistantClient("ws://replay/core/websocket", "", None,
+                                 filter_manager=FilterManager(options.get("target_entities", [])))
+
+    start_wall = time.perf_counter()
+    start_virtual = first[0]
+    for received_at, raw in _chain(first, records):
+        if speed > 0:
+            delay = (received_at - start_virtual) / speed - (time.perf_counter() - start_wall)
+            if delay > 0:
+                sleep(delay)
+
+        # Watchdog deadlines that fall before this frame fire at their own virtual time
+        deadline = watchdog.next_deadline()
+        while deadline is not None and deadline <= received_at:
+            clock.now = deadline
+            watchdog.check_timeouts(on_timeout)
+            deadline = watchdog.next_deadline()
+        clock.now = received_at
+        stats["frames"] += 1
+
+        if client._reject_raw(raw):
+            continue
+        data = json_codec.loads(raw)
+        if data.get("type") != "event":
+            continue
+        if "variables" in data.get("event", {}):
+            # Captured in targeted mode: state trigger subscription
+            client._trigger_sub_ids.add(data.get("id"))
+        data = client._route_event(data)
+        if data is None:
+            continue
+        stats["events"] += 1
+        run.handle_event(data, egress, watchdog, watchdog_map)
+
+    stats["published"] = sink.count
+    stats["span_s"] = round(clock.now - start_virtual, 3)
+    stats["wall_s"] = round(time.perf_counter() - start_wall, 3)
+    stats["frames_per_s"] = round(stats["frames"] / stats["wall_s"]) if stats["wall_s"] else None
+    return stats
+
+def _chain(first, rest):
+    yield first
+    yield from rest
+
+def load_options(path: Optional[str]) -> Dict[str, Any]:
+    """Add-on options (a copy of /data/options.json), or the development defaults."""
+    if path:
+        with open(path) as f:
+            return json.load(f)
+    return {"client_id": "replay", "site_id": "replay", "target_entities": ["sensor.*", "input_boolean.*"]}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("capture", help="capture file (its rotated siblings are replayed first)")
+    parser.add_argument("--options", help="add-on options JSON (e.g. a copy of /data/options.json)")
+    parser.add_argument("--speed", type=float, default=0.0, help="0: max speed, 1: real time, N: N times real time")
+    parser.add_argument("--output", help="write published messages here as JSON lines (default: stdout)")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.WARNING)
+    out = open(args.output, "w") if args.output else sys.stdout
+
+    def on_publish(t, topic, payload):
+        if isinstance(payload, (bytes, bytearray)):
+            payload = payload.decode("utf-8")
+        out.write(json.dumps({"t": round(t, 6), "topic": topic, "payload": json.loads(payload)}) + "\n")
+
+    try:
+        stats = replay(read_capture_set(args.capture), load_options(args.options), args.speed, on_publish)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    print(json.dumps({"replay": args.capture, "speed": args.speed, **stats}), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
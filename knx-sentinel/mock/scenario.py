@@ -0,0 +1,158 @@
+"""
+Load-generation scenarios for the mock Supervisor.
+
+A scenario describes the synthetic house: how many entities, their numeric/binary/text mix,
+the event rate (constant, a cycled burst/ramp profile, or firehose at line rate), the share
+of knx_event telegrams and the heartbeat group addresses with their dropouts.
+"""
+import json
+import random
+from typing import Any, Dict, List, Optional, Tuple
+
+class Heartbeat:
+    """
+    A heartbeat group address sending every `interval` seconds.
+    With `dropout_every`, it goes silent for `dropout_for` seconds at the end of each such period,
+    e.g. interval=10, dropout_every=300, dropout_for=120 -> 180s of beats, 120s of silence.
+    """
+    def __init__(self, address: str, interval: float = 10.0, dropout_every: float = 0.0, dropout_for: float = 0.0):
+        self.address = address
+        self.interval = interval
+        self.dropout_every = dropout_every
+        self.dropout_for = dropout_for
+
+    @classmethod
+    def parse(cls, spec: str) -> "Heartbeat":
+        """Parse "Address[:Interval[:DropoutEvery:DropoutFor]]", e.g. "6/1/1:10:300:120"."""
+        parts = spec.split(":")
+        try:
+            numbers = [float(p) for p in parts[1:]]
+        except ValueError:
+            raise ValueError(f"Invalid heartbeat '{spec}'")
+        if len(numbers) not in (0, 1, 3):
+            raise ValueError(f"Invalid heartbeat '{spec}': expected Address[:Interval[:DropoutEvery:DropoutFor]]")
+        return cls(parts[0], *numbers)
+
+    def is_up(self, elapsed: float) -> bool:
+        """Whether the heartbeat is sending at `elapsed` seconds into the scenario."""
+        if self.dropout_every <= 0 or self.dropout_for <= 0:
+            return True
+        return elapsed % self.dropout_every < self.dropout_every - self.dropout_for
+
+class Scenario:
+    """
+    Scenario parameters. `entities=0` keeps the legacy behaviour (a few fixed entities,
+    one event every 0.5-2 s).
+
+    Rate: `rate` events/s, or a `profile` of [seconds, rate] steps that is cycled
+    (e.g. [[10, 100], [2, 5000]] for bursts, [[10, 100], [10, 200], [10, 400]] for a ramp).
+    `firehose` sends as fast as the connection takes it, so the achieved rate is the agent's capacity.
+    """
+    def __init__(self, entities: int = 0, rate: float = 10.0, profile: Optional[List[Tuple[float, float]]] = None,
+                 firehose: bool = False, numeric_share: float = 0.8, binary_share: float = 0.1,
+                 knx_share: float = 0.0, group_addresses: int = 64, heartbeats: Optional[List[Heartbeat]] = None,
+                 attribute_bytes: int = 0, spike_share: float = 0.01, duration: float = 0.0,
+                 seed: Optional[int] = None):
+        if numeric_share + binary_share > 1.0:
+            raise ValueError("numeric_share + binary_share must not exceed 1")
+        self.entities = entities
+        self.rate = rate
+        self.profile = [(float(s), float(r)) for s, r in profile] if profile else []
+        self.firehose = firehose
+        self.numeric_share = numeric_share
+        self.binary_share = binary_share
+        self.knx_share = knx_share
+        self.group_addresses = max(1, group_addresses)
+        self.heartbeats = heartbeats or []
+        self.attribute_bytes = attribute_bytes
+        self.spike_share = spike_share
+        self.duration = duration
+        self.seed = seed
+
+    @classmethod
+    def from_dict(cls, options: Dict[str, Any]) -> "Scenario":
+        options = dict(options)
+        heartbeats = []
+        for hb in options.pop("heartbeats", []):
+            heartbeats.append(Heartbeat.parse(hb) if isinstance(hb, str) else Heartbeat(**hb))
+        return cls(heartbeats=heartbeats, **options)
+
+    @classmethod
+    def load(cls, path: str) -> "Scenario":
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+    @property
+    def legacy(self) -> bool:
+        return self.entities <= 0 and not self.heartbeats
+
+    def rate_at(self, elapsed: float) -> float:
+        """Target event rate at `elapsed` seconds into the scenario (0 means unlimited)."""
+        if self.firehose:
+            return 0.0
+        if not self.profile:
+            return self.rate
+        cycle = sum(s for s, _ in self.profile)
+        t = elapsed % cycle if cycle > 0 else 0.0
+        for seconds, rate in self.profile:
+            if t < seconds:
+                return rate
+            t -= seconds
+        return self.profile[-1][1]
+
+def group_address(i: int) -> str:
+    """i-th 3-level group address, starting at 1/0/0."""
+    return f"{1 + i // 2048 % 31}/{i // 256 % 8}/{i % 256}"
+
+class ScenarioGenerator:
+    """Produces the entities and the stream of events of a scenario."""
+    TEXT_STATES = ("heat", "cool", "idle", "off", "unavailable")
+
+    def __init__(self, scenario: Scenario, rng: Optional[random.Random] = None):
+        self.scenario = scenario
+        self.rng = rng or random.Random(scenario.seed)
+        n = scenario.entities
+        numeric = int(n * scenario.numeric_share)
+        binary = int(n * scenario.binary_share)
+        self.numeric = [f"sensor.load_{i}" for i in range(numeric)]
+        self.binary = [f"binary_sensor.load_{i}" for i in range(binary)]
+        self.text = [f"sensor.load_mode_{i}" for i in range(n - numeric - binary)]
+        self.entity_ids = self.numeric + self.binary + self.text
+        self.baselines = {eid: self.rng.uniform(10, 1000) for eid in self.numeric}
+        self.addresses = [group_address(i) for i in range(scenario.group_addresses)]
+        self.attributes = {"friendly_name": "Load generator entity"}
+        if scenario.attribute_bytes > 0:
+            self.attributes["padding"] = "x" * scenario.attribute_bytes
+
+    def initial_states(self) -> Dict[str, str]:
+        states = {eid: f"{base:.2f}" for eid, base in self.baselines.items()}
+        states.update((eid, "off") for eid in self.binary)
+        states.update((eid, "idle") for eid in self.text)
+        return states
+
+    def state_for(self, entity_id: str) -> str:
+        if entity_id in self.baselines:
+            base = self.baselines[entity_id]
+            if self.rng.random() < self.scenario.spike_share:
+                return f"{base * self.rng.uniform(1.5, 3.0):.2f}"
+            return f"{self.rng.gauss(base, base * 0.01):.2f}"
+        if entity_id.startswith("binary_sensor."):
+            return self.rng.choice(("on", "off"))
+        return self.rng.choice(self.TEXT_STATES)
+
+    def knx_data(self, destination: str) -> dict:
+        return {
+            "destination": destination,
+            "source": f"1.1.{self.rng.randrange(1, 255)}",
+            "direction": "Incoming",
+            "telegramtype": "GroupValueWrite",
+            "data": [self.rng.randrange(256)],
+        }
+
+    def next_event(self) -> Tuple[str, str, Any]:
+        """("state_changed", entity_id, state) or ("knx_event", destination, data)."""
+        if self.addresses and (not self.entity_ids or self.rng.random() < self.scenario.knx_share):
+            destination = self.rng.choice(self.addresses)
+            return "knx_event", destination, self.knx_data(destination)
+        entity_id = self.rng.choice(self.entity_ids)
+        return "state_changed", entity_id, self.state_for(entity_id)
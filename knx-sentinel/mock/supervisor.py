@@ -1,19 +1,166 @@
+import argparse
 import asyncio
 import aiohttp
 from aiohttp import web
 import json
 import logging
+import os
 import random
 import datetime
+import sys
+import time
+from collections import deque
+from typing import Deque, Dict, Optional, Tuple
+
+if __name__ == "__main__" and not __package__:
+    # Run as a script (python mock/supervisor.py): make the mock package importable
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mock.scenario import Heartbeat, Scenario, ScenarioGenerator
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger("MockSupervisor")
 
+# Mock entity registry: entity_id -> state
+MOCK_STATES = {
+    "sensor.voltage_L1": "230",
+    "sensor.voltage_L2": "231",
+    "sensor.knx_outdoor_lux": "12000",
+    "light.kitchen": "on",
+}
+
+# Recorder: entity_id -> (epoch seconds, state), oldest first
+MOCK_HISTORY: Dict[str, Deque[Tuple[float, str]]] = {}
+HISTORY_MAXLEN = 10000
+# Simulated recorder query time (seconds) of each history request
+HISTORY_DELAY = 0.0
+
+# Connected clients and their subscriptions: ws -> {subscription_id: spec}
+CONNECTIONS = {}
+
+# Active load-generation scenario (None: legacy generator)
+SCENARIO: Optional[Scenario] = None
+GENERATOR: Optional[ScenarioGenerator] = None
+ATTRIBUTES = {}
+
+def load_scenario(scenario: Optional[Scenario]):
+    """Activate a scenario (None: back to the legacy generator) and register its entities."""
+    global SCENARIO, GENERATOR, ATTRIBUTES
+    SCENARIO = scenario
+    GENERATOR = ScenarioGenerator(scenario) if scenario is not None else None
+    if GENERATOR is not None:
+        MOCK_STATES.update(GENERATOR.initial_states())
+    ATTRIBUTES = GENERATOR.attributes if GENERATOR is not None else {}
+
+def record_history(entity_id: str, state: str, timestamp: Optional[float] = None):
+    history = MOCK_HISTORY.get(entity_id)
+    if history is None:
+        history = MOCK_HISTORY[entity_id] = deque(maxlen=HISTORY_MAXLEN)
+    history.append((time.time() if timestamp is None else timestamp, state))
+
+def backfill_history(samples: int, interval: float = 60.0, rng: Optional[random.Random] = None):
+    """Give every numeric entity `samples` past states, `interval` seconds apart, ending now."""
+    rng = rng or random.Random(0)
+    now = time.time()
+    for entity_id, state in list(MOCK_STATES.items()):
+        try:
+            base = float(state)
+        except ValueError:
+            continue
+        past = [(now - (samples - i) * interval, f"{rng.gauss(base, abs(base) * 0.01):.2f}") for i in range(samples)]
+        MOCK_HISTORY[entity_id] = deque(past + list(MOCK_HISTORY.get(entity_id, ())), maxlen=HISTORY_MAXLEN)
+
+def history_during_period(data: dict) -> dict:
+    """`history/history_during_period` with minimal_response/no_attributes (compressed states)."""
+    def epoch(value, default):
+        if not value:
+            return default
+        return datetime.datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+    start = epoch(data.get("start_time"), 0.0)
+    end = epoch(data.get("end_time"), time.time())
+    result = {}
+    for entity_id in data.get("entity_ids", []):
+        items = [{"s": state, "lu": ts} for ts, state in MOCK_HISTORY.get(entity_id, ()) if start <= ts < end]
+        if items:
+            result[entity_id] = items
+    return result
+
+async def answer_history(ws, data: dict):
+    """Answered concurrently with other commands, like the recorder does."""
+    if HISTORY_DELAY > 0:
+        await asyncio.sleep(HISTORY_DELAY)
+    await ws.send_json({"id": data.get("id"), "type": "result", "success": True,
+                        "result": history_during_period(data)})
+
+def make_state(entity_id: str, state: str) -> dict:
+    now = datetime.datetime.now().isoformat()
+    return {
+        "entity_id": entity_id,
+        "state": state,
+        "attributes": ATTRIBUTES,
+        "last_changed": now,
+        "last_updated": now,
+    }
+
+async def register_entity(entity_id: str, state: str = "0"):
+    """Add an entity to the mock registry and notify entity_registry_updated subscribers."""
+    MOCK_STATES[entity_id] = state
+    for ws, subs in list(CONNECTIONS.items()):
+        for sub_id, spec in list(subs.items()):
+            if spec.get("event_type") == "entity_registry_updated":
+                await ws.send_json({
+                    "id": sub_id,
+                    "type": "event",
+                    "event": {
+                        "event_type": "entity_registry_updated",
+                        "data": {"action": "create", "entity_id": entity_id},
+                        "origin": "LOCAL",
+                        "time_fired": datetime.datetime.now().isoformat(),
+                    }
+                })
+
+async def handle_command(ws, subs: dict, data: dict):
+    """Answer a client command like Home Assistant would."""
+    cmd_type = data.get("type")
+    result = None
+    if cmd_type == "subscribe_events":
+        subs[data.get("id")] = {"event_type": data.get("event_type")}
+    elif cmd_type == "subscribe_trigger":
+        trigger = data.get("trigger", {})
+        entity_ids = trigger.get("entity_id", [])
+        if isinstance(entity_ids, str):
+            entity_ids = [entity_ids]
+        subs[data.get("id")] = {"trigger": set(entity_ids)}
+    elif cmd_type == "unsubscribe_events":
+        subs.pop(data.get("subscription"), None)
+    elif cmd_type == "get_states":
+        result = [make_state(eid, state) for eid, state in MOCK_STATES.items()]
+    elif cmd_type == "history/history_during_period":
+        asyncio.create_task(answer_history(ws, data))
+        return
+    else:
+        await ws.send_json({
+            "id": data.get("id"),
+            "type": "result",
+            "success": False,
+            "error": {"code": "unknown_command", "message": "Unknown command."}
+        })
+        return
+
+    await ws.send_json({
+        "id": data.get("id"),
+        "type": "result",
+        "success": True,
+        "result": result
+    })
+
 async def websocket_handler(request):
     ws = web.WebSocketResponse()
     await ws.prepare(request)
     logger.info("Client connected")
+    subs = {}
 
     # 1. Auth Flow
     # Send auth_required
@@ -27,7 +174,8 @@ async def websocket_handler(request):
                 logger.info(f"Received auth token: {data.get('access_token')}")
                 await ws.send_json({"type": "auth_ok", "ha_version": "2023.12.0"})
                 # Start event loop after auth
-                asyncio.create_task(event_generator(ws))
+                CONNECTIONS[ws] = subs
+                asyncio.create_task(event_generator(ws, subs))
                 break 
         elif msg.type == aiohttp.WSMsgType.ERROR:
             logger.error(f"ws connection closed with exception {ws.exception()}")
@@ -37,38 +185,30 @@ async def websocket_handler(request):
         if msg.type == aiohttp.WSMsgType.TEXT:
             data = json.loads(msg.data)
             logger.info(f"Received command: {data}")
-            if data.get("type") == "subscribe_events":
-                await ws.send_json({
-                    "id": data.get("id"),
-                    "type": "result",
-                    "success": True,
-                    "result": None
-                })
+            await handle_command(ws, subs, data)
         elif msg.type == aiohttp.WSMsgType.ERROR:
             logger.error("ws connection closed with exception %s", ws.exception())
 
+    CONNECTIONS.pop(ws, None)
     logger.info("Client disconnected")
     return ws
 
-async def event_generator(ws):
-    """Generates synthetic events."""
-    try:
-        while not ws.closed:
-            # Randomly decide to send an event
-            await asyncio.sleep(random.uniform(0.5, 2.0))
-            
-            # Simulate state_changed
+async def send_state_change(ws, subs: dict, entity_id: str, state: str):
+    """Push a state change to one connection in the shape of each matching subscription."""
+    MOCK_STATES[entity_id] = state
+    record_history(entity_id, state)
+    new_state = make_state(entity_id, state)
+
+    for sub_id, spec in list(subs.items()):
+        if spec.get("event_type") == "state_changed":
             event_data = {
+                "id": sub_id,
                 "type": "event",
                 "event": {
                     "event_type": "state_changed",
                     "data": {
-                        "entity_id": "sensor.voltage_L1",
-                        "new_state": {
-                            "state": str(random.randint(220, 240)),
-                            "attributes": {},
-                            "last_changed": datetime.datetime.now().isoformat()
-                        },
+                        "entity_id": entity_id,
+                        "new_state": new_state,
                         "old_state": None
                     },
                     "origin": "LOCAL",
@@ -76,27 +216,202 @@ async def event_generator(ws):
                     "context": {"id": "mock_context_id"}
                 }
             }
-            logger.info("Sending mock event...")
-            await ws.send_json(event_data)
+        elif entity_id in spec.get("trigger", ()):
+            event_data = {
+                "id": sub_id,
+                "type": "event",
+                "event": {
+                    "variables": {
+                        "trigger": {
+                            "id": "0",
+                            "idx": "0",
+                            "platform": "state",
+                            "entity_id": entity_id,
+                            "from_state": None,
+                            "to_state": new_state,
+                            "for": None,
+                            "attribute": None,
+                            "description": f"state of {entity_id}"
+                        }
+                    },
+                    "context": {"id": "mock_context_id"}
+                }
+            }
+        else:
+            continue
+        logger.debug("Sending mock event...")
+        await ws.send_json(event_data)
+
+async def send_knx_event(ws, subs: dict, destination: str, data: dict):
+    """Push a knx_event telegram to one connection's knx_event subscriptions."""
+    for sub_id, spec in list(subs.items()):
+        if spec.get("event_type") == "knx_event":
+            await ws.send_json({
+                "id": sub_id,
+                "type": "event",
+                "event": {
+                    "event_type": "knx_event",
+                    "data": data,
+                    "origin": "LOCAL",
+                    "time_fired": datetime.datetime.now().isoformat(),
+                    "context": {"id": "mock_context_id"}
+                }
+            })
+
+async def emit_state(entity_id: str, state: str):
+    """Push a state change to every connected client (test hook)."""
+    for ws, subs in list(CONNECTIONS.items()):
+        await send_state_change(ws, subs, entity_id, state)
+
+async def heartbeat_generator(ws, subs: dict, generator: ScenarioGenerator, heartbeat: Heartbeat, start: float):
+    """Sends a heartbeat group address on its interval, staying silent during dropouts."""
+    loop = asyncio.get_running_loop()
+    was_up = True
+    while not ws.closed:
+        up = heartbeat.is_up(loop.time() - start)
+        if up != was_up:
+            logger.info(f"Heartbeat {heartbeat.address} {'resumed' if up else 'dropped out'}")
+            was_up = up
+        if up:
+            await send_knx_event(ws, subs, heartbeat.address, generator.knx_data(heartbeat.address))
+        await asyncio.sleep(heartbeat.interval)
+
+async def scenario_generator(ws, subs: dict, scenario: Scenario, generator: Optional[ScenarioGenerator] = None,
+                             report_interval: float = 5.0):
+    """
+    Sends the scenario's event stream, paced by its rate (or unpaced in firehose mode).
+    Sends wait when the client stops reading, so the achieved rate drops to what the agent
+    can take: it is logged with the target rate to show when the agent falls behind.
+    """
+    loop = asyncio.get_running_loop()
+    generator = generator or ScenarioGenerator(scenario)
+    start = loop.time()
+    tasks = [asyncio.create_task(heartbeat_generator(ws, subs, generator, hb, start)) for hb in scenario.heartbeats]
+    sent = 0
+    next_send = start
+    report_at, reported = start + report_interval, 0
+    try:
+        if not generator.entity_ids and scenario.knx_share <= 0:
+            # Heartbeats only
+            await asyncio.gather(*tasks)
+            return
+        while not ws.closed:
+            now = loop.time()
+            elapsed = now - start
+            if scenario.duration and elapsed >= scenario.duration:
+                break
+            rate = scenario.rate_at(elapsed)
+            if rate > 0:
+                next_send = max(next_send, now - 1.0) + 1.0 / rate
+                await asyncio.sleep(max(0.0, next_send - now))
+            elif sent % 100 == 0:
+                await asyncio.sleep(0)
+
+            kind, key, value = generator.next_event()
+            if kind == "knx_event":
+                await send_knx_event(ws, subs, key, value)
+            else:
+                await send_state_change(ws, subs, key, value)
+            sent += 1
+
+            if now >= report_at:
+                achieved = (sent - reported) / (now - report_at + report_interval)
+                target = "line rate" if rate <= 0 else f"{rate:.0f}/s"
+                behind = " (falling behind)" if rate > 0 and achieved < 0.95 * rate else ""
+                logger.info(f"Load: sent={sent} achieved={achieved:.0f}/s target={target}{behind}")
+                report_at, reported = now + report_interval, sent
+        logger.info(f"Scenario finished: sent={sent} in {loop.time() - start:.1f}s")
+    except Exception as e:
+        logger.error(f"Scenario generator error: {e}")
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def event_generator(ws, subs: dict):
+    """Generates synthetic events for the connection's subscriptions."""
+    if SCENARIO is not None and not SCENARIO.legacy:
+        await scenario_generator(ws, subs, SCENARIO, GENERATOR)
+        return
+    try:
+        while not ws.closed:
+            # Randomly decide to send an event
+            await asyncio.sleep(random.uniform(0.5, 2.0))
+            
+            # Simulate a state change on a random registered entity
+            entity_id = random.choice(list(MOCK_STATES))
+            if entity_id.startswith("light."):
+                state = random.choice(["on", "off"])
+            else:
+                state = str(random.randint(220, 240))
+            await send_state_change(ws, subs, entity_id, state)
             
     except Exception as e:
         logger.error(f"Event generator error: {e}")
 
-async def start_server():
+async def start_server(port: int = 8123):
     app = web.Application()
     app.add_routes([web.get('/core/websocket', websocket_handler)])
     runner = web.AppRunner(app)
     await runner.setup()
-    site = web.TCPSite(runner, 'localhost', 8123)
-    logger.info("Starting Mock Supervisor on ws://localhost:8123/core/websocket")
+    site = web.TCPSite(runner, 'localhost', port)
+    logger.info(f"Starting Mock Supervisor on ws://localhost:{port}/core/websocket")
     await site.start()
     
     # Keep running
     while True:
         await asyncio.sleep(3600)
 
+def parse_profile(value: str):
+    """"10x100,2x5000" -> [(10, 100), (2, 5000)] (seconds x rate)."""
+    steps = []
+    for step in value.split(","):
+        seconds, _, rate = step.partition("x")
+        steps.append((float(seconds), float(rate)))
+    return steps
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Mock Home Assistant Supervisor with load generation.")
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--scenario", help="JSON file with scenario options (overridden by flags)")
+    parser.add_argument("--entities", type=int, help="number of generated entities (0: legacy generator)")
+    parser.add_argument("--rate", type=float, help="events per second")
+    parser.add_argument("--profile", type=parse_profile, help='cycled rate steps, e.g. "10x100,2x5000" (seconds x rate)')
+    parser.add_argument("--firehose", action="store_true", default=None, help="send at line rate")
+    parser.add_argument("--numeric-share", type=float)
+    parser.add_argument("--binary-share", type=float)
+    parser.add_argument("--knx-share", type=float, help="share of knx_event telegrams")
+    parser.add_argument("--group-addresses", type=int, help="number of group addresses for knx_event")
+    parser.add_argument("--heartbeat", dest="heartbeats", action="append", type=Heartbeat.parse,
+                        help="heartbeat GA as Address[:Interval[:DropoutEvery:DropoutFor]] (repeatable)")
+    parser.add_argument("--attribute-bytes", type=int, help="padding added to each state's attributes")
+    parser.add_argument("--duration", type=float, help="stop generating after this many seconds")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--history", type=int, default=0,
+                        help="backfill this many past states per numeric entity for history seeding")
+    parser.add_argument("--history-interval", type=float, default=60.0, help="seconds between backfilled states")
+    return parser.parse_args(argv)
+
+def scenario_from_args(args: argparse.Namespace) -> Scenario:
+    options = {}
+    if args.scenario:
+        with open(args.scenario) as f:
+            options = json.load(f)
+    for key in ("entities", "rate", "profile", "firehose", "numeric_share", "binary_share", "knx_share",
+                "group_addresses", "attribute_bytes", "duration", "seed"):
+        value = getattr(args, key)
+        if value is not None:
+            options[key] = value
+    scenario = Scenario.from_dict(options)
+    if args.heartbeats:
+        scenario.heartbeats.extend(args.heartbeats)
+    return scenario
+
 if __name__ == "__main__":
+    args = parse_args()
+    load_scenario(scenario_from_args(args))
+    if args.history > 0:
+        backfill_history(args.history, args.history_interval)
     try:
-        asyncio.run(start_server())
+        asyncio.run(start_server(args.port))
     except KeyboardInterrupt:
         pass
@@ -5,12 +5,25 @@ import os
 import signal
 import sys
 import time
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 
 from src.ingestion.websocket_client import HomeAssistantClient
 from src.ingestion.filter import FilterManager
+from src.ingestion.dispatcher import EventDispatcher
+from src.ingestion.conflation import Conflator
+from src.ingestion.capture import CaptureWriter
+from src.ingestion.history import HistorySeeder
+from src.common.metrics import Histogram, MetricsRegistry, start_metrics_server, watch_loop_lag
 from src.egress.mqtt import MQTTEgress
-from src.kernel.math_engine import ZScoreEngine, SolarDiagnostic, LinearDiagnostic
+from src.egress.deadband import DeadbandFilter
+from src.kernel.math_engine import ZScoreEngine, StreamingZScoreEngine, SolarDiagnostic, LinearDiagnostic, engine_types
+from src.kernel.buffer import WindowStore
+from src.kernel.registry import EngineRegistry, EngineRules
+from src.kernel.batch import BatchZScoreScorer, MicroBatcher
+from src.kernel.sharding import ShardedKernel
+from src.kernel.snapshot import KernelSnapshot
+from src.kernel.rollup import RollupEngine
+from src.kernel.solar import LuxDiagnostic, SolarElevationCache
 from src.kernel.watchdog import WatchdogKernel
 
 # Configure Logging
@@ -21,8 +34,37 @@ logging.basicConfig(
 logger = logging.getLogger("KNXSentinel")
 
 # Global State
-z_engines: Dict[str, ZScoreEngine] = {}
+window_store = WindowStore(window_size=60)
+zscore_engine_cls = StreamingZScoreEngine
+
+def make_engine_registry(engine_cls=None, max_entities: int = 0, idle_ttl: float = 0.0,
+                         rules: Optional[List[str]] = None, ewma_half_life: float = 3600.0) -> EngineRegistry:
+    """
+    Anomaly engines over rows of the global window store, created on an entity's first sample.
+    `rules` ("pattern=engine") pick another engine type for matching entities; EWMA engines
+    keep no window and take `ewma_half_life` (seconds).
+    """
+    engine_cls = engine_cls or zscore_engine_cls
+    selector = EngineRules(rules, engine_types(engine_cls), engine_cls)
+
+    def factory(entity_id: str):
+        cls = selector.engine_for(entity_id)
+        if not cls.WINDOWED:
+            return cls(half_life=ewma_half_life)
+        return cls(buffer=window_store.view(entity_id))
+
+    return EngineRegistry(factory, max_entities=max_entities, idle_ttl=idle_ttl, store=window_store)
+
+z_engines = make_engine_registry()
 hvac_engines: Dict[str, LinearDiagnostic] = {}
+batcher: Optional[MicroBatcher] = None
+sharded_kernel: Optional[ShardedKernel] = None
+deadband: Optional[DeadbandFilter] = None
+kernel_time: Optional[Histogram] = None
+lux_diagnostic: Optional[LuxDiagnostic] = None
+rollups: Optional[RollupEngine] = None
+# Publish every sample on its telemetry topic (anomalies are always published)
+raw_telemetry = True
 
 def load_options() -> Dict[str, Any]:
     """Load options from /data/options.json or env vars."""
@@ -41,7 +83,20 @@ def load_options() -> Dict[str, Any]:
         "mqtt_port": int(os.environ.get("MQTT_PORT", 1883)),
         "target_entities": ["sensor.*", "input_boolean.*"],
         "watchdog_entities": [],
-        "watchdog_timeout": 70
+        "watchdog_timeout": 70,
+        "zscore_streaming": True,
+        "batch_tick_ms": 0,
+        "kernel_shards": 0,
+        "ingestion_mode": "all",
+        "ingest_workers": 2,
+        "ingest_queue_size": 10000,
+        "ingest_overflow": "block",
+        "conflation_window_ms": 0,
+        "mqtt_batch_enabled": False,
+        "deadband_rules": [],
+        "deadband_keepalive_s": 300,
+        "capture_enabled": False,
+        "snapshot_interval_s": 0
     }
 
 def get_supervisor_token() -> str:
@@ -63,6 +118,102 @@ def get_supervisor_token() -> str:
     logger.info(f"SUPERVISOR_TOKEN found. Length: {len(token)} chars. First 4: {token[:4]}...")
     return token
 
+def parse_watchdog_entities(raw_watchdogs: List[Any]) -> Tuple[Dict[str, str], List[str], Dict[str, float]]:
+    """Parse "Address[@Seconds][=Alias]" entries into (alias map, addresses, per-address timeouts)."""
+    watchdog_map = {} # Address -> Alias
+    watchdog_addresses = []
+    watchdog_timeouts = {} # Address -> per-address timeout ("Address@Seconds")
+
+    for w in raw_watchdogs:
+        w_str = str(w).strip("'\"")
+        if "=" in w_str:
+            parts = w_str.split("=", 1)
+            addr = parts[0].strip()
+            alias = parts[1].strip()
+        else:
+            # Default alias is the address itself
+            addr = w_str.strip()
+            alias = None
+        if "@" in addr:
+            addr, _, seconds = addr.partition("@")
+            addr = addr.strip()
+            try:
+                watchdog_timeouts[addr] = float(seconds)
+            except ValueError:
+                logger.error(f"Invalid watchdog timeout '{seconds}' for {addr}, using default.")
+        watchdog_map[addr] = alias or addr
+        watchdog_addresses.append(addr)
+    return watchdog_map, watchdog_addresses, watchdog_timeouts
+
+def parse_state(raw_state) -> float:
+    """Convert a HA state string to a number ('on'/'off' -> 1/0). Raises ValueError if non-numeric."""
+    if raw_state == "on":
+        return 1.0
+    elif raw_state == "off":
+        return 0.0
+    return float(raw_state)
+
+def would_be_anomaly(entity_id: str, raw_state) -> bool:
+    """Cheap pre-check (before the kernel runs) of whether a state would be flagged as an anomaly."""
+    try:
+        value = parse_state(raw_state)
+    except (TypeError, ValueError):
+        return False
+    if sharded_kernel is not None:
+        # Engines live in the workers: use the band their last result reported
+        return sharded_kernel.is_outlier(entity_id, value)
+    engine = z_engines.peek(entity_id)
+    if engine is None:
+        return False
+    if is_batched(engine):
+        # Micro-batching fills the store directly: use the moments of the last tick (O(1))
+        return batcher.scorer.is_outlier(engine.buffer.row, value)
+    return engine.is_outlier(value)
+
+def is_batched(engine) -> bool:
+    """Micro-batching scores the plain Z-Score; entities ruled to other engines run per event."""
+    return batcher is not None and type(engine) is ZScoreEngine
+
+def seed_windows(history: Dict[str, List[Any]]) -> int:
+    """
+    Prefill kernel windows from recorder history ({entity_id: [raw state, ...]}, oldest first).
+    Windows that already hold samples (restored from a snapshot) are left alone.
+    :return: Number of windows seeded
+    """
+    seeded = 0
+    for entity_id, states in history.items():
+        engine = z_engines.peek(entity_id)
+        if engine is not None and engine.samples:
+            continue
+        values = []
+        for state in states:
+            try:
+                values.append(parse_state(state))
+            except (TypeError, ValueError):
+                pass
+        if values:
+            z_engines.get(entity_id).restore(values)
+            seeded += 1
+    return seeded
+
+def publish_telemetry(mqtt: MQTTEgress, entity_id: str, state_val: float, new_state: dict, analysis: dict,
+                      conflated: int = 0):
+    """Enrich a numeric state with its analysis and publish it (subject to the deadband)."""
+    if not raw_telemetry and not analysis.get("anomaly", False):
+        return
+    if deadband is not None and not deadband.should_publish(entity_id, state_val, analysis.get("anomaly", False)):
+        return
+    payload = {
+        "value": state_val,
+        "timestamp": new_state.get("last_updated"),
+        "attributes": new_state.get("attributes"),
+        "analysis": analysis
+    }
+    if conflated:
+        # Number of earlier updates collapsed into this one by the conflation stage
+        payload["conflated"] = conflated
+    mqtt.publish("telemetry", entity_id, payload)
+
 def handle_event(event: dict, mqtt: MQTTEgress, watchdog: WatchdogKernel, watchdog_map: Dict[str, str]):
     """Callback for incoming HA events."""
     event_type = event.get("event", {}).get("event_type")
@@ -75,33 +226,39 @@ def handle_event(event: dict, mqtt: MQTTEgress, watchdog: WatchdogKernel, watchd
             return
             
         try:
-            raw_state = new_state.get("state")
-            if raw_state == "on":
-                state_val = 1.0
-            elif raw_state == "off":
-                state_val = 0.0
-            else:
-                state_val = float(raw_state)
+            state_val = parse_state(new_state.get("state"))
+            conflated = event.get("conflated", 0)
             
             # 1. Z-Score Analysis
-            if entity_id not in z_engines:
-                z_engines[entity_id] = ZScoreEngine()
-            
-            analysis = z_engines[entity_id].process(state_val)
-            
-            # 2. Enrich Payload
-            payload = {
-                "value": state_val,
-                "timestamp": new_state.get("last_updated"),
-                "attributes": new_state.get("attributes"),
-                "analysis": analysis
-            }
-            
-            # 3. Publish
-            mqtt.publish("telemetry", entity_id, payload)
+            engine = None if sharded_kernel is not None else z_engines.get(entity_id)
+            if sharded_kernel is not None:
+                # Sharded: scored in a worker process, published when the result comes back
+                sharded_kernel.submit(entity_id, state_val, (new_state, conflated))
+            elif is_batched(engine):
+                # Micro-batching: scored and published on the next tick
+                # (the registry still tracks the entity, for eviction and pre-checks)
+                batcher.add(entity_id, state_val, (new_state, conflated))
+            else:
+                if kernel_time is not None:
+                    start = time.perf_counter()
+                    analysis = engine.process(state_val, new_state.get("last_updated"))
+                    kernel_time.observe(time.perf_counter() - start)
+                else:
+                    analysis = engine.process(state_val, new_state.get("last_updated"))
+                
+                # 2. Enrich Payload & 3. Publish
+                publish_telemetry(mqtt, entity_id, state_val, new_state, analysis, conflated)
             
             # 4. Watchdog Processing
             watchdog.process_state(entity_id, state_val)
+
+            # 5. Rollups (closed buckets published on the rollup topics)
+            if rollups is not None:
+                rollups.add(entity_id, state_val)
+
+            # 6. Lux plausibility (validated against the sun on the next solar check)
+            if lux_diagnostic is not None and lux_diagnostic.matches(entity_id):
+                lux_diagnostic.offer(entity_id, state_val)
             
         except ValueError:
             # Non-numeric state (string), just pass through or ignore
@@ -134,41 +291,85 @@ def handle_event(event: dict, mqtt: MQTTEgress, watchdog: WatchdogKernel, watchd
                  mqtt.publish("telemetry", topic_id, payload)
 
 async def main():
+    global zscore_engine_cls, z_engines, batcher, sharded_kernel, deadband, kernel_time, lux_diagnostic, rollups, raw_telemetry
     logger.info("Starting KNX Sentinel Agent...")
     
     # 1. Configuration
     options = load_options()
     token = get_supervisor_token()
+    if not options.get("zscore_streaming", True):
+        zscore_engine_cls = ZScoreEngine
     supervisor_url = "ws://supervisor/core/websocket"
     
     # 2. Components
-    filter_mgr = FilterManager(options.get("target_entities", []))
+    filter_mgr = FilterManager(options.get("target_entities", []),
+                               cache_size=options.get("filter_cache_size", FilterManager.DEFAULT_CACHE_SIZE))
     mqtt_client = MQTTEgress(options)
+
+    # Metrics: published on system/metrics and optionally served to Prometheus
+    metrics = MetricsRegistry()
+    metrics.add_process_metrics()
+    metrics.gauge("tracked_entities",
+                  lambda: sharded_kernel.tracked if sharded_kernel is not None else len(z_engines))
+    kernel_time = metrics.histogram("kernel_seconds")
+    mqtt_client.metrics_provider = metrics.snapshot
+    # Providers read loop-owned state: the heartbeat/metrics threads run them on the loop
+    mqtt_client.loop = asyncio.get_running_loop()
+    metrics.register("mqtt", mqtt_client.stats)
+
+    def expose(name, provider):
+        """Report a component's stats in the heartbeat and in the metrics."""
+        mqtt_client.heartbeat_fields[name] = provider
+        metrics.register(name, provider)
+
+    if options.get("deadband_rules"):
+        deadband = DeadbandFilter(options["deadband_rules"], keepalive=options.get("deadband_keepalive_s", 300),
+                                  max_entities=options.get("kernel_max_entities", 20000))
+        expose("deadband", deadband.stats)
+        logger.info(f"Deadband reporting enabled for {len(deadband.rules)} rule(s)")
     
+    # Aggregates per entity at several resolutions, optionally instead of raw samples
+    if options.get("rollup_resolutions"):
+        rollups = RollupEngine(options["rollup_resolutions"],
+                               lambda res, eid, payload: mqtt_client.publish("rollup", f"{res}/{eid}", payload))
+        expose("rollup", rollups.stats)
+        logger.info(f"Rollups enabled at {rollups.resolutions}")
+    raw_telemetry = options.get("telemetry_raw", True)
+    if not raw_telemetry:
+        logger.info("Raw telemetry disabled, only anomalies are published per sample.")
+
+    # Lux sensors checked against the solar elevation of the site
+    if options.get("lux_entities"):
+        if options.get("solar_latitude") is None or options.get("solar_longitude") is None:
+            logger.error("lux_entities is set but solar_latitude/solar_longitude are not, lux diagnostic disabled.")
+        else:
+            def on_lux_status(eid, status, lux, elevation):
+                mqtt_client.publish("diagnostic", eid, {
+                    "check": "solar",
+                    "status": status,
+                    "value": lux,
+                    "elevation": elevation,
+                    "timestamp": time.time(),
+                    "msg": "Dark while the sun is up" if status == LuxDiagnostic.SUSPECT else "Plausible again"
+                })
+
+            solar = SolarElevationCache(options["solar_latitude"], options["solar_longitude"],
+                                        bucket=options.get("solar_bucket_s", 60),
+                                        precompute=options.get("solar_precompute", False))
+            lux_diagnostic = LuxDiagnostic(options["lux_entities"], solar, on_lux_status)
+            expose("lux", lux_diagnostic.stats)
+            logger.info(f"Lux diagnostic enabled for {options['lux_entities']}")
+
     # Sanitize inputs and build Alias Map
     raw_watchdogs = options.get("watchdog_entities", [])
-    watchdog_map = {} # Address -> Alias
-    watchdog_addresses = []
-    
-    for w in raw_watchdogs:
-        w_str = str(w).strip("'\"")
-        if "=" in w_str:
-            parts = w_str.split("=", 1)
-            addr = parts[0].strip()
-            alias = parts[1].strip()
-            watchdog_map[addr] = alias
-            watchdog_addresses.append(addr)
-        else:
-            # Default alias is the address itself
-            w_clean = w_str.strip()
-            watchdog_map[w_clean] = w_clean
-            watchdog_addresses.append(w_clean)
+    watchdog_map, watchdog_addresses, watchdog_timeouts = parse_watchdog_entities(raw_watchdogs)
             
-    logger.info(f"Watchdog Config: Raw={raw_watchdogs} -> Map={watchdog_map}")
+    logger.info(f"Watchdog Config: Raw={raw_watchdogs} -> Map={watchdog_map} Timeouts={watchdog_timeouts}")
 
     watchdog = WatchdogKernel(
         entities=watchdog_addresses,
-        timeout=options.get("watchdog_timeout", 70)
+        timeout=options.get("watchdog_timeout", 70),
+        timeouts=watchdog_timeouts
     )
     
     # 3. Main Logic Callback
@@ -183,40 +384,208 @@ async def main():
 
             handle_event(msg, mqtt_client, watchdog, watchdog_map)
 
+    def is_priority(msg) -> bool:
+        """Watchdog addresses and would-be anomalies are never shed or conflated."""
+        data = msg.get("event", {}).get("data", {})
+        entity_id = data.get("entity_id")
+        if entity_id is None:
+            return data.get("destination") in watchdog.monitored_entities
+        if entity_id in watchdog.monitored_entities:
+            return True
+        return would_be_anomaly(entity_id, (data.get("new_state") or {}).get("state"))
+
+    # Optional per-entity conflation in front of handle_event
+    conflation_window = options.get("conflation_window_ms", 0) / 1000.0
+    conflator = None
+    ingest_callback = on_message
+    if conflation_window > 0:
+        conflator = Conflator(on_message, is_priority=is_priority)
+        ingest_callback = conflator.offer
+        expose("conflation", conflator.stats)
+        logger.info(f"Conflation enabled (window={conflation_window * 1000:.0f}ms)")
+
+    dispatcher = EventDispatcher(
+        ingest_callback,
+        workers=options.get("ingest_workers", 2),
+        maxsize=options.get("ingest_queue_size", 10000),
+        overflow=options.get("ingest_overflow", "block"),
+        is_priority=is_priority
+    )
+    expose("ingest", dispatcher.stats)
+
+    # Optional raw frame capture for offline replay
+    capture = None
+    if options.get("capture_enabled", False):
+        capture = CaptureWriter(
+            options.get("capture_path", "/data/capture/frames.gz"),
+            max_bytes=options.get("capture_max_mb", 64) * 1024 * 1024,
+            backups=options.get("capture_files", 5)
+        )
+        expose("capture", capture.stats)
+        logger.info(f"Capturing websocket frames to {capture.path}")
+
+    # Optional history seeding of the kernel windows on the first connection
+    history_seeder = None
+    history_hours = options.get("history_seed_hours", 6)
+    if history_hours > 0 and options.get("kernel_shards", 0) > 0:
+        logger.warning("History seeding is not available with kernel_shards, skipping it.")
+    elif history_hours > 0:
+        history_seeder = HistorySeeder(seed_windows, lookback=history_hours * 3600,
+                                       concurrency=options.get("history_seed_concurrency", 4))
+        expose("history", history_seeder.stats)
+
     ha_client = HomeAssistantClient(
         supervisor_url=supervisor_url, 
         token=token, 
         on_message=on_message,
-        filter_manager=filter_mgr
+        filter_manager=filter_mgr,
+        ingestion_mode=options.get("ingestion_mode", "all"),
+        dispatcher=dispatcher,
+        capture=capture,
+        history_seeder=history_seeder
     )
+    metrics.register("client", ha_client.stats)
     
     # 4. Start Services
     mqtt_client.start()
+    dispatcher.start()
+
+    # Shared by every background loop below: defined before any task is created
+    loop = asyncio.get_running_loop()
+    stop_event = asyncio.Event()
     
-    # Start Watchdog Loop
+    # Start Watchdog Loop: sleeps exactly until the next deadline,
+    # or until a recovered entity is re-armed
+    watchdog_wakeup = asyncio.Event()
+    watchdog.on_rearm = watchdog_wakeup.set
+
     async def watchdog_loop():
+        def timeout_callback(eid):
+            # Publish '0' (0.0) on timeout
+            # Use Alias if available
+            topic_id = watchdog_map.get(eid, eid)
+            payload = {
+                "value": 0.0,
+                "timestamp": time.time(),
+                "status": "timeout",
+                "msg": "Watchdog triggered: No heartbeat received"
+            }
+            mqtt_client.publish("telemetry", topic_id, payload)
+
         while not stop_event.is_set():
-            def timeout_callback(eid):
-                # Publish '0' (0.0) on timeout
-                # Use Alias if available
-                topic_id = watchdog_map.get(eid, eid)
-                payload = {
-                    "value": 0.0,
-                    "timestamp": time.time(),
-                    "status": "timeout",
-                    "msg": "Watchdog triggered: No heartbeat received"
-                }
-                mqtt_client.publish("telemetry", topic_id, payload)
-            
-            watchdog.check_timeouts(timeout_callback)
-            await asyncio.sleep(5)
+            watchdog_wakeup.clear()
+            delay = watchdog.check_timeouts(timeout_callback)
+            try:
+                await asyncio.wait_for(watchdog_wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
             
     watchdog_task = asyncio.create_task(watchdog_loop())
+    lag_task = asyncio.create_task(watch_loop_lag(metrics))
+
+    metrics_runner = None
+    if options.get("metrics_port", 0):
+        try:
+            metrics_runner = await start_metrics_server(metrics, options["metrics_port"])
+        except OSError as e:
+            logger.error(f"Failed to start metrics endpoint on port {options['metrics_port']}: {e}")
+
+    def publish_result(eid, val, ctx, analysis):
+        publish_telemetry(mqtt_client, eid, val, ctx[0], analysis, ctx[1])
+
+    # Bounded engine registry: LRU beyond kernel_max_entities, idle entities dropped after kernel_idle_ttl_s
+    max_entities = options.get("kernel_max_entities", 20000)
+    idle_ttl = options.get("kernel_idle_ttl_s", 86400)
+    engine_rules = options.get("kernel_engine_rules", [])
+    ewma_half_life = options.get("kernel_ewma_half_life_s", 3600)
+
+    # Optional multi-process kernel (takes precedence over micro-batching)
+    shards = options.get("kernel_shards", 0)
+    batch_tick = options.get("batch_tick_ms", 0) / 1000.0
+    if shards > 0:
+        if batch_tick > 0:
+            logger.warning("kernel_shards is set, ignoring batch_tick_ms.")
+            batch_tick = 0
+        sharded_kernel = ShardedKernel(shards, publish_result, streaming=zscore_engine_cls is StreamingZScoreEngine,
+                                       max_entities=-(-max_entities // shards), idle_ttl=idle_ttl,
+                                       engine_rules=engine_rules, ewma_half_life=ewma_half_life)
+        sharded_kernel.start()
+        expose("kernel", sharded_kernel.stats)
+
+    # Optional micro-batching of the kernel (trades bounded latency for throughput)
+    # In batch mode the engines only serve the pre-checks; they recompute from the shared window
+    z_engines = make_engine_registry(ZScoreEngine if batch_tick > 0 else zscore_engine_cls, max_entities, idle_ttl,
+                                     engine_rules, ewma_half_life)
+    expose("engines", z_engines.stats)
+
+    if batch_tick > 0:
+        if engine_rules:
+            logger.info("Micro-batching scores the Z-Score entities, entities ruled to other engines are scored per event.")
+        batcher = MicroBatcher(
+            window_store,
+            BatchZScoreScorer(window_store),
+            publish_result,
+            engines=z_engines
+        )
+        logger.info(f"Kernel micro-batching enabled (tick={batch_tick * 1000:.0f}ms)")
+
+        batch_time = metrics.histogram("kernel_batch_seconds")
+
+        async def batch_loop():
+            while not stop_event.is_set():
+                await asyncio.sleep(batch_tick)
+                start = time.perf_counter()
+                batcher.flush()
+                batch_time.observe(time.perf_counter() - start)
+
+        batch_task = asyncio.create_task(batch_loop())
+
+    if conflator is not None:
+        async def conflation_loop():
+            while not stop_event.is_set():
+                await asyncio.sleep(conflation_window)
+                conflator.flush()
+
+        conflation_task = asyncio.create_task(conflation_loop())
+
+    if rollups is not None:
+        async def rollup_loop():
+            # Close the buckets of quiet entities at each boundary of the finest resolution
+            while not stop_event.is_set():
+                await asyncio.sleep(max(0.0, rollups.next_boundary() - time.time()))
+                rollups.flush()
+
+        rollup_task = asyncio.create_task(rollup_loop())
+
+    if lux_diagnostic is not None:
+        async def lux_loop():
+            while not stop_event.is_set():
+                await asyncio.sleep(lux_diagnostic.solar.bucket)
+                lux_diagnostic.check()
+
+        lux_task = asyncio.create_task(lux_loop())
+
+    # Warm start: restore the kernel windows and watchdog state before connecting
+    # (sharded engines live in the workers, only the watchdog is kept then)
+    snapshot = None
+    snapshot_task = None
+    snapshot_interval = options.get("snapshot_interval_s", 300)
+    if snapshot_interval > 0:
+        snapshot = KernelSnapshot(options.get("snapshot_path", "/data/kernel_state.bin"),
+                                  None if sharded_kernel is not None else z_engines, watchdog)
+        if snapshot.restore():
+            watchdog_wakeup.set()
+        expose("snapshot", snapshot.stats)
+
+        async def snapshot_loop():
+            while not stop_event.is_set():
+                await asyncio.sleep(snapshot_interval)
+                # Copy the state on the loop (consistent, no per-sample work), encode and write off it
+                await loop.run_in_executor(None, snapshot.save_capture, snapshot.capture())
+
+        snapshot_task = asyncio.create_task(snapshot_loop())
     
     # Graceful Shutdown
-    loop = asyncio.get_running_loop()
-    stop_event = asyncio.Event()
-    
     def signal_handler():
         logger.info("Shutdown signal received")
         stop_event.set()
@@ -243,6 +612,28 @@ async def main():
     finally:
         logger.info("Stopping services...")
         await ha_client.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        if capture is not None:
+            capture.close()
+        await dispatcher.stop()
+        if conflator is not None:
+            conflator.flush()
+        if batcher is not None:
+            batcher.flush()
+        if sharded_kernel is not None:
+            sharded_kernel.stop()
+        if rollups is not None:
+            rollups.flush_all()
+        if snapshot_task is not None:
+            # A periodic write still running in the executor finishes first (see KernelSnapshot.write)
+            snapshot_task.cancel()
+            try:
+                await snapshot_task
+            except asyncio.CancelledError:
+                pass
+        if snapshot is not None:
+            snapshot.save()
         mqtt_client.stop()
         logger.info("Goodbye.")
 
@@ -0,0 +1,44 @@
+import json
+import math
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Name of the active backend, for logs and benchmarks
+BACKEND = "orjson" if orjson is not None else "json"
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Decode a JSON document, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def _finite(obj: Any) -> Any:
+    """Return a copy of obj with non-finite floats replaced by None (what orjson writes)."""
+    if isinstance(obj, float):
+        return obj if math.isfinite(obj) else None
+    if isinstance(obj, dict):
+        return {k: _finite(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [_finite(v) for v in obj]
+    return obj
+
+def dumps(obj: Any) -> Union[str, bytes]:
+    """
+    Encode an object to JSON, using orjson when it is installed.
+    Returns bytes with orjson and str with the stdlib; both are accepted by paho and aiohttp.
+    Falls back to the stdlib for objects orjson rejects (e.g. non-str keys).
+    NaN and inf are written as null by both backends, so the output stays valid JSON.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            pass
+    try:
+        return json.dumps(obj, allow_nan=False)
+    except ValueError:
+        return json.dumps(_finite(obj), allow_nan=False)
@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import logging
+import os
+import re
+import resource
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, 50us .. 5s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_NAME_RE = re.compile(r"^[a-zA-Z_][a-zA-Z0-9_]*$")
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc is not available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+class Counter:
+    """Monotonic counter. Hot paths may keep a plain int instead and register a provider."""
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, n: int = 1):
+        self.value += n
+
+class Gauge:
+    """Current value, either set explicitly or read from a callback at collection time."""
+    __slots__ = ("value", "fn")
+
+    def __init__(self, fn: Optional[Callable[[], float]] = None):
+        self.value = 0.0
+        self.fn = fn
+
+    def set(self, value: float):
+        self.value = value
+
+    def get(self) -> float:
+        return self.fn() if self.fn is not None else self.value
+
+class Histogram:
+    """
+    Fixed-bucket histogram: observe() is a bisect and two additions.
+    counts[i] holds observations <= buckets[i] (and > buckets[i-1]); the last slot is +Inf.
+    """
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-quantile (an estimate, like Prometheus)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {"count": self.count, "sum": round(self.sum, 6),
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+class MetricsRegistry:
+    """
+    Named counters, gauges and histograms, plus stats providers (callables returning a number
+    or a nested dict of numbers, like the components' `stats()`), read at collection time.
+    Collected as a JSON-friendly snapshot (MQTT system/metrics) or Prometheus text.
+    """
+    def __init__(self, prefix: str = "knx_sentinel"):
+        self.prefix = prefix
+        self.counters: Dict[str, Counter] = {}
+        self.gauges: Dict[str, Gauge] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self.providers: Dict[str, Callable[[], Any]] = {}
+        self.started = time.time()
+
+    def counter(self, name: str) -> Counter:
+        return self.counters.setdefault(name, Counter())
+
+    def gauge(self, name: str, fn: Optional[Callable[[], float]] = None) -> Gauge:
+        gauge = self.gauges.setdefault(name, Gauge(fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name: str, buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.histograms.setdefault(name, Histogram(buckets))
+
+    def register(self, name: str, provider: Callable[[], Any]):
+        self.providers[name] = provider
+
+    def add_process_metrics(self):
+        self.gauge("process_rss_bytes", rss_bytes)
+        self.gauge("process_cpu_seconds", cpu_seconds)
+        self.gauge("uptime_seconds", lambda: time.time() - self.started)
+
+    def _provided(self) -> Iterator[Tuple[str, Dict[str, str], float]]:
+        """Flatten provider values into (name, labels, value). Non-identifier keys become labels."""
+        for name, provider in self.providers.items():
+            try:
+                value = provider()
+            except Exception as e:
+                logger.error(f"Metrics provider {name} failed: {e}")
+                continue
+            yield from _flatten(name, value, {})
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-friendly view of every metric."""
+        out: Dict[str, Any] = {"timestamp": time.time()}
+        for name, counter in self.counters.items():
+            out[name] = counter.value
+        for name, gauge in self.gauges.items():
+            out[name] = gauge.get()
+        for name, provider in self.providers.items():
+            try:
+                out[name] = provider()
+            except Exception as e:
+                logger.error(f"Metrics provider {name} failed: {e}")
+        for name, histogram in self.histograms.items():
+            out[name] = histogram.snapshot()
+        return out
+
+    def prometheus(self) -> str:
+        """Prometheus text exposition format (0.0.4)."""
+        p = self.prefix
+        lines: List[str] = []
+        for name, counter in self.counters.items():
+            lines += [f"# TYPE {p}_{name} counter", f"{p}_{name} {counter.value}"]
+        for name, gauge in self.gauges.items():
+            lines += [f"# TYPE {p}_{name} gauge", f"{p}_{name} {_number(gauge.get())}"]
+        # Samples of one family must be contiguous
+        families: Dict[str, List[str]] = {}
+        for name, labels, value in self._provided():
+            families.setdefault(name, []).append(f"{p}_{name}{_labels(labels)} {_number(value)}")
+        for name, samples in families.items():
+            lines.append(f"# TYPE {p}_{name} untyped")
+            lines += samples
+        for name, histogram in self.histograms.items():
+            lines.append(f"# TYPE {p}_{name} histogram")
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, histogram.counts):
+                cumulative += n
+                lines.append(f'{p}_{name}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{p}_{name}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{p}_{name}_sum {_number(histogram.sum)}")
+            lines.append(f"{p}_{name}_count {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+def _flatten(name: str, value: Any, labels: Dict[str, str]) -> Iterator[Tuple[str, Dict[str, str], float]]:
+    if isinstance(value, bool):
+        yield name, labels, float(value)
+    elif isinstance(value, (int, float)):
+        yield name, labels, value
+    elif isinstance(value, dict):
+        for key, sub in value.items():
+            key = str(key)
+            if _NAME_RE.match(key):
+                yield from _flatten(f"{name}_{key}", sub, labels)
+            else:
+                # e.g. deadband rules keyed by pattern
+                yield from _flatten(name, sub, {**labels, "key": key})
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"')) for k, v in labels.items())
+    return "{" + body + "}"
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+async def watch_loop_lag(registry: MetricsRegistry, interval: float = 0.5):
+    """Measure how late the event loop wakes up from a sleep (loop_lag_seconds)."""
+    loop = asyncio.get_running_loop()
+    histogram = registry.histogram("loop_lag_seconds")
+    gauge = registry.gauge("loop_lag_last_seconds")
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        histogram.observe(lag)
+        gauge.set(lag)
+
+async def start_metrics_server(registry: MetricsRegistry, port: int, host: str = "0.0.0.0"):
+    """Serve /metrics in Prometheus text format. Returns the aiohttp runner (cleanup() to stop)."""
+    from aiohttp import web
+
+    async def handle_metrics(request):
+        return web.Response(text=registry.prometheus(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.add_routes([web.get("/metrics", handle_metrics)])
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Prometheus metrics on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,125 @@
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+from src.ingestion.filter import FilterManager
+
+logger = logging.getLogger(__name__)
+
+class DeadbandRule:
+    """Deadband for entities matching a glob pattern."""
+    __slots__ = ("pattern", "matcher", "absolute", "percent", "sent", "suppressed")
+
+    def __init__(self, pattern: str, absolute: float = 0.0, percent: float = 0.0):
+        self.pattern = pattern
+        # Same glob semantics as target_entities; decisions are cached by DeadbandFilter
+        self.matcher = FilterManager([pattern], cache_size=0)
+        self.absolute = absolute
+        self.percent = percent
+        self.sent = 0
+        self.suppressed = 0
+
+    def band(self, last: float) -> float:
+        """Half-width of the band around the last published value."""
+        return max(self.absolute, abs(last) * self.percent / 100.0)
+
+    @classmethod
+    def parse(cls, spec: str) -> "DeadbandRule":
+        """
+        Parse "pattern=abs:0.5,pct:1" (either part optional),
+        e.g. "sensor.knx_voltage*=abs:0.5" or "sensor.*_power=pct:2".
+        """
+        spec = str(spec).strip("'\"")
+        if "=" not in spec:
+            raise ValueError(f"Invalid deadband rule (expected pattern=abs:X,pct:Y): {spec}")
+        pattern, params = spec.split("=", 1)
+        rule = cls(pattern.strip())
+        for part in params.split(","):
+            if not part.strip():
+                continue
+            key, _, val = part.partition(":")
+            key = key.strip().lower()
+            if key == "abs":
+                rule.absolute = float(val)
+            elif key == "pct":
+                rule.percent = float(val)
+            else:
+                raise ValueError(f"Unknown deadband parameter '{key}' in rule: {spec}")
+        return rule
+
+class DeadbandFilter:
+    """
+    Report-by-exception filter for telemetry publishing.
+    A value is published only when it leaves the band around the last published value,
+    when the kernel flags an anomaly, or when the entity has been silent for longer
+    than the keepalive interval. Entities matching no rule are always published.
+    The band is max(abs, pct% of the last published value), so `abs` acts as a floor.
+
+    State is kept for at most `max_entities` entities (least recently published
+    forgotten first, so their next value is published); 0 for unbounded.
+    """
+    def __init__(self, rules: List[str] = None, keepalive: float = 300.0,
+                 clock: Callable[[], float] = time.monotonic, max_entities: int = 20000):
+        self.rules = [DeadbandRule.parse(r) for r in (rules or [])]
+        self.keepalive = keepalive
+        self.clock = clock
+        self.max_entities = max_entities
+        # entity_id -> [last published value, time of last publish], least recently published first
+        self._last: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._rule_cache: "OrderedDict[str, Optional[DeadbandRule]]" = OrderedDict()
+
+        self.sent = 0
+        self.suppressed = 0
+
+    def rule_for(self, entity_id: str) -> Optional[DeadbandRule]:
+        """First rule (in configuration order) whose pattern matches the entity."""
+        try:
+            rule = self._rule_cache[entity_id]
+            self._rule_cache.move_to_end(entity_id)
+            return rule
+        except KeyError:
+            rule = next((r for r in self.rules if r.matcher.should_process(entity_id)), None)
+            self._rule_cache[entity_id] = rule
+            if self.max_entities and len(self._rule_cache) > self.max_entities:
+                self._rule_cache.popitem(last=False)
+            return rule
+
+    def should_publish(self, entity_id: str, value: float, anomaly: bool = False) -> bool:
+        """Decide whether a new value is reported, and record it if so."""
+        rule = self.rule_for(entity_id)
+        if rule is None:
+            self.sent += 1
+            return True
+
+        now = self.clock()
+        last = self._last.get(entity_id)
+        if (last is None or anomaly or now - last[1] >= self.keepalive
+                or abs(value - last[0]) > rule.band(last[0])):
+            if last is None:
+                self._last[entity_id] = [value, now]
+                if self.max_entities and len(self._last) > self.max_entities:
+                    self._last.popitem(last=False)
+            else:
+                last[0] = value
+                last[1] = now
+                self._last.move_to_end(entity_id)
+            rule.sent += 1
+            self.sent += 1
+            return True
+
+        rule.suppressed += 1
+        self.suppressed += 1
+        return False
+
+    def forget(self, entity_id: str):
+        """Drop the state of an entity (the next value is always published)."""
+        self._last.pop(entity_id, None)
+        self._rule_cache.pop(entity_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entities": len(self._last),
+            "sent": self.sent,
+            "suppressed": self.suppressed,
+            "rules": {r.pattern: {"sent": r.sent, "suppressed": r.suppressed} for r in self.rules},
+        }
@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import threading
@@ -5,15 +6,30 @@ import time
 import socket
 import ssl
 import paho.mqtt.client as mqtt
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, List, Optional
+from src.common import json_codec
+from src.common.metrics import rss_bytes
+from src.egress.outbox import Outbox
 
 logger = logging.getLogger(__name__)
 
 class MQTTEgress:
     """
     Handles MQTT communication to the central broker.
-    Supports TLS, LWT, and Heartbeats.
+    Supports TLS, LWT, Heartbeats and optional batched publishing.
+
+    In batch mode, payloads are grouped into JSON array messages on
+    knx-monitor/{client}/{site}/batch, flushed on max count, max bytes or max latency.
+
+    While the broker is unreachable, telemetry goes to a disk-backed Outbox instead of
+    paho's in-memory queue, and is drained in order at a limited rate after reconnect.
+    Outbox rows are only deleted once the broker has acknowledged them.
     """
+    # Seconds the drain waits for the broker to acknowledge a chunk of outbox messages
+    OUTBOX_ACK_TIMEOUT = 10.0
+    # Seconds the heartbeat/metrics threads wait for the event loop to run the providers
+    PROVIDER_TIMEOUT = 5.0
+
     def __init__(self, config: Dict[str, Any]):
         self.config = config
         self.client_id = config.get("client_id", "default_client")
@@ -45,45 +61,250 @@ class MQTTEgress:
 
         self._shutdown = False
 
+        # Extra heartbeat fields: name -> provider returning a JSON-serializable value
+        self.heartbeat_fields: Dict[str, Callable[[], Any]] = {}
+        # Event loop owning the state the providers read; when set, the heartbeat and
+        # metrics threads run the providers on it instead of reading that state concurrently
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Metrics snapshot published on system/metrics every `metrics_interval_s` (0 disables)
+        self.metrics_provider: Optional[Callable[[], Dict[str, Any]]] = None
+        self.metrics_interval = config.get("metrics_interval_s", 60)
+
+        # Counters
+        self.published = 0
+        self.publish_errors = 0
+        self.outboxed = 0
+
+        # Batched egress
+        self.batch_enabled = config.get("mqtt_batch_enabled", False)
+        self.batch_max_count = config.get("mqtt_batch_max_count", 100)
+        self.batch_max_bytes = config.get("mqtt_batch_max_bytes", 65536)
+        self.batch_max_latency = config.get("mqtt_batch_max_latency_ms", 1000) / 1000.0
+        self.batch_per_entity = config.get("mqtt_batch_per_entity_topics", False)
+        self.batch_topic = f"knx-monitor/{self.client_id}/{self.site_id}/batch"
+        self._batch: List[bytes] = []
+        self._batch_bytes = 0
+        self._batch_started = 0.0
+        self._batch_lock = threading.Lock()
+        self._batch_wakeup = threading.Event()
+
+        # Store-and-forward outbox
+        self.outbox: Optional[Outbox] = None
+        outbox_path = config.get("mqtt_outbox_path", "/data/outbox.db")
+        if config.get("mqtt_outbox_enabled", True) and Outbox.available(outbox_path):
+            try:
+                self.outbox = Outbox(
+                    outbox_path,
+                    max_bytes=config.get("mqtt_outbox_max_mb", 64) * 1024 * 1024,
+                    eviction=config.get("mqtt_outbox_eviction", "drop_oldest")
+                )
+            except Exception as e:
+                logger.error(f"Failed to open outbox at {outbox_path}: {e}")
+        self.outbox_drain_rate = config.get("mqtt_outbox_drain_rate", 50)
+        self._drain_wakeup = threading.Event()
+
     def start(self):
         """Start the MQTT loop and heartbeat thread."""
         try:
             logger.info(f"Connecting to MQTT Broker {self.broker}:{self.port}")
-            self.client.connect(self.broker, self.port, 60)
+            # Async connect: the network loop keeps retrying if the broker is down at startup
+            self.client.connect_async(self.broker, self.port, 60)
             self.client.loop_start()
             
             # Start Heartbeat
             self.hb_thread = threading.Thread(target=self._heartbeat_loop, daemon=True)
             self.hb_thread.start()
+
+            if self.metrics_provider is not None and self.metrics_interval > 0:
+                self.metrics_thread = threading.Thread(target=self._metrics_loop, daemon=True)
+                self.metrics_thread.start()
+
+            if self.batch_enabled:
+                logger.info(f"Batched egress enabled on {self.batch_topic}")
+                self.batch_thread = threading.Thread(target=self._batch_loop, daemon=True)
+                self.batch_thread.start()
+
+            if self.outbox is not None:
+                self.drain_thread = threading.Thread(target=self._drain_loop, daemon=True)
+                self.drain_thread.start()
             
         except Exception as e:
             logger.error(f"Failed to start MQTT client: {e}")
 
     def stop(self):
         self._shutdown = True
+        self._batch_wakeup.set()
+        self._drain_wakeup.set()
+        # Flush pending batches while the network loop still runs
+        info = self.flush_batch()
+        if info is not None and self.client.is_connected():
+            try:
+                info.wait_for_publish(timeout=5)
+            except Exception as e:
+                logger.warning(f"Final batch not confirmed: {e}")
         self.client.loop_stop()
         self.client.disconnect()
+        if self.outbox is not None:
+            drain_thread = getattr(self, "drain_thread", None)
+            if drain_thread is not None:
+                drain_thread.join(timeout=2)
+            self.outbox.close()
 
     def publish(self, metric_type: str, entity_id: str, payload: Dict[str, Any]):
         """
         Publish enriched telemetry.
         Topic: knx-monitor/{client}/{site}/{type}/{id}
+        In batch mode the payload is appended to the current batch instead
+        (and also sent on the per-entity topic if `mqtt_batch_per_entity_topics` is set).
         """
         topic = f"knx-monitor/{self.client_id}/{self.site_id}/{metric_type}/{entity_id}"
         
         # Enrich payload if needed, generally payload already has timestamp
         try:
-            json_payload = json.dumps(payload)
-            self.client.publish(topic, json_payload, qos=1)
+            if self.batch_enabled:
+                self._add_to_batch(metric_type, entity_id, payload)
+                if not self.batch_per_entity:
+                    return
+            json_payload = json_codec.dumps(payload)
+            self._send(topic, json_payload, qos=1)
         except Exception as e:
+            self.publish_errors += 1
             logger.error(f"Failed to publish to {topic}: {e}")
 
+    def _send(self, topic: str, payload, qos: int = 1) -> Optional[mqtt.MQTTMessageInfo]:
+        """Publish, or store in the outbox while the broker is unreachable."""
+        if self.outbox is not None and not self.client.is_connected():
+            self.outbox.put(topic, payload, qos)
+            self.outboxed += 1
+            return None
+        info = self.client.publish(topic, payload, qos=qos)
+        self.published += 1
+        if info is not None and info.rc != mqtt.MQTT_ERR_SUCCESS:
+            self.publish_errors += 1
+        return info
+
+    def stats(self) -> Dict[str, Any]:
+        """Egress counters, paho's queue depth (messages not yet acknowledged) and outbox depth."""
+        return {
+            "connected": self.client.is_connected(),
+            "published": self.published,
+            "errors": self.publish_errors,
+            "outboxed": self.outboxed,
+            "queued": len(getattr(self.client, "_out_messages", ())),
+            "outbox_depth": len(self.outbox) if self.outbox is not None else 0,
+        }
+
+    def _add_to_batch(self, metric_type: str, entity_id: str, payload: Dict[str, Any]):
+        item = json_codec.dumps({"type": metric_type, "id": entity_id, "payload": payload})
+        if isinstance(item, str):
+            item = item.encode()
+        with self._batch_lock:
+            # Flush first if this item would push the batch over the byte limit
+            if self._batch and self._batch_bytes + len(item) + 1 > self.batch_max_bytes:
+                self._flush_locked()
+            if not self._batch:
+                self._batch_started = time.monotonic()
+            self._batch.append(item)
+            self._batch_bytes += len(item) + 1
+            if len(self._batch) >= self.batch_max_count or self._batch_bytes >= self.batch_max_bytes:
+                self._flush_locked()
+
+    def flush_batch(self) -> Optional[mqtt.MQTTMessageInfo]:
+        """Publish the pending batch, if any."""
+        with self._batch_lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> Optional[mqtt.MQTTMessageInfo]:
+        if not self._batch:
+            return None
+        body = b"[" + b",".join(self._batch) + b"]"
+        self._batch = []
+        self._batch_bytes = 0
+        try:
+            return self._send(self.batch_topic, body, qos=1)
+        except Exception as e:
+            logger.error(f"Failed to publish batch to {self.batch_topic}: {e}")
+            return None
+
+    def _batch_loop(self):
+        """Flush batches that have waited longer than the max latency."""
+        while not self._shutdown:
+            with self._batch_lock:
+                if self._batch:
+                    age = time.monotonic() - self._batch_started
+                    if age >= self.batch_max_latency:
+                        self._flush_locked()
+                        wait = self.batch_max_latency
+                    else:
+                        wait = self.batch_max_latency - age
+                else:
+                    wait = self.batch_max_latency
+            self._batch_wakeup.wait(wait)
+
+    def _drain_loop(self):
+        """
+        Write buffered outbox messages to disk, and replay them in order while connected.
+        Rate limited to `mqtt_outbox_drain_rate` msg/s so replay does not starve live traffic
+        (live publishes go straight to the client once connected).
+        """
+        interval = 1.0 / max(self.outbox_drain_rate, 1)
+        while not self._shutdown:
+            self._drain_wakeup.wait(timeout=1)
+            self._drain_wakeup.clear()
+            # Persist what _send() buffered while offline, one transaction per wakeup
+            try:
+                self.outbox.flush()
+            except Exception as e:
+                logger.error(f"Outbox write failed: {e}")
+            while not self._shutdown and self.client.is_connected():
+                rows = self.outbox.peek(limit=100)
+                if not rows:
+                    break
+                sent = []
+                for row_id, topic, payload, qos in rows:
+                    if self._shutdown or not self.client.is_connected():
+                        break
+                    info = self.client.publish(topic, payload, qos=qos)
+                    if info.rc != mqtt.MQTT_ERR_SUCCESS:
+                        break
+                    sent.append((row_id, info))
+                    time.sleep(interval)
+                # A successful publish() only means paho queued the message in memory
+                acked = self._acknowledged(sent)
+                self.outbox.delete(acked)
+                if len(acked) < len(rows):
+                    break
+                if not len(self.outbox):
+                    logger.info("Outbox drained.")
+
+    def _acknowledged(self, sent: List) -> List[int]:
+        """
+        Row ids of the leading messages of `sent` ([(row_id, info)]) that the broker
+        acknowledged (PUBACK for QoS 1) within OUTBOX_ACK_TIMEOUT. Rows after the first
+        unacknowledged one are kept too, so a later drain resends them in order.
+        """
+        deadline = time.monotonic() + self.OUTBOX_ACK_TIMEOUT
+        acked = []
+        for row_id, info in sent:
+            try:
+                info.wait_for_publish(timeout=max(0.0, deadline - time.monotonic()))
+            except (ValueError, RuntimeError):
+                break
+            if not info.is_published():
+                break
+            acked.append(row_id)
+        return acked
+
     def _on_connect(self, client, userdata, flags, rc):
         if rc == 0:
             logger.info("Connected to MQTT Broker!")
             # Publish online status
             topic = f"knx-monitor/{self.client_id}/{self.site_id}/system/status"
             self.client.publish(topic, json.dumps({"status": "online", "uptime": time.time()}), retain=True)
+            if self.outbox is not None and len(self.outbox):
+                logger.info(f"Draining {len(self.outbox)} messages from outbox")
+                self._drain_wakeup.set()
         else:
             logger.error(f"Failed to connect to MQTT Broker, return code {rc}")
 
@@ -99,10 +320,42 @@ class MQTTEgress:
                 payload = {
                     "online": True,
                     "timestamp": time.time(),
-                    "memory": "TBD" # Could add psutil here later
+                    "memory": rss_bytes()
                 }
+                payload.update(self._on_loop(self._heartbeat_fields))
                 self.client.publish(topic, json.dumps(payload), qos=0)
             except Exception as e:
                 logger.error(f"Heartbeat error: {e}")
             
             time.sleep(60)
+
+    def _heartbeat_fields(self) -> Dict[str, Any]:
+        """Values of the heartbeat providers; a failing provider is logged and left out."""
+        fields = {}
+        for name, provider in list(self.heartbeat_fields.items()):
+            try:
+                fields[name] = provider()
+            except Exception as e:
+                logger.error(f"Heartbeat provider {name} failed: {e}")
+        return fields
+
+    def _on_loop(self, fn: Callable[[], Any]) -> Any:
+        """Call fn on `self.loop` and wait for the result (directly if no loop is running)."""
+        loop = self.loop
+        if loop is None or not loop.is_running():
+            return fn()
+
+        async def call():
+            return fn()
+
+        return asyncio.run_coroutine_threadsafe(call(), loop).result(timeout=self.PROVIDER_TIMEOUT)
+
+    def _metrics_loop(self):
+        """Publish the metrics snapshot every `metrics_interval_s`."""
+        topic = f"knx-monitor/{self.client_id}/{self.site_id}/system/metrics"
+        while not self._shutdown:
+            time.sleep(self.metrics_interval)
+            try:
+                self.client.publish(topic, json_codec.dumps(self._on_loop(self.metrics_provider)), qos=0)
+            except Exception as e:
+                logger.error(f"Metrics publish error: {e}")
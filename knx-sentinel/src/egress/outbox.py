@@ -0,0 +1,140 @@
+import logging
+import os
+import sqlite3
+import threading
+from typing import List, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+class Outbox:
+    """
+    Disk-backed store-and-forward queue for MQTT messages.
+    Messages are kept in a SQLite database in WAL mode, in insertion order, so they
+    survive broker outages and add-on restarts without growing process memory.
+    The total payload size is capped; when full, the eviction policy decides
+    whether the oldest stored messages or the incoming one are dropped.
+
+    put() only buffers the message in memory; buffered messages are written in one
+    transaction by flush() (called by the egress drain thread), when FLUSH_COUNT
+    messages are buffered, or when the cap forces an eviction. This keeps SQLite off
+    the event loop for most messages during a broker outage.
+    """
+    EVICTION_POLICIES = ("drop_oldest", "drop_newest")
+    # Buffered messages that trigger a write from put() itself
+    FLUSH_COUNT = 256
+
+    def __init__(self, path: str = "/data/outbox.db", max_bytes: int = 64 * 1024 * 1024,
+                 eviction: str = "drop_oldest"):
+        if eviction not in self.EVICTION_POLICIES:
+            raise ValueError(f"Unknown eviction policy: {eviction}")
+        self.path = path
+        self.max_bytes = max_bytes
+        self.eviction = eviction
+        self.evicted = 0
+
+        self._lock = threading.Lock()
+        # (topic, payload, qos) accepted by put() but not yet written
+        self._pending: List[Tuple[str, bytes, int]] = []
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS outbox ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, topic TEXT NOT NULL, payload BLOB NOT NULL, qos INTEGER NOT NULL)"
+        )
+        count, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(LENGTH(payload)), 0) FROM outbox").fetchone()
+        self._count = count
+        self._bytes = size
+        if count:
+            logger.info(f"Outbox: {count} messages ({size} bytes) pending from previous run")
+
+    def put(self, topic: str, payload: Union[str, bytes], qos: int = 1) -> bool:
+        """Store a message. Returns False if it was rejected by the size cap."""
+        if isinstance(payload, str):
+            payload = payload.encode()
+        size = len(payload)
+        with self._lock:
+            over_cap = self._bytes + size > self.max_bytes
+            if over_cap and (self.eviction == "drop_newest" or size > self.max_bytes):
+                self.evicted += 1
+                return False
+            self._pending.append((topic, payload, qos))
+            self._count += 1
+            self._bytes += size
+            if over_cap or len(self._pending) >= self.FLUSH_COUNT:
+                self._flush_locked()
+            return True
+
+    def flush(self):
+        """Write buffered messages (and evict down to the cap) in one transaction."""
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending and self._bytes <= self.max_bytes:
+            return
+        self._db.execute("BEGIN")
+        try:
+            self._db.executemany("INSERT INTO outbox (topic, payload, qos) VALUES (?, ?, ?)", self._pending)
+            if self._bytes > self.max_bytes:
+                self._evict_locked(self._bytes - self.max_bytes)
+            self._db.execute("COMMIT")
+        except Exception:
+            self._db.execute("ROLLBACK")
+            raise
+        self._pending = []
+
+    def _evict_locked(self, needed: int):
+        """Delete the oldest messages until at least `needed` bytes are freed."""
+        freed = 0
+        ids = []
+        for row_id, size in self._db.execute("SELECT id, LENGTH(payload) FROM outbox ORDER BY id"):
+            ids.append(row_id)
+            freed += size
+            if freed >= needed:
+                break
+        if ids:
+            self._db.execute("DELETE FROM outbox WHERE id <= ?", (ids[-1],))
+            self._count -= len(ids)
+            self._bytes -= freed
+            self.evicted += len(ids)
+            if self.evicted % 1000 < len(ids):
+                logger.warning(f"Outbox full, evicted oldest messages (total evicted={self.evicted})")
+
+    def peek(self, limit: int = 100) -> List[Tuple[int, str, bytes, int]]:
+        """Return up to `limit` oldest messages as (id, topic, payload, qos) without removing them."""
+        with self._lock:
+            self._flush_locked()
+            return self._db.execute(
+                "SELECT id, topic, payload, qos FROM outbox ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+
+    def delete(self, ids: List[int]):
+        """Remove delivered messages."""
+        if not ids:
+            return
+        with self._lock:
+            placeholders = ",".join("?" * len(ids))
+            size = self._db.execute(
+                f"SELECT COALESCE(SUM(LENGTH(payload)), 0) FROM outbox WHERE id IN ({placeholders})", ids
+            ).fetchone()[0]
+            deleted = self._db.execute(f"DELETE FROM outbox WHERE id IN ({placeholders})", ids).rowcount
+            self._count -= deleted
+            self._bytes -= size
+
+    def close(self):
+        with self._lock:
+            self._flush_locked()
+            self._db.close()
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+    def __len__(self) -> int:
+        return self._count
+
+    @staticmethod
+    def available(path: str) -> bool:
+        """True if the outbox directory exists (e.g. /data inside the add-on)."""
+        return os.path.isdir(os.path.dirname(path) or ".")
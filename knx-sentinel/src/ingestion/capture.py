@@ -0,0 +1,125 @@
+import gzip
+import logging
+import os
+import struct
+import time
+import zlib
+from typing import Callable, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Record: receive time (epoch seconds), frame length, then the UTF-8 frame
+_RECORD = struct.Struct("<dI")
+
+class CaptureWriter:
+    """
+    Append-only capture of raw websocket frames with their receive time, for offline replay.
+
+    Records are written to a gzip stream, which is sync-flushed every `flush_interval`
+    seconds so at most that much is lost on a crash. When the compressed file reaches
+    `max_bytes` it is rotated (path -> path.1 -> ... -> path.<backups>, oldest dropped).
+    A file left over from a previous run is rotated away on start instead of appended to,
+    as its gzip stream may not be terminated.
+    """
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, backups: int = 5,
+                 flush_interval: float = 1.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = max(0, backups)
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.records = 0
+        self.rotations = 0
+        self._file = None
+        self._gz = None
+        self._next_flush = 0.0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if os.path.exists(path) and os.path.getsize(path) > 0:
+            self._shift()
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "wb")
+        self._gz = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=6)
+
+    def _shift(self):
+        """path -> path.1 -> ... -> path.<backups>; with no backups the current file is dropped."""
+        if self.backups == 0:
+            os.remove(self.path)
+            return
+        for i in range(self.backups - 1, 0, -1):
+            src = f"{self.path}.{i}"
+            if os.path.exists(src):
+                os.replace(src, f"{self.path}.{i + 1}")
+        os.replace(self.path, f"{self.path}.1")
+
+    def rotate(self):
+        self._close_stream()
+        self._shift()
+        self._open()
+        self.rotations += 1
+
+    def write(self, raw: str, received_at: float = None):
+        """Append one frame (stamped with the current time unless given)."""
+        data = raw.encode("utf-8")
+        now = self.clock() if received_at is None else received_at
+        self._gz.write(_RECORD.pack(now, len(data)))
+        self._gz.write(data)
+        self.records += 1
+        if now >= self._next_flush:
+            self._next_flush = now + self.flush_interval
+            self._gz.flush(zlib.Z_SYNC_FLUSH)
+            self._file.flush()
+            if self._file.tell() >= self.max_bytes:
+                self.rotate()
+
+    def _close_stream(self):
+        if self._gz is not None:
+            self._gz.close()
+            self._file.close()
+            self._gz = self._file = None
+
+    def close(self):
+        self._close_stream()
+
+    def stats(self) -> dict:
+        return {"records": self.records, "rotations": self.rotations}
+
+def capture_files(path: str) -> List[str]:
+    """Existing files of a capture set, oldest first (path.N ... path.1, path)."""
+    rotated = []
+    i = 1
+    while os.path.exists(f"{path}.{i}"):
+        rotated.append(f"{path}.{i}")
+        i += 1
+    files = rotated[::-1]
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+def read_capture(path: str) -> Iterator[Tuple[float, str]]:
+    """
+    Yield (received_at, frame) records from one capture file.
+    A truncated tail (capture still running, or a crash) ends the iteration quietly.
+    """
+    with gzip.open(path, "rb") as gz:
+        try:
+            while True:
+                header = gz.read(_RECORD.size)
+                if len(header) < _RECORD.size:
+                    return
+                received_at, length = _RECORD.unpack(header)
+                data = gz.read(length)
+                if len(data) < length:
+                    return
+                yield received_at, data.decode("utf-8")
+        except (EOFError, zlib.error, gzip.BadGzipFile):
+            logger.warning(f"Capture file {path} is truncated, stopping at the last complete record.")
+
+def read_capture_set(path: str) -> Iterator[Tuple[float, str]]:
+    """Yield the records of a rotated capture set in receive order."""
+    for name in capture_files(path):
+        yield from read_capture(name)
@@ -0,0 +1,103 @@
+import logging
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+class Conflator:
+    """
+    Collapses bursts of state_changed events per entity.
+    Within a window only the latest event of each entity is kept; `flush()` (called
+    once per window) delivers it, annotated with the number of updates it replaced
+    under the "conflated" key.
+
+    Priority events are never collapsed: events without an entity_id (knx_event,
+    watchdog heartbeats) are delivered immediately. `is_priority` is only asked when an
+    update would collapse a pending one: a priority update is delivered immediately
+    (replacing the pending one), and a pending priority update is delivered instead of
+    being replaced.
+    """
+    def __init__(self, callback: Callable[[dict], None], is_priority: Optional[Callable[[dict], bool]] = None):
+        self.callback = callback
+        self.is_priority = is_priority
+        # entity_id -> [latest event, number of collapsed updates, priority (None until asked)]
+        self._pending: "OrderedDict[str, List]" = OrderedDict()
+
+        # Counters
+        self.received = 0
+        self.delivered = 0
+        self.collapsed = 0
+        self.priority = 0
+
+    def offer(self, data: dict):
+        """Accept an event from the ingestion pipeline."""
+        self.received += 1
+        event = data.get("event", {})
+        entity_id = event.get("data", {}).get("entity_id")
+
+        if event.get("event_type") != "state_changed" or not entity_id:
+            self._deliver(data)
+            return
+
+        pending = self._pending.get(entity_id)
+        if pending is None:
+            self._pending[entity_id] = [data, 0, None]
+            return
+
+        if self._priority(pending):
+            # The pending update must not be collapsed: deliver it now, the new one waits
+            self.priority += 1
+            del self._pending[entity_id]
+            self._deliver_pending(pending)
+            self._pending[entity_id] = [data, 0, None]
+            return
+        if self.is_priority is not None and self.is_priority(data):
+            self.priority += 1
+            del self._pending[entity_id]
+            self.collapsed += 1
+            data["conflated"] = pending[1] + 1
+            self._deliver(data)
+            return
+
+        pending[0] = data
+        pending[1] += 1
+        pending[2] = False
+        self.collapsed += 1
+
+    def _priority(self, pending: List) -> bool:
+        if pending[2] is None:
+            pending[2] = self.is_priority is not None and bool(self.is_priority(pending[0]))
+        return pending[2]
+
+    def flush(self) -> int:
+        """Deliver the latest pending event of every entity. Returns the number delivered."""
+        pending, self._pending = self._pending, OrderedDict()
+        for entry in pending.values():
+            self._deliver_pending(entry)
+        return len(pending)
+
+    def _deliver_pending(self, pending: List):
+        data, collapsed = pending[0], pending[1]
+        if collapsed:
+            data["conflated"] = collapsed
+        self._deliver(data)
+
+    def _deliver(self, data: dict):
+        self.delivered += 1
+        try:
+            self.callback(data)
+        except Exception as e:
+            logger.error(f"Error in message callback: {e}")
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": self.pending,
+            "received": self.received,
+            "delivered": self.delivered,
+            "collapsed": self.collapsed,
+            "priority": self.priority,
+        }
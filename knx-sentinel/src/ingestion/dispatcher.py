@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import zlib
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def event_key(data: dict) -> str:
+    """Partition key of an event: its entity_id, or the KNX destination for knx_event."""
+    event_data = data.get("event", {}).get("data", {})
+    return event_data.get("entity_id") or event_data.get("destination") or ""
+
+class _Partition:
+    """
+    FIFO of pending events for one worker.
+    Entries are [key, data, priority] so they can be conflated in place; priority is
+    None until a shed or conflate decision needs it.
+    """
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.entries: Deque[List[Any]] = deque()
+        self.latest: Dict[str, List[Any]] = {}
+        self.cond = asyncio.Condition()
+
+class EventDispatcher:
+    """
+    Bounded pipeline between HomeAssistantClient and the message callback.
+    Events are partitioned by entity_id (crc32) across N workers, so each entity is
+    always handled by the same worker and keeps its order.
+
+    Overflow policies when a partition is full:
+    - "block": wait for room (applies backpressure to the websocket reader).
+    - "drop_oldest": discard the oldest queued event of the partition.
+    - "conflate": an event for an entity that is already queued replaces the queued one
+      (keeping its position); events for other entities, or without a key, wait for room.
+
+    Load shedding is priority-aware: events for which `is_priority` returns True are
+    never dropped or conflated away. If only priority events are queued, the producer waits.
+    `is_priority` is only called when a partition is full, never on the normal path.
+    """
+    OVERFLOW_POLICIES = ("block", "drop_oldest", "conflate")
+
+    def __init__(self, callback: Callable[[dict], None], workers: int = 2, maxsize: int = 10000,
+                 overflow: str = "block", key_func: Callable[[dict], str] = event_key,
+                 is_priority: Optional[Callable[[dict], bool]] = None):
+        if overflow not in self.OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.callback = callback
+        self.workers = max(1, workers)
+        self.maxsize = max(1, maxsize)
+        self.overflow = overflow
+        self.key_func = key_func
+        self.is_priority = is_priority
+
+        per_partition = -(-self.maxsize // self.workers)
+        self._partitions = [_Partition(per_partition) for _ in range(self.workers)]
+        self._tasks: List[asyncio.Task] = []
+        self._running = False
+
+        # Counters
+        self.received = 0
+        self.processed = 0
+        self.dropped = 0
+        self.conflated = 0
+        self.errors = 0
+
+    def start(self):
+        """Start the worker tasks (must be called from the running loop)."""
+        if self._running:
+            return
+        self._running = True
+        self._tasks = [asyncio.create_task(self._worker(p)) for p in self._partitions]
+
+    async def stop(self, drain: bool = True):
+        """Stop the workers, optionally processing what is still queued first."""
+        if drain:
+            for p in self._partitions:
+                while p.entries:
+                    self._run(self._pop(p))
+        self._running = False
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, data: dict):
+        """Queue an event, applying the overflow policy if its partition is full."""
+        key = self.key_func(data)
+        p = self._partitions[zlib.crc32(key.encode()) % self.workers]
+        self.received += 1
+        entry = [key, data, None]
+
+        async with p.cond:
+            if len(p.entries) >= p.maxsize:
+                if self.overflow == "conflate" and key:
+                    # Events without a key (no entity_id or destination) are never merged
+                    queued = p.latest.get(key)
+                    if queued is not None and not self._priority(queued) and not self._priority(entry):
+                        queued[1] = data
+                        self.conflated += 1
+                        return
+                if self.overflow == "drop_oldest" and self._drop_oldest(p):
+                    self.dropped += 1
+                    if self.dropped % 1000 == 1:
+                        logger.warning(f"Ingestion queue full, dropping oldest events (dropped={self.dropped})")
+                else:
+                    await p.cond.wait_for(lambda: len(p.entries) < p.maxsize)
+
+            p.entries.append(entry)
+            p.latest[key] = entry
+            p.cond.notify_all()
+
+    async def _worker(self, p: _Partition):
+        while self._running:
+            async with p.cond:
+                await p.cond.wait_for(lambda: p.entries)
+                data = self._pop(p)
+                p.cond.notify_all()
+            self._run(data)
+            # Yield so a busy partition cannot starve the websocket reader
+            await asyncio.sleep(0)
+
+    def _priority(self, entry: List[Any]) -> bool:
+        """Priority of a queued entry, evaluated on first use."""
+        if entry[2] is None:
+            entry[2] = bool(self.is_priority and self.is_priority(entry[1]))
+        return entry[2]
+
+    def _drop_oldest(self, p: _Partition) -> bool:
+        """Remove the oldest non-priority entry. Returns False if every entry is priority."""
+        for i, entry in enumerate(p.entries):
+            if not self._priority(entry):
+                del p.entries[i]
+                if p.latest.get(entry[0]) is entry:
+                    del p.latest[entry[0]]
+                return True
+        return False
+
+    @staticmethod
+    def _pop(p: _Partition) -> dict:
+        entry = p.entries.popleft()
+        if p.latest.get(entry[0]) is entry:
+            del p.latest[entry[0]]
+        return entry[1]
+
+    def _run(self, data: dict):
+        try:
+            self.callback(data)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"Error in message callback: {e}")
+        self.processed += 1
+
+    @property
+    def depth(self) -> int:
+        return sum(len(p.entries) for p in self._partitions)
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth and counters."""
+        return {
+            "depth": self.depth,
+            "received": self.received,
+            "processed": self.processed,
+            "dropped": self.dropped,
+            "conflated": self.conflated,
+            "errors": self.errors,
+        }
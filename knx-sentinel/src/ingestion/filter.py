@@ -1,22 +1,36 @@
-from typing import List, Set
+from collections import OrderedDict
+from typing import List, Optional, Pattern, Set
 import fnmatch
+import re
 
 class FilterManager:
     """
     Manages the list of entities to be monitored.
     Filters incoming state_changed events to reject high-volume noise.
+
+    Glob decisions are cached in an LRU of `cache_size` entity_ids. Size it above the
+    number of distinct entity_ids seen (a thrashing LRU costs more than the regex
+    match it saves), or set 0 to always match against the combined regex.
     """
-    def __init__(self, target_entities: List[str] = None):
+    DEFAULT_CACHE_SIZE = 4096
+
+    def __init__(self, target_entities: List[str] = None, cache_size: int = DEFAULT_CACHE_SIZE):
         self.target_patterns: Set[str] = set(target_entities) if target_entities else set()
         self.exact_matches: Set[str] = set()
         self.glob_patterns: Set[str] = set()
+        self.cache_size = cache_size
+
+        # All globs compiled into one alternation, plus a bounded LRU of decisions
+        self._glob_regex: Optional[Pattern] = None
+        self._cache: "OrderedDict[str, bool]" = OrderedDict()
         
         self._compile_patterns()
 
     def _compile_patterns(self):
-        """Separate exact matches from glob patterns for optimization."""
+        """Separate exact matches from glob patterns and compile the globs into one regex."""
         self.exact_matches.clear()
         self.glob_patterns.clear()
+        self._cache.clear()
         
         for p in self.target_patterns:
             if '*' in p or '?' in p or '[' in p:
@@ -24,27 +38,48 @@ class FilterManager:
             else:
                 self.exact_matches.add(p)
 
+        if self.glob_patterns:
+            # Sorted for a deterministic alternation order
+            combined = "|".join(fnmatch.translate(p) for p in sorted(self.glob_patterns))
+            self._glob_regex = re.compile(combined)
+        else:
+            self._glob_regex = None
+
     def update_targets(self, new_targets: List[str]):
-        """Update the list of monitored entities."""
+        """Update the list of monitored entities. Invalidates the decision cache."""
         self.target_patterns = set(new_targets)
         self._compile_patterns()
 
     def should_process(self, entity_id: str) -> bool:
         """
         Determine if an entity should be processed.
-        O(1) lookups for exact matches.
-        O(N) for glob patterns (where N is number of patterns).
+        Repeat entities are a single cache hit. Misses cost one set lookup
+        plus one match against the combined glob regex.
         """
         if not entity_id:
             return False
+        if not self.cache_size or self._glob_regex is None:
+            # Exact matches only (one set lookup) or caching disabled
+            return self._match(entity_id)
 
+        decision = self._cache.get(entity_id)
+        if decision is not None:
+            self._cache.move_to_end(entity_id)
+            return decision
+
+        decision = self._match(entity_id)
+        self._cache[entity_id] = decision
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return decision
+
+    def _match(self, entity_id: str) -> bool:
         # Fast path: exact match
         if entity_id in self.exact_matches:
             return True
 
-        # Slow path: glob patterns
-        for pattern in self.glob_patterns:
-            if fnmatch.fnmatch(entity_id, pattern):
-                return True
-                
+        # Slow path: combined glob regex
+        if self._glob_regex is not None and self._glob_regex.match(entity_id):
+            return True
+
         return False
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).isoformat()
+
+def _state_time(item: dict) -> Optional[float]:
+    """Timestamp of a history item, compressed ("lu"/"lc" epoch) or full ("last_updated" ISO) format."""
+    ts = item.get("lu", item.get("lc"))
+    if ts is not None:
+        return float(ts)
+    ts = item.get("last_updated", item.get("last_changed"))
+    if ts is None:
+        return None
+    return datetime.fromisoformat(ts.replace("Z", "+00:00")).timestamp()
+
+def parse_history(items: List[dict], end_time: Optional[float] = None) -> List[Any]:
+    """
+    Raw states of an entity's history, oldest first. Items at or after `end_time`
+    are dropped (they are delivered as live events).
+    """
+    timed = []
+    for item in items or ():
+        ts = _state_time(item)
+        if ts is None or (end_time is not None and ts >= end_time):
+            continue
+        timed.append((ts, item.get("s", item.get("state"))))
+    timed.sort(key=lambda t: t[0])
+    return [state for _, state in timed]
+
+class HistorySeeder:
+    """
+    Startup stage filling the kernel windows from Home Assistant's recorder, so anomaly
+    detection does not start on empty windows (fresh install, new entities).
+
+    History is fetched with `history/history_during_period` over the websocket, in chunks of
+    `chunk_size` entities with at most `concurrency` requests in flight, and handed to
+    `on_seed` in one batch once every chunk is in. A failed chunk is logged and skipped.
+    """
+    CHUNK_SIZE = 25
+
+    def __init__(self, on_seed: Callable[[Dict[str, List[Any]]], int], lookback: float = 6 * 3600,
+                 concurrency: int = 4, chunk_size: int = CHUNK_SIZE, clock: Callable[[], float] = time.time):
+        """
+        :param on_seed: Called with {entity_id: [raw state, ...]} (oldest first); returns the number of entities seeded
+        :param lookback: Seconds of history to fetch
+        """
+        self.on_seed = on_seed
+        self.lookback = lookback
+        self.concurrency = max(1, concurrency)
+        self.chunk_size = max(1, chunk_size)
+        self.clock = clock
+
+        self.requests = 0
+        self.failed = 0
+        self.entities = 0
+        self.samples = 0
+        self.seeded = 0
+        self.duration_ms = 0.0
+
+    async def fetch(self, request: Callable[..., Awaitable[Any]], entity_ids: List[str],
+                    end_time: float) -> Dict[str, List[Any]]:
+        """
+        :param request: Sends a websocket command and returns its result (HomeAssistantClient._request)
+        :param end_time: Epoch seconds; later states are left to the live stream
+        """
+        semaphore = asyncio.Semaphore(self.concurrency)
+        start_iso, end_iso = _iso(end_time - self.lookback), _iso(end_time)
+        history: Dict[str, List[Any]] = {}
+
+        async def fetch_chunk(chunk: List[str]):
+            async with semaphore:
+                self.requests += 1
+                try:
+                    result = await request(
+                        "history/history_during_period",
+                        start_time=start_iso,
+                        end_time=end_iso,
+                        entity_ids=chunk,
+                        minimal_response=True,
+                        no_attributes=True,
+                        significant_changes_only=False
+                    )
+                except Exception as e:
+                    self.failed += 1
+                    logger.warning(f"History request for {len(chunk)} entities failed: {e}")
+                    return
+            for entity_id, items in (result or {}).items():
+                states = parse_history(items, end_time)
+                if states:
+                    history[entity_id] = states
+
+        chunks = [entity_ids[i:i + self.chunk_size] for i in range(0, len(entity_ids), self.chunk_size)]
+        await asyncio.gather(*(fetch_chunk(chunk) for chunk in chunks))
+        return history
+
+    async def run(self, request: Callable[..., Awaitable[Any]], entity_ids: List[str],
+                  end_time: Optional[float] = None) -> int:
+        """Fetch the history of `entity_ids` and seed it. :return: Number of entities seeded"""
+        start = time.perf_counter()
+        end_time = self.clock() if end_time is None else end_time
+        history = await self.fetch(request, list(entity_ids), end_time)
+        self.entities = len(history)
+        self.samples = sum(len(states) for states in history.values())
+        self.seeded = self.on_seed(history)
+        self.duration_ms = round((time.perf_counter() - start) * 1000, 1)
+        logger.info(f"History seeding: {self.seeded} windows from {self.samples} states of "
+                    f"{self.entities}/{len(entity_ids)} entities in {self.duration_ms}ms "
+                    f"({self.requests} requests, {self.failed} failed)")
+        return self.seeded
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "failed": self.failed,
+            "entities": self.entities,
+            "samples": self.samples,
+            "seeded": self.seeded,
+            "duration_ms": self.duration_ms,
+        }
@@ -3,26 +3,85 @@ import aiohttp
 import json
 import logging
 import os
-from typing import Callable, Optional
+import re
+import time
+from typing import Callable, Dict, List, Optional, Set
+from src.common import json_codec
+from src.ingestion.capture import CaptureWriter
+from src.ingestion.dispatcher import EventDispatcher
 from src.ingestion.filter import FilterManager
+from src.ingestion.history import HistorySeeder
 
 logger = logging.getLogger(__name__)
 
+# Raw-frame pre-filter: an event frame has "type": "event" among its top-level keys
+# (before the first nested object), and its first "entity_id" is the event's entity.
+_EVENT_FRAME_RE = re.compile(r'^\s*\{[^{}]*"type"\s*:\s*"event"')
+_ENTITY_ID_RE = re.compile(r'"entity_id"\s*:\s*"([^"\\]*)"')
+
 class HomeAssistantClient:
     """
     Async WebSocket client for Home Assistant.
     Maintains persistent connection and subscribes to events.
+
+    Ingestion modes:
+    - "all": subscribe to every state_changed event and filter locally.
+    - "targeted": resolve the filter against `get_states` and subscribe only to the
+      matching entities (state trigger), re-resolving when entities are added.
+
+    With a history seeder, the first connection seeds the kernel windows from the recorder
+    after subscribing; live events received meanwhile are held and delivered in order afterwards.
     """
-    def __init__(self, supervisor_url: str, token: str, on_message: Callable[[dict], None], filter_manager: FilterManager = None):
+    INGESTION_MODES = ("all", "targeted")
+
+    def __init__(self, supervisor_url: str, token: str, on_message: Callable[[dict], None], filter_manager: FilterManager = None,
+                 ingestion_mode: str = "all", command_timeout: float = 30.0, prefilter: bool = True,
+                 dispatcher: Optional[EventDispatcher] = None, capture: Optional[CaptureWriter] = None,
+                 history_seeder: Optional[HistorySeeder] = None):
+        if ingestion_mode not in self.INGESTION_MODES:
+            raise ValueError(f"Unknown ingestion mode: {ingestion_mode}")
+        if ingestion_mode == "targeted" and filter_manager is None:
+            raise ValueError("Targeted ingestion requires a filter manager")
         self.url = supervisor_url
         self.token = token
         self.on_message_callback = on_message
         self.filter_manager = filter_manager
+        self.ingestion_mode = ingestion_mode
+        self.command_timeout = command_timeout
+        self.prefilter = prefilter
+        self.dispatcher = dispatcher
+        # Raw frame recorder for offline replay (see benchmarks/replay.py)
+        self.capture = capture
+        self.history_seeder = history_seeder
         self.session: Optional[aiohttp.ClientSession] = None
         self.ws: Optional[aiohttp.ClientWebSocketResponse] = None
         self._shutdown = False
         self.message_id = 1
 
+        # Counters: raw frames, frames dropped by the raw pre-filter, events rejected by the
+        # filter after decoding, events handed to the dispatcher/callback
+        self.frames_received = 0
+        self.frames_rejected = 0
+        self.events_filtered = 0
+        self.events_delivered = 0
+
+        # Command results awaited by id (get_states, subscriptions)
+        self._pending: Dict[int, asyncio.Future] = {}
+
+        # Targeted mode state (per connection)
+        self.targeted_entities: Set[str] = set()
+        self._trigger_sub_id: Optional[int] = None
+        self._trigger_sub_ids: Set[int] = set()
+        self._registry_sub_id: Optional[int] = None
+        self._resolve_lock = asyncio.Lock()
+
+        # History seeding: live state changes held while it runs (None when not holding),
+        # for the entities being seeded (None until known: all of them)
+        self._held: Optional[List[dict]] = None
+        self._seed_entities: Optional[Set[str]] = None
+        self._hold_started = 0.0
+        self._seeded = False
+
     async def check_token_via_rest(self) -> bool:
         """Diagnostic: Check if token works for REST API."""
         api_url = self.url.replace("ws://", "http://").replace("/websocket", "/api/")
@@ -70,6 +129,7 @@ class HomeAssistantClient:
             except Exception as e:
                 logger.exception("Unexpected error in WebSocket loop")
             finally:
+                self._fail_pending()
                 if not self._shutdown:
                     logger.info(f"Retrying in {retry_delay} seconds...")
                     await asyncio.sleep(retry_delay)
@@ -79,12 +139,31 @@ class HomeAssistantClient:
         """Process incoming WebSocket messages."""
         async for msg in self.ws:
             if msg.type == aiohttp.WSMsgType.TEXT:
-                data = json.loads(msg.data)
+                self.frames_received += 1
+                if self.capture is not None:
+                    self.capture.write(msg.data)
+                if self.prefilter and self._reject_raw(msg.data):
+                    self.frames_rejected += 1
+                    continue
+                data = json_codec.loads(msg.data)
                 await self._process_frame(data)
             elif msg.type == aiohttp.WSMsgType.ERROR:
                 logger.error("WebSocket connection closed with error")
                 break
 
+    def _reject_raw(self, raw: str) -> bool:
+        """
+        Decide from the raw frame text whether an event can be dropped without decoding it.
+        Only event frames carrying an entity_id the filter rejects are dropped; anything
+        else (results, auth, knx_event without entity_id) goes through the full decode.
+        """
+        if self.filter_manager is None or not _EVENT_FRAME_RE.match(raw):
+            return False
+        match = _ENTITY_ID_RE.search(raw)
+        if match is None:
+            return False
+        return not self.filter_manager.should_process(match.group(1))
+
     async def _process_frame(self, data: dict):
         """Handle protocol specific messages (auth, events)."""
         msg_type = data.get("type")
@@ -98,7 +177,18 @@ class HomeAssistantClient:
             
         elif msg_type == "auth_ok":
             logger.info("Authentication successful.")
-            await self._subscribe_events()
+            seed = self.history_seeder is not None and not self._seeded and self._held is None
+            if seed:
+                # History up to now is seeded; what happens from here on arrives live and is held
+                self._held = []
+                self._hold_started = time.time()
+            if self.ingestion_mode == "targeted":
+                # Runs as a task: it awaits command results delivered by this receive loop
+                asyncio.create_task(self._subscribe_targeted(seed))
+            else:
+                await self._subscribe_events()
+                if seed:
+                    asyncio.create_task(self._seed_history())
             
         elif msg_type == "auth_invalid":
             message = data.get("message", "No message provided")
@@ -107,23 +197,70 @@ class HomeAssistantClient:
             # Fatal error, but for robustness we might retry or exit. 
             # self._shutdown = True 
             
+        elif msg_type == "result":
+            future = self._pending.pop(data.get("id"), None)
+            if future is not None and not future.done():
+                if data.get("success", False):
+                    future.set_result(data.get("result"))
+                else:
+                    error = data.get("error", {})
+                    future.set_exception(RuntimeError(f"Command failed: {error.get('message', error)}"))
+
         elif msg_type == "event":
-            event_data = data.get("event", {})
-            entity_id = event_data.get("data", {}).get("entity_id")
-            
-            # Apply filter if set
-            if self.filter_manager and entity_id:
-                if not self.filter_manager.should_process(entity_id):
-                    return # Skip this event
-            
-            if self.on_message_callback:
-                # Dispatch to callback (non-blocking if possible)
-                asyncio.create_task(self._safe_callback(data))
+            data = self._route_event(data)
+            if data is None:
+                return
+            if self._held is not None and self._holds(data, self._seed_entities):
+                # History seeding in progress: delivered once the windows are seeded
+                self._held.append(data)
+                return
+            await self._deliver(data)
                 
         else:
             # Handle command results etc.
             pass
 
+    async def _deliver(self, data: dict):
+        self.events_delivered += 1
+        if self.dispatcher is not None:
+            # Bounded queue; may wait here when full, pausing the reader (backpressure)
+            await self.dispatcher.put(data)
+        elif self.on_message_callback:
+            # Dispatch to callback (non-blocking if possible)
+            asyncio.create_task(self._safe_callback(data))
+
+    def _route_event(self, data: dict) -> Optional[dict]:
+        """
+        Turn an event frame into the state_changed/knx_event message to deliver,
+        or None if it is consumed here (registry updates) or rejected by the filter.
+        """
+        sub_id = data.get("id")
+        if sub_id is not None and sub_id == self._registry_sub_id:
+            self._on_registry_updated(data.get("event", {}).get("data", {}))
+            return None
+        if sub_id is not None and sub_id in self._trigger_sub_ids:
+            data = self._trigger_to_state_changed(data)
+            if data is None:
+                return None
+
+        event_data = data.get("event", {})
+        entity_id = event_data.get("data", {}).get("entity_id")
+
+        # Apply filter if set
+        if self.filter_manager and entity_id:
+            if not self.filter_manager.should_process(entity_id):
+                self.events_filtered += 1
+                return None # Skip this event
+        return data
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "frames": self.frames_received,
+            "prefiltered": self.frames_rejected,
+            "filtered": self.events_filtered,
+            "delivered": self.events_delivered,
+        }
+
     async def _safe_callback(self, data):
         try:
             self.on_message_callback(data)
@@ -138,12 +275,173 @@ class HomeAssistantClient:
         await self._send_command("subscribe_events", event_type="knx_event")
         logger.info("Subscribed to state_changed and knx_event.")
 
-    async def _send_command(self, type_str: str, **kwargs):
-        """Send a JSON command with monotonic ID."""
+    async def _subscribe_targeted(self, seed: bool = False):
+        """
+        Subscribe to knx_event plus state triggers for the entities matched by the filter,
+        then seed their history if asked to.
+        """
+        try:
+            await self._send_command("subscribe_events", event_type="knx_event")
+            self._registry_sub_id = self.message_id
+            await self._send_command("subscribe_events", event_type="entity_registry_updated")
+            await self._resolve_targets()
+        except Exception as e:
+            logger.error(f"Targeted subscription failed: {e}")
+        if seed:
+            await self._seed_history()
+
+    async def _seed_history(self):
+        """Seed the kernel windows from the recorder, then deliver the events held meanwhile."""
+        try:
+            if self.ingestion_mode == "targeted":
+                entities = sorted(self.targeted_entities)
+            else:
+                states = await self._request("get_states")
+                entities = [s["entity_id"] for s in states or [] if s.get("entity_id") and
+                            (self.filter_manager is None or self.filter_manager.should_process(s["entity_id"]))]
+            await self._release_unseeded(set(entities))
+            await self.history_seeder.run(self._request, entities, end_time=self._hold_started)
+            self._seeded = True
+        except Exception as e:
+            logger.error(f"History seeding failed: {e}")
+        finally:
+            await self._release_held()
+
+    @staticmethod
+    def _holds(data: dict, entities: Optional[Set[str]]) -> bool:
+        """
+        Whether an event waits for history seeding: only state changes feed the windows.
+        knx_event (watchdog heartbeats) is never held, so seeding cannot cause false timeouts.
+        """
+        event = data.get("event", {})
+        if event.get("event_type") != "state_changed":
+            return False
+        return entities is None or event.get("data", {}).get("entity_id") in entities
+
+    async def _release_unseeded(self, entities: Set[str]):
+        """Once the seeded entities are known, deliver (in order) what was held for the others."""
+        while True:
+            release = [d for d in self._held if not self._holds(d, entities)]
+            if not release:
+                break
+            self._held = [d for d in self._held if self._holds(d, entities)]
+            for data in release:
+                await self._deliver(data)
+        # No await since the last check: events of other entities can now bypass the hold in order
+        self._seed_entities = entities
+
+    async def _release_held(self):
+        # Events arriving while the held ones are delivered are appended and delivered in turn
+        while self._held:
+            held, self._held = self._held, []
+            for data in held:
+                await self._deliver(data)
+        self._held = None
+        self._seed_entities = None
+
+    async def _resolve_targets(self, extra: List[str] = ()):
+        """
+        Resolve the filter against the current states and (re)subscribe to the result.
+        The new subscription is made before the old one is dropped so no change is missed.
+        """
+        async with self._resolve_lock:
+            states = await self._request("get_states")
+            entities = {s.get("entity_id") for s in states or []}
+            entities.update(extra)
+            matched = {e for e in entities if self.filter_manager.should_process(e)}
+
+            if self._trigger_sub_id is not None and matched == self.targeted_entities:
+                return
+
+            old_sub = self._trigger_sub_id
+            if matched:
+                # Register the id before sending so no trigger event can arrive unrecognized
+                self._trigger_sub_id = self.message_id
+                self._trigger_sub_ids.add(self._trigger_sub_id)
+                await self._send_command(
+                    "subscribe_trigger",
+                    trigger={"platform": "state", "entity_id": sorted(matched)}
+                )
+            else:
+                self._trigger_sub_id = None
+            self.targeted_entities = matched
+
+            if old_sub is not None:
+                await self._send_command("unsubscribe_events", subscription=old_sub)
+                self._trigger_sub_ids.discard(old_sub)
+            logger.info(f"Targeted ingestion: subscribed to {len(matched)} of {len(entities)} entities.")
+
+    def _on_registry_updated(self, event_data: dict):
+        """Re-resolve the targeted subscription when a matching entity is created or renamed."""
+        if event_data.get("action") not in ("create", "update"):
+            return
+        entity_id = event_data.get("entity_id")
+        if not entity_id or entity_id in self.targeted_entities:
+            return
+        if not self.filter_manager.should_process(entity_id):
+            return
+        logger.info(f"Targeted ingestion: new entity {entity_id}, re-resolving.")
+        asyncio.create_task(self._safe_resolve([entity_id]))
+
+    async def _safe_resolve(self, extra: List[str]):
+        try:
+            await self._resolve_targets(extra)
+        except Exception as e:
+            logger.error(f"Failed to re-resolve targeted entities: {e}")
+
+    @staticmethod
+    def _trigger_to_state_changed(data: dict) -> Optional[dict]:
+        """Translate a state trigger event into the state_changed shape used downstream."""
+        trigger = data.get("event", {}).get("variables", {}).get("trigger", {})
+        entity_id = trigger.get("entity_id")
+        if not entity_id:
+            return None
+        new_state = trigger.get("to_state")
+        return {
+            "id": data.get("id"),
+            "type": "event",
+            "event": {
+                "event_type": "state_changed",
+                "data": {
+                    "entity_id": entity_id,
+                    "old_state": trigger.get("from_state"),
+                    "new_state": new_state,
+                },
+                "origin": "LOCAL",
+                "time_fired": (new_state or {}).get("last_updated"),
+                "context": data.get("event", {}).get("context"),
+            }
+        }
+
+    async def _send_command(self, type_str: str, **kwargs) -> int:
+        """Send a JSON command with monotonic ID. Returns the ID used."""
         start_id = self.message_id
         self.message_id += 1
         payload = {"id": start_id, "type": type_str, **kwargs}
         await self.ws.send_json(payload)
+        return start_id
+
+    async def _request(self, type_str: str, **kwargs):
+        """Send a command and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        cmd_id = self.message_id
+        self._pending[cmd_id] = future
+        try:
+            await self._send_command(type_str, **kwargs)
+            return await asyncio.wait_for(future, timeout=self.command_timeout)
+        finally:
+            self._pending.pop(cmd_id, None)
+
+    def _fail_pending(self):
+        """Fail outstanding command futures and reset per-connection subscriptions."""
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(ConnectionError("WebSocket connection closed"))
+        self._pending.clear()
+        self._trigger_sub_id = None
+        self._trigger_sub_ids.clear()
+        self._registry_sub_id = None
+        self.targeted_entities = set()
 
     async def close(self):
         self._shutdown = True
@@ -1,34 +1,234 @@
-from collections import deque
-from typing import List, Optional
+import sys
+from array import array
+from typing import Callable, Dict, List, Optional, Sequence
 
 class BufferManager:
     """
-    Optimized buffer manager using collections.deque for sliding window operations.
-    Provides O(1) appends and pops.
+    Fixed-size ring buffer of floats backed by a preallocated array('d')
+    (8 bytes per sample instead of a boxed float per deque slot).
+    Provides O(1) appends with eviction of the oldest value.
     """
+    __slots__ = ("_data", "_head", "_count", "_maxlen")
+
     def __init__(self, maxlen: int = 60):
         """
         Initialize the buffer.
         :param maxlen: Maximum size of the buffer (default 60 for 1-minute of 1s samples)
         """
-        self._buffer = deque(maxlen=maxlen)
+        self._data = array('d', bytes(8 * maxlen))
+        self._head = 0
+        self._count = 0
+        self._maxlen = maxlen
 
-    def add(self, value: float) -> None:
-        """Add a new value to the buffer, automatically evicting old ones."""
-        self._buffer.append(value)
+    def add(self, value: float) -> Optional[float]:
+        """
+        Add a new value to the buffer, automatically evicting old ones.
+        :return: The evicted value if the buffer was full, else None
+        """
+        head = self._head
+        evicted = self._data[head] if self._count == self._maxlen else None
+        self._data[head] = value
+        self._head = head + 1 if head + 1 < self._maxlen else 0
+        if evicted is None:
+            self._count += 1
+        return evicted
 
     def get_all(self) -> List[float]:
-        """Return all current values in the buffer."""
-        return list(self._buffer)
+        """Return all current values in the buffer, oldest first."""
+        if self._count < self._maxlen:
+            return self._data[:self._count].tolist()
+        head = self._head
+        return self._data[head:].tolist() + self._data[:head].tolist()
 
     def is_full(self) -> bool:
         """Check if buffer has reached capacity."""
-        return len(self._buffer) == self._buffer.maxlen
+        return self._count == self._maxlen
 
     def clear(self) -> None:
         """Empty the buffer."""
-        self._buffer.clear()
+        self._head = 0
+        self._count = 0
+
+    def load(self, values: Sequence[float]) -> None:
+        """Replace the contents with `values` (oldest first; only the last `maxlen` are kept)."""
+        values = values[-self._maxlen:]
+        n = len(values)
+        self._data[:n] = array('d', values)
+        self._head = n % self._maxlen
+        self._count = n
+
+    @property
+    def size(self) -> int:
+        return self._count
+
+    @property
+    def maxlen(self) -> int:
+        return self._maxlen
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the buffer and its samples."""
+        return sys.getsizeof(self) + sys.getsizeof(self._data)
+
+class WindowStore:
+    """
+    Columnar ring buffer store shared by many entities.
+    All windows live in one preallocated float64 array (row-major, one row of
+    `window_size` slots per entity) with per-row head pointer and count, instead
+    of one deque of boxed floats per entity. Rows fill from slot 0, so a row that
+    is not yet full holds its samples in slots [0, count).
+    """
+    def __init__(self, window_size: int = 60, capacity: int = 256):
+        """
+        :param window_size: Number of samples per entity window
+        :param capacity: Number of rows preallocated up front (doubles when exhausted)
+        """
+        self.window_size = window_size
+        self.capacity = 0
+        self.data = array('d')
+        self.heads = array('l')
+        self.counts = array('l')
+        self.rows: Dict[str, int] = {}
+        self._free_rows: List[int] = []
+        # Called with the row index when a row is released (per-row caches drop it)
+        self.on_release: List[Callable[[int], None]] = []
+        self._grow(max(1, capacity))
+
+    def _grow(self, new_capacity: int) -> None:
+        extra = new_capacity - self.capacity
+        self.data.extend(array('d', [0.0]) * (extra * self.window_size))
+        self.heads.extend([0] * extra)
+        self.counts.extend([0] * extra)
+        self._free_rows.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.capacity = new_capacity
+
+    def row(self, entity_id: str) -> int:
+        """Return the row index for an entity, allocating one if needed."""
+        row = self.rows.get(entity_id)
+        if row is None:
+            if not self._free_rows:
+                self._grow(self.capacity * 2)
+            row = self._free_rows.pop()
+            self.heads[row] = 0
+            self.counts[row] = 0
+            self.rows[entity_id] = row
+        return row
+
+    def release(self, entity_id: str) -> None:
+        """Free the row of an entity so it can be reused."""
+        row = self.rows.pop(entity_id, None)
+        if row is not None:
+            self.heads[row] = 0
+            self.counts[row] = 0
+            self._free_rows.append(row)
+            for callback in self.on_release:
+                callback(row)
+
+    def add(self, row: int, value: float) -> Optional[float]:
+        """
+        Append a value to a row, evicting the oldest one when full.
+        :return: The evicted value if the row was full, else None
+        """
+        w = self.window_size
+        head = self.heads[row]
+        idx = row * w + head
+        evicted = self.data[idx] if self.counts[row] == w else None
+        self.data[idx] = value
+        self.heads[row] = head + 1 if head + 1 < w else 0
+        if evicted is None:
+            self.counts[row] += 1
+        return evicted
+
+    def values(self, row: int) -> List[float]:
+        """Return the values of a row, oldest first."""
+        w = self.window_size
+        base = row * w
+        count = self.counts[row]
+        if count < w:
+            return self.data[base:base + count].tolist()
+        head = self.heads[row]
+        return self.data[base + head:base + w].tolist() + self.data[base:base + head].tolist()
+
+    def clear(self, row: int) -> None:
+        self.heads[row] = 0
+        self.counts[row] = 0
+
+    def load(self, row: int, values: Sequence[float]) -> None:
+        """Replace the values of a row (oldest first; only the last `window_size` are kept)."""
+        w = self.window_size
+        values = values[-w:]
+        n = len(values)
+        base = row * w
+        self.data[base:base + n] = array('d', values)
+        self.heads[row] = n % w
+        self.counts[row] = n
+
+    def copy(self) -> "WindowStore":
+        """Detached copy (same rows), e.g. to serialize the windows off the event loop."""
+        clone = WindowStore.__new__(WindowStore)
+        clone.window_size = self.window_size
+        clone.capacity = self.capacity
+        clone.data = self.data[:]
+        clone.heads = self.heads[:]
+        clone.counts = self.counts[:]
+        clone.rows = dict(self.rows)
+        clone._free_rows = list(self._free_rows)
+        clone.on_release = []
+        return clone
+
+    def view(self, entity_id: str) -> "WindowView":
+        """Return a BufferManager-compatible view over the row of an entity."""
+        return WindowView(self, self.row(entity_id))
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the sample arrays."""
+        return (self.data.itemsize * len(self.data) +
+                self.heads.itemsize * len(self.heads) +
+                self.counts.itemsize * len(self.counts))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+class WindowView:
+    """
+    BufferManager-compatible view over one row of a WindowStore.
+    Lets the math engines run unchanged on top of the shared store.
+    """
+    __slots__ = ("_store", "_row")
+
+    def __init__(self, store: WindowStore, row: int):
+        self._store = store
+        self._row = row
+
+    def add(self, value: float) -> Optional[float]:
+        return self._store.add(self._row, value)
+
+    def get_all(self) -> List[float]:
+        return self._store.values(self._row)
+
+    def is_full(self) -> bool:
+        return self._store.counts[self._row] == self._store.window_size
+
+    def clear(self) -> None:
+        self._store.clear(self._row)
+
+    def load(self, values: Sequence[float]) -> None:
+        self._store.load(self._row, values)
+
+    @property
+    def row(self) -> int:
+        return self._row
 
     @property
     def size(self) -> int:
-        return len(self._buffer)
+        return self._store.counts[self._row]
+
+    @property
+    def maxlen(self) -> int:
+        return self._store.window_size
+
+    @property
+    def nbytes(self) -> int:
+        """Memory used by the view itself (the samples are accounted to the store)."""
+        return sys.getsizeof(self)
@@ -1,22 +1,60 @@
 import math
 import statistics
-from typing import Tuple, Optional, Dict
+import sys
+import time
+from datetime import datetime
+from typing import Callable, Tuple, Optional, Dict, Sequence, Union
 from src.kernel.buffer import BufferManager
+from src.kernel.skiplist import IndexableSkiplist
+
+def parse_timestamp(timestamp: Union[float, str]) -> float:
+    """Convert epoch seconds or an ISO 8601 string (HA `last_updated`) to epoch seconds."""
+    if isinstance(timestamp, str):
+        return datetime.fromisoformat(timestamp.replace("Z", "+00:00")).timestamp()
+    return float(timestamp)
+
+def zscore_result(value: float, mean: float, stdev: float, threshold: float) -> Dict[str, any]:
+    """Build the Z-Score analysis dict for a value given the window statistics."""
+    if stdev == 0:
+        return {"z_score": 0.0, "anomaly": False, "msg": "stable"}
+
+    z_score = (value - mean) / stdev
+    is_anomaly = abs(z_score) > threshold
+
+    return {
+        "z_score": round(z_score, 3),
+        "anomaly": is_anomaly,
+        "mean": round(mean, 3)
+    }
 
 class ZScoreEngine:
     """
     Anomaly detection using Standard Score (Z-Score).
     Flags values that are > 3 standard deviations from the mean.
     """
-    def __init__(self, window_size: int = 60, threshold: float = 3.0):
-        self.buffer = BufferManager(maxlen=window_size)
+    __slots__ = ("buffer", "threshold")
+
+    # Keeps a count-based window of samples (a WindowStore row when run on the shared store)
+    WINDOWED = True
+
+    def __init__(self, window_size: int = 60, threshold: float = 3.0, buffer=None):
+        """
+        :param buffer: Optional BufferManager-compatible window (e.g. a WindowStore view).
+                       Defaults to a private BufferManager of `window_size`.
+        """
+        self.buffer = buffer if buffer is not None else BufferManager(maxlen=window_size)
         self.threshold = threshold
 
-    def process(self, value: float) -> Dict[str, any]:
+    def process(self, value: float, timestamp: Optional[Union[float, str]] = None) -> Dict[str, any]:
         """
         Ingest value and return analysis.
+        :param timestamp: Sample time; unused by the count-based window engines
         :return: Dict with z_score and anomaly status
         """
+        value = float(value)
+        if not math.isfinite(value):
+            # NaN/inf would poison the window until it rolls out
+            return {"z_score": 0.0, "anomaly": False, "error": f"non-finite value {value}"}
         self.buffer.add(value)
         
         # Need at least 3 points to compute meaningful stats
@@ -27,55 +65,476 @@ class ZScoreEngine:
         try:
             mean = statistics.mean(data)
             stdev = statistics.stdev(data)
-            
-            if stdev == 0:
-                return {"z_score": 0.0, "anomaly": False, "msg": "stable"}
-
-            z_score = (value - mean) / stdev
-            is_anomaly = abs(z_score) > self.threshold
-
-            return {
-                "z_score": round(z_score, 3),
-                "anomaly": is_anomaly,
-                "mean": round(mean, 3)
-            }
+            return self._result(value, mean, stdev)
         except Exception as e:
             return {"z_score": 0.0, "anomaly": False, "error": str(e)}
 
+    def _result(self, value: float, mean: float, stdev: float) -> Dict[str, any]:
+        return zscore_result(value, mean, stdev, self.threshold)
+
+    @property
+    def samples(self) -> int:
+        """Number of samples the engine currently learns from."""
+        return self.buffer.size
+
+    def restore(self, values: Sequence[float]) -> None:
+        """
+        Refill the window with previously seen values (oldest first), e.g. from a snapshot.
+        Non-finite values (e.g. "nan" states in the recorder history) are skipped, as in process().
+        """
+        self.buffer.load([v for v in values if math.isfinite(v)])
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the engine and its window."""
+        return sys.getsizeof(self) + self.buffer.nbytes
+
+    def is_outlier(self, value: float) -> bool:
+        """
+        Check whether a value would stand out against the current window, without ingesting it.
+        The value is scored against the window as it is now (excluding the value), which is
+        stricter than process() and so never misses something process() would flag.
+        """
+        if self.buffer.size < 3:
+            return False
+        data = self.buffer.get_all()
+        return self._exceeds(value, statistics.mean(data), statistics.stdev(data))
+
+    def _exceeds(self, value: float, mean: float, stdev: float) -> bool:
+        if stdev == 0:
+            # Any change on a flat window is suspicious
+            return value != mean
+        return abs((value - mean) / stdev) > self.threshold
+
+    def outlier_bounds(self) -> Tuple[float, float]:
+        """
+        (low, high) such that is_outlier(value) is True for value < low or value > high,
+        so the check can be made elsewhere (e.g. by the parent of a kernel worker).
+        """
+        if self.buffer.size < 3:
+            return -math.inf, math.inf
+        data = self.buffer.get_all()
+        return self._band(statistics.mean(data), statistics.stdev(data))
+
+    def _band(self, center: float, scale: float) -> Tuple[float, float]:
+        # A flat window (scale 0) gives an empty band: any change stands out
+        return center - self.threshold * scale, center + self.threshold * scale
+
+class StreamingZScoreEngine(ZScoreEngine):
+    """
+    Z-Score engine with O(1) updates.
+    Keeps running Welford moments (mean, M2) that are updated as values enter
+    and leave the window, instead of recomputing mean/stdev over the whole buffer.
+    Moments are resynced from the buffer every `resync_interval` samples to bound
+    floating point drift.
+    """
+    # Relative stdev below which the window is considered flat ("stable").
+    # Running moments rarely land on exactly 0 after the window has seen variance.
+    STABLE_EPSILON = 1e-9
+
+    __slots__ = ("resync_interval", "_mean", "_m2", "_since_resync")
+
+    def __init__(self, window_size: int = 60, threshold: float = 3.0, resync_interval: Optional[int] = None, buffer=None):
+        super().__init__(window_size=window_size, threshold=threshold, buffer=buffer)
+        self.resync_interval = resync_interval or self.buffer.maxlen
+        self._mean = 0.0
+        self._m2 = 0.0
+        self._since_resync = 0
+
+    def process(self, value: float, timestamp: Optional[Union[float, str]] = None) -> Dict[str, any]:
+        """
+        Ingest value and return analysis.
+        :return: Dict with z_score and anomaly status (same shape as ZScoreEngine)
+        """
+        value = float(value)
+        if not math.isfinite(value):
+            return {"z_score": 0.0, "anomaly": False, "error": f"non-finite value {value}"}
+        evicted = self.buffer.add(value)
+        n = self.buffer.size
+
+        self._since_resync += 1
+        if self._since_resync >= self.resync_interval:
+            self._resync()
+        elif evicted is None:
+            # Window growing: plain Welford update
+            delta = value - self._mean
+            self._mean += delta / n
+            self._m2 += delta * (value - self._mean)
+        else:
+            # Window full: replace evicted value with the new one
+            old_mean = self._mean
+            self._mean += (value - evicted) / n
+            self._m2 += (value - evicted) * (value - self._mean + evicted - old_mean)
+
+        if n < 3:
+            return {"z_score": 0.0, "anomaly": False, "msg": "insufficient_data"}
+
+        return self._result(value, self._mean, self._stdev())
+
+    def is_outlier(self, value: float) -> bool:
+        """O(1) version of ZScoreEngine.is_outlier using the running moments."""
+        if self.buffer.size < 3:
+            return False
+        return self._exceeds(float(value), self._mean, self._stdev())
+
+    def outlier_bounds(self) -> Tuple[float, float]:
+        if self.buffer.size < 3:
+            return -math.inf, math.inf
+        return self._band(self._mean, self._stdev())
+
+    def _stdev(self) -> float:
+        """Window stdev from the running moments (0 when the window is flat)."""
+        stdev = math.sqrt(max(self._m2, 0.0) / (self.buffer.size - 1))
+        if stdev <= self.STABLE_EPSILON * max(1.0, abs(self._mean)):
+            return 0.0
+        return stdev
+
+    def restore(self, values: Sequence[float]) -> None:
+        super().restore(values)
+        self._resync()
+
+    @property
+    def nbytes(self) -> int:
+        # Plus the running moments
+        return super().nbytes + 2 * sys.getsizeof(0.0)
+
+    def _resync(self):
+        """Recompute the moments exactly from the buffer contents."""
+        data = self.buffer.get_all()
+        self._since_resync = 0
+        if not data:
+            self._mean = 0.0
+            self._m2 = 0.0
+            return
+        self._mean = math.fsum(data) / len(data)
+        self._m2 = math.fsum((v - self._mean) ** 2 for v in data)
+
+class RobustZScoreEngine(ZScoreEngine):
+    """
+    Anomaly detection using the modified z-score (Iglewicz & Hoaglin):
+    (x - median) / (1.4826 * MAD) over the window, flagged above 3.5 by default.
+    A single spike barely moves the median and MAD, so it does not hide the next one,
+    and skewed distributions (meters) are handled better than with mean/stdev.
+
+    The window is mirrored in an indexable skiplist, so an update is O(log n) and the
+    median and MAD are read by rank (MAD in O(log^2 n)) without sorting the window.
+    Returns the ZScoreEngine result shape, with the window `median` instead of `mean`.
+    """
+    MAD_SCALE = 1.4826
+    # When more than half the window sits on the median (stepped meters), MAD is 0:
+    # the mean absolute deviation is used instead (O(n), only in that case)
+    MEAN_AD_SCALE = 1.2533
+
+    __slots__ = ("_sorted",)
+
+    def __init__(self, window_size: int = 60, threshold: float = 3.5, buffer=None):
+        super().__init__(window_size=window_size, threshold=threshold, buffer=buffer)
+        self._sorted = IndexableSkiplist(self.buffer.maxlen)
+        for v in self.buffer.get_all():
+            self._sorted.insert(v)
+
+    @property
+    def nbytes(self) -> int:
+        # Plus the skiplist mirroring the window
+        return super().nbytes + self._sorted.nbytes
+
+    def process(self, value: float, timestamp: Optional[Union[float, str]] = None) -> Dict[str, any]:
+        """
+        Ingest value and return analysis.
+        :return: Dict with z_score and anomaly status (median instead of mean)
+        """
+        value = float(value)
+        if not math.isfinite(value):
+            return {"z_score": 0.0, "anomaly": False, "error": f"non-finite value {value}"}
+        evicted = self.buffer.add(value)
+        if evicted is not None:
+            self._sorted.remove(evicted)
+        self._sorted.insert(value)
+
+        if len(self._sorted) < 3:
+            return {"z_score": 0.0, "anomaly": False, "msg": "insufficient_data"}
+        median, scale = self._location_scale()
+        return self._result(value, median, scale)
+
+    def _result(self, value: float, median: float, scale: float) -> Dict[str, any]:
+        result = zscore_result(value, median, scale, self.threshold)
+        if "mean" in result:
+            result["median"] = result.pop("mean")
+        return result
+
+    def is_outlier(self, value: float) -> bool:
+        if len(self._sorted) < 3:
+            return False
+        median, scale = self._location_scale()
+        return self._exceeds(float(value), median, scale)
+
+    def outlier_bounds(self) -> Tuple[float, float]:
+        if len(self._sorted) < 3:
+            return -math.inf, math.inf
+        return self._band(*self._location_scale())
+
+    def restore(self, values: Sequence[float]) -> None:
+        super().restore(values)
+        self._sorted = IndexableSkiplist(self.buffer.maxlen)
+        for v in self.buffer.get_all():
+            self._sorted.insert(v)
+
+    def _location_scale(self) -> Tuple[float, float]:
+        """Median of the window and the robust scale (1.4826 * MAD)."""
+        ranked = self._sorted
+        n = len(ranked)
+        half = n // 2
+        if n % 2:
+            median = ranked[half]
+            mad = self._kth_deviation(half, median, half)
+        else:
+            median = (ranked[half - 1] + ranked[half]) / 2.0
+            mad = (self._kth_deviation(half - 1, median, half) + self._kth_deviation(half, median, half)) / 2.0
+        if mad > 0:
+            return median, self.MAD_SCALE * mad
+        mean_ad = math.fsum(abs(v - median) for v in ranked) / n
+        return median, self.MEAN_AD_SCALE * mean_ad
+
+    def _kth_deviation(self, k: int, median: float, split: int) -> float:
+        """
+        k-th smallest |x - median| (0-based). Values below `split` give the ascending
+        deviations median - ranked[split-1-i], the others ranked[split+j] - median: the
+        k-th of the two sorted sequences is found by binary search on how many come
+        from the first one.
+        """
+        ranked = self._sorted
+        right_len = len(ranked) - split
+        lo, hi = max(0, k + 1 - right_len), min(k + 1, split)
+        while lo < hi:
+            i = (lo + hi) // 2
+            if median - ranked[split - 1 - i] < ranked[split + k - i] - median:
+                lo = i + 1
+            else:
+                hi = i
+        # lo deviations come from below the split, k + 1 - lo from above: the k-th is the larger last one
+        kth = 0.0
+        if lo > 0:
+            kth = median - ranked[split - lo]
+        if k + 1 - lo > 0:
+            kth = max(kth, ranked[split + k - lo] - median)
+        return kth
+
+class EwmaEngine:
+    """
+    Time-decayed Z-Score for irregularly reporting sensors.
+
+    Keeps an exponentially weighted mean and variance whose weights halve every
+    `half_life` seconds of event time (`last_updated`), so memory is the same in
+    time whether a sensor reports every second or every hour. Constant memory
+    (a few floats, no window) and O(1) per sample.
+
+    A sample is scored against the state before it is folded in. The effective
+    sample count (decayed like the weights) must reach 3 before scoring, so after
+    a long silence the engine relearns instead of scoring against stale history.
+    Samples without a timestamp are stamped with `clock()`.
+    """
+    WINDOWED = False
+    MIN_WEIGHT = 3.0
+    STABLE_EPSILON = StreamingZScoreEngine.STABLE_EPSILON
+
+    __slots__ = ("half_life", "threshold", "clock", "_mean", "_var", "_weight", "_last_t", "_count")
+
+    def __init__(self, half_life: float = 3600.0, threshold: float = 3.0, clock: Callable[[], float] = time.time):
+        if half_life <= 0:
+            raise ValueError("half_life must be positive")
+        self.half_life = float(half_life)
+        self.threshold = threshold
+        self.clock = clock
+        self._mean = 0.0
+        self._var = 0.0
+        self._weight = 0.0
+        self._last_t: Optional[float] = None
+        self._count = 0
+
+    def process(self, value: float, timestamp: Optional[Union[float, str]] = None) -> Dict[str, any]:
+        """
+        Ingest value and return analysis.
+        :param timestamp: Sample time as epoch seconds or ISO string (HA `last_updated`)
+        :return: Dict with z_score and anomaly status (same shape as ZScoreEngine)
+        """
+        value = float(value)
+        if not math.isfinite(value):
+            return {"z_score": 0.0, "anomaly": False, "error": f"non-finite value {value}"}
+        t = self.clock() if timestamp is None else parse_timestamp(timestamp)
+        decay = self._decay(t)
+
+        if self._weight * decay >= self.MIN_WEIGHT:
+            result = zscore_result(value, self._mean, self._stdev(), self.threshold)
+        else:
+            result = {"z_score": 0.0, "anomaly": False, "msg": "insufficient_data"}
+
+        # Fold the sample in: alpha is the share of the new sample in the decayed total weight
+        weight = self._weight * decay + 1.0
+        alpha = 1.0 / weight
+        diff = value - self._mean
+        increment = alpha * diff
+        self._mean += increment
+        self._var = (1.0 - alpha) * (self._var + diff * increment)
+        self._weight = weight
+        self._last_t = t if self._last_t is None else max(self._last_t, t)
+        self._count += 1
+        return result
+
+    def _decay(self, t: float) -> float:
+        if self._last_t is None:
+            # Nothing seen yet, or restored from values without timestamps (taken as recent)
+            return 1.0
+        # Out-of-order samples do not rewind time
+        return 0.5 ** (max(0.0, t - self._last_t) / self.half_life)
+
+    def _stdev(self) -> float:
+        stdev = math.sqrt(max(self._var, 0.0))
+        if stdev <= self.STABLE_EPSILON * max(1.0, abs(self._mean)):
+            return 0.0
+        return stdev
+
+    def is_outlier(self, value: float, timestamp: Optional[Union[float, str]] = None) -> bool:
+        """
+        Check a value against the current state without ingesting it (see ZScoreEngine.is_outlier).
+        The state is decayed to `timestamp` (default `clock()`) as process() would.
+        """
+        t = self.clock() if timestamp is None else parse_timestamp(timestamp)
+        if self._weight * self._decay(t) < self.MIN_WEIGHT:
+            return False
+        stdev = self._stdev()
+        value = float(value)
+        if stdev == 0:
+            return value != self._mean
+        return abs((value - self._mean) / stdev) > self.threshold
+
+    def outlier_bounds(self) -> Tuple[float, float]:
+        """Band of is_outlier() at the current `clock()` time (see ZScoreEngine.outlier_bounds)."""
+        if self._weight * self._decay(self.clock()) < self.MIN_WEIGHT:
+            return -math.inf, math.inf
+        stdev = self._stdev()
+        return self._mean - self.threshold * stdev, self._mean + self.threshold * stdev
+
+    def restore(self, values: Sequence[float]) -> None:
+        """Seed from past values without timestamps (oldest first), weighted equally as recent samples."""
+        values = [float(v) for v in values if math.isfinite(v)]
+        if not values:
+            return
+        self._mean = math.fsum(values) / len(values)
+        self._var = math.fsum((v - self._mean) ** 2 for v in values) / len(values)
+        self._weight = float(len(values))
+        self._last_t = None
+        self._count = len(values)
+
+    def get_state(self) -> Tuple[float, float, float, float]:
+        """(mean, variance, weight, last sample time or NaN) for snapshots."""
+        return (self._mean, self._var, self._weight, math.nan if self._last_t is None else self._last_t)
+
+    def set_state(self, state: Sequence[float]) -> None:
+        self._mean, self._var, self._weight, last_t = state
+        self._last_t = None if math.isnan(last_t) else last_t
+        self._count = int(self._weight)
+
+    @property
+    def samples(self) -> int:
+        return self._count
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory used by the engine: its slots and the four state floats."""
+        return sys.getsizeof(self) + 4 * sys.getsizeof(0.0)
+
+def engine_types(zscore: type = StreamingZScoreEngine) -> Dict[str, type]:
+    """Anomaly engines selectable by name (engine rules), with the configured Z-Score variant."""
+    return {"zscore": zscore, "robust": RobustZScoreEngine, "ewma": EwmaEngine}
+
 class LinearDiagnostic:
     """
     Simple Linear Regression to determine trend (slope).
     Used for HVAC performance validation.
+    Keeps sum_x, sum_y, sum_xy and sum_x^2 incrementally so each sample is O(1)
+    regardless of window size. x is the sample time (slope in units/second) when a
+    timestamp is given, otherwise the sample index (slope in units/sample).
     """
-    def __init__(self, window_size: int = 15):
+    __slots__ = ("buffer", "_x_buffer", "resync_interval", "_origin", "_index", "_since_resync",
+                 "_sum_x", "_sum_y", "_sum_xy", "_sum_x_sq")
+
+    def __init__(self, window_size: int = 15, resync_interval: Optional[int] = None):
         self.buffer = BufferManager(maxlen=window_size)
+        self._x_buffer = BufferManager(maxlen=window_size)
+        self.resync_interval = resync_interval or window_size
+        self._origin: Optional[float] = None
+        self._index = 0
+        self._since_resync = 0
+        self._sum_x = 0.0
+        self._sum_y = 0.0
+        self._sum_xy = 0.0
+        self._sum_x_sq = 0.0
 
-    def process(self, value: float) -> float:
+    def process(self, value: float, timestamp: Optional[Union[float, str]] = None) -> float:
         """
         Add value and calculate slope.
-        assumes processed at regular intervals (x = 0, 1, 2...)
+        :param timestamp: Sample time as epoch seconds or ISO string (e.g. HA `last_updated`).
+                          If omitted, samples are assumed to be at regular intervals (x = 0, 1, 2...)
         :return: slope (m)
         """
-        self.buffer.add(value)
-        if self.buffer.size < 2:
-            return 0.0
+        if timestamp is None:
+            x_abs = float(self._index)
+        else:
+            x_abs = parse_timestamp(timestamp)
+        self._index += 1
+
+        # Keep x relative to an origin inside the window so x^2 stays well conditioned
+        if self._origin is None:
+            self._origin = x_abs
+        x = x_abs - self._origin
+        y = float(value)
+
+        evicted_y = self.buffer.add(y)
+        evicted_x = self._x_buffer.add(x)
 
-        y = self.buffer.get_all()
-        n = len(y)
-        x = list(range(n))
+        self._since_resync += 1
+        if self._since_resync >= self.resync_interval:
+            self._resync()
+        else:
+            self._sum_x += x
+            self._sum_y += y
+            self._sum_xy += x * y
+            self._sum_x_sq += x * x
+            if evicted_y is not None:
+                self._sum_x -= evicted_x
+                self._sum_y -= evicted_y
+                self._sum_xy -= evicted_x * evicted_y
+                self._sum_x_sq -= evicted_x * evicted_x
 
-        sum_x = sum(x)
-        sum_y = sum(y)
-        sum_xy = sum(xi * yi for xi, yi in zip(x, y))
-        sum_x_sq = sum(xi ** 2 for xi in x)
+        n = self.buffer.size
+        if n < 2:
+            return 0.0
 
-        denominator = (n * sum_x_sq) - (sum_x ** 2)
-        if denominator == 0:
+        denominator = (n * self._sum_x_sq) - (self._sum_x ** 2)
+        # Relative check: identical timestamps leave only rounding noise here
+        if denominator <= 1e-12 * n * self._sum_x_sq:
             return 0.0
 
-        slope = ((n * sum_xy) - (sum_x * sum_y)) / denominator
+        slope = ((n * self._sum_xy) - (self._sum_x * self._sum_y)) / denominator
         return round(slope, 4)
 
+    def _resync(self):
+        """Rebase x on the oldest sample and recompute the sums exactly."""
+        self._since_resync = 0
+        xs = self._x_buffer.get_all()
+        ys = self.buffer.get_all()
+        shift = xs[0]
+        self._origin += shift
+        xs = [x - shift for x in xs]
+        self._x_buffer.clear()
+        for x in xs:
+            self._x_buffer.add(x)
+
+        self._sum_x = math.fsum(xs)
+        self._sum_y = math.fsum(ys)
+        self._sum_xy = math.fsum(x * y for x, y in zip(xs, ys))
+        self._sum_x_sq = math.fsum(x * x for x in xs)
+
 class SolarDiagnostic:
     """
     Passive diagnostic for light sensors using Grena algorithm approximation.
@@ -0,0 +1,156 @@
+import logging
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from src.ingestion.filter import FilterManager
+from src.kernel.buffer import WindowStore
+
+logger = logging.getLogger(__name__)
+
+class EngineRules:
+    """
+    Engine type per entity from "pattern=engine" rules, first match in configuration
+    order wins (e.g. "sensor.*_energy=robust"). Entities matching no rule get `default`.
+    """
+    def __init__(self, rules: List[str], types: Dict[str, type], default: type):
+        """
+        :param types: Engine name -> engine class
+        """
+        self.types = types
+        self.default = default
+        self.rules: List[Tuple[FilterManager, type]] = []
+        for spec in rules or []:
+            spec = str(spec).strip("'\"")
+            pattern, sep, name = spec.rpartition("=")
+            name = name.strip().lower()
+            if not sep or not pattern.strip():
+                raise ValueError(f"Invalid engine rule (expected pattern=engine): {spec}")
+            if name not in types:
+                raise ValueError(f"Unknown engine '{name}' in rule {spec} (expected one of {', '.join(types)})")
+            self.rules.append((FilterManager([pattern.strip()]), types[name]))
+
+    def engine_for(self, entity_id: str) -> type:
+        for matcher, engine_cls in self.rules:
+            if matcher.should_process(entity_id):
+                return engine_cls
+        return self.default
+
+class EngineRegistry:
+    """
+    Bounded map of entity_id -> engine, in least-recently-used order.
+
+    An engine is created by `factory(entity_id)` on first use. When more than
+    `max_entities` are tracked the least recently used one is evicted, and entities
+    that have been silent for `idle_ttl` seconds are evicted as new samples come in
+    (a few per call, oldest first), so renamed or removed entities do not keep their
+    state forever. If the engines' windows live in a WindowStore, the row of an
+    evicted entity is released for reuse.
+    """
+    # Idle entities evicted per get() at most, to keep each call O(1)
+    IDLE_SWEEP = 8
+
+    def __init__(self, factory: Callable[[str], Any], max_entities: int = 0, idle_ttl: float = 0.0,
+                 store: Optional[WindowStore] = None, clock: Callable[[], float] = time.monotonic):
+        """
+        :param max_entities: Maximum tracked entities (0 for unbounded)
+        :param idle_ttl: Seconds without a sample before an entity is evicted (0 disables)
+        :param store: WindowStore holding the engines' windows, if any
+        """
+        self.factory = factory
+        self.max_entities = max_entities
+        self.idle_ttl = idle_ttl
+        self.store = store
+        self.clock = clock
+        self._engines: "OrderedDict[str, Any]" = OrderedDict()
+        self._last_seen: Dict[str, float] = {}
+
+        self.created = 0
+        self.evicted_lru = 0
+        self.evicted_idle = 0
+
+    def get(self, entity_id: str) -> Any:
+        """Return the engine of an entity (creating it if needed) and mark it as recently used."""
+        now = self.clock()
+        engines = self._engines
+        engine = engines.get(entity_id)
+        if engine is None:
+            engine = engines[entity_id] = self.factory(entity_id)
+            self.created += 1
+            if self.max_entities and len(engines) > self.max_entities:
+                self._evict(next(iter(engines)))
+                self.evicted_lru += 1
+        else:
+            engines.move_to_end(entity_id)
+        self._last_seen[entity_id] = now
+
+        if self.idle_ttl:
+            self._sweep(now - self.idle_ttl, self.IDLE_SWEEP)
+        return engine
+
+    def peek(self, entity_id: str) -> Optional[Any]:
+        """Return the engine of an entity without creating it or touching its recency."""
+        return self._engines.get(entity_id)
+
+    def evict_idle(self) -> int:
+        """Evict every entity idle for longer than `idle_ttl`. :return: Number evicted"""
+        if not self.idle_ttl:
+            return 0
+        return self._sweep(self.clock() - self.idle_ttl, len(self._engines))
+
+    def _sweep(self, cutoff: float, limit: int) -> int:
+        evicted = 0
+        engines = self._engines
+        while engines and evicted < limit:
+            oldest = next(iter(engines))
+            if self._last_seen[oldest] >= cutoff:
+                break
+            self._evict(oldest)
+            evicted += 1
+        self.evicted_idle += evicted
+        return evicted
+
+    def remove(self, entity_id: str) -> None:
+        if entity_id in self._engines:
+            self._evict(entity_id)
+
+    def _evict(self, entity_id: str) -> None:
+        del self._engines[entity_id]
+        del self._last_seen[entity_id]
+        if self.store is not None:
+            self.store.release(entity_id)
+
+    def items(self) -> Iterator[Tuple[str, Any]]:
+        """(entity_id, engine) pairs, least recently used first."""
+        return iter(list(self._engines.items()))
+
+    def __contains__(self, entity_id: str) -> bool:
+        return entity_id in self._engines
+
+    def __len__(self) -> int:
+        return len(self._engines)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory footprint: the two maps, each engine (see its `nbytes`, which
+        differs per engine type) and the window store, if any.
+        """
+        total = sys.getsizeof(self._engines) + sys.getsizeof(self._last_seen)
+        # Key strings are shared with the events; count the float in _last_seen
+        total += len(self._engines) * sys.getsizeof(0.0)
+        total += sum(engine.nbytes for engine in self._engines.values())
+        if self.store is not None:
+            total += self.store.nbytes
+        return total
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entities": len(self._engines),
+            "max_entities": self.max_entities,
+            "created": self.created,
+            "evicted_lru": self.evicted_lru,
+            "evicted_idle": self.evicted_idle,
+            "nbytes": self.nbytes,
+        }
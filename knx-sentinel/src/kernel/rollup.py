@@ -0,0 +1,133 @@
+import logging
+import re
+import time
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_RESOLUTION_RE = re.compile(r"^\s*(\d+)\s*([smhd])\s*$")
+_UNIT_SECONDS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+def parse_resolution(spec: str) -> int:
+    """"30s", "1m", "15m", "1h", "1d" -> seconds."""
+    match = _RESOLUTION_RE.match(str(spec))
+    if match is None or int(match.group(1)) <= 0:
+        raise ValueError(f"Invalid rollup resolution '{spec}' (expected e.g. 1m, 15m, 1h)")
+    return int(match.group(1)) * _UNIT_SECONDS[match.group(2)]
+
+class RollupBucket:
+    """Aggregates of one entity over [start, end): no raw points are kept."""
+    __slots__ = ("start", "end", "count", "sum", "min", "max", "last")
+
+    def __init__(self, start: float, end: float, value: float):
+        self.start = start
+        self.end = end
+        self.count = 1
+        self.sum = value
+        self.min = value
+        self.max = value
+        self.last = value
+
+    def payload(self, partial: bool = False) -> dict:
+        payload = {
+            "start": self.start,
+            "end": self.end,
+            "count": self.count,
+            "min": self.min,
+            "max": self.max,
+            "mean": round(self.sum / self.count, 6),
+            "last": self.last,
+        }
+        if partial:
+            # Flushed before the bucket ended (shutdown)
+            payload["partial"] = True
+        return payload
+
+class RollupEngine:
+    """
+    Incremental per-entity rollups at several resolutions (e.g. 1m, 15m, 1h).
+
+    Each sample updates one open bucket per resolution in O(1). Buckets are aligned to
+    wall-clock boundaries (multiples of the resolution since the epoch) and handed to
+    `on_close(resolution, entity_id, payload)` when they end: on the entity's next sample,
+    or at the next flush() for entities that went quiet. flush_all() emits the open
+    buckets as partial, on shutdown.
+    """
+    def __init__(self, resolutions: List[str], on_close: Callable[[str, str, dict], None],
+                 clock: Callable[[], float] = time.time):
+        if not resolutions:
+            raise ValueError("At least one rollup resolution is required")
+        self.resolutions = [str(r).strip() for r in resolutions]
+        self.seconds = [parse_resolution(r) for r in self.resolutions]
+        self.on_close = on_close
+        self.clock = clock
+        # entity_id -> open bucket per resolution (None when closed)
+        self._buckets: Dict[str, List[Optional[RollupBucket]]] = {}
+
+        self.samples = 0
+        self.emitted = 0
+
+    def add(self, entity_id: str, value: float, now: Optional[float] = None):
+        now = self.clock() if now is None else now
+        buckets = self._buckets.get(entity_id)
+        if buckets is None:
+            buckets = self._buckets[entity_id] = [None] * len(self.seconds)
+        self.samples += 1
+        for i, seconds in enumerate(self.seconds):
+            bucket = buckets[i]
+            if bucket is None or now >= bucket.end:
+                if bucket is not None:
+                    self._emit(i, entity_id, bucket)
+                start = now - now % seconds
+                buckets[i] = RollupBucket(start, start + seconds, value)
+            else:
+                bucket.count += 1
+                bucket.sum += value
+                if value < bucket.min:
+                    bucket.min = value
+                elif value > bucket.max:
+                    bucket.max = value
+                bucket.last = value
+
+    def flush(self, now: Optional[float] = None) -> int:
+        """Emit every bucket that has ended. :return: Number emitted"""
+        now = self.clock() if now is None else now
+        emitted = 0
+        for entity_id, buckets in list(self._buckets.items()):
+            for i, bucket in enumerate(buckets):
+                if bucket is not None and now >= bucket.end:
+                    self._emit(i, entity_id, bucket)
+                    buckets[i] = None
+                    emitted += 1
+            if not any(buckets):
+                # Quiet entity: nothing open, forget it
+                del self._buckets[entity_id]
+        return emitted
+
+    def flush_all(self) -> int:
+        """Emit every open bucket, ended or not (shutdown). :return: Number emitted"""
+        now = self.clock()
+        emitted = 0
+        for entity_id, buckets in self._buckets.items():
+            for i, bucket in enumerate(buckets):
+                if bucket is not None:
+                    self._emit(i, entity_id, bucket, partial=now < bucket.end)
+                    emitted += 1
+        self._buckets.clear()
+        return emitted
+
+    def next_boundary(self, now: Optional[float] = None) -> float:
+        """Time of the next bucket end at the finest resolution."""
+        now = self.clock() if now is None else now
+        finest = min(self.seconds)
+        return now - now % finest + finest
+
+    def _emit(self, index: int, entity_id: str, bucket: RollupBucket, partial: bool = False):
+        self.emitted += 1
+        try:
+            self.on_close(self.resolutions[index], entity_id, bucket.payload(partial))
+        except Exception as e:
+            logger.error(f"Failed to emit {self.resolutions[index]} rollup for {entity_id}: {e}")
+
+    def stats(self) -> dict:
+        return {"entities": len(self._buckets), "samples": self.samples, "emitted": self.emitted}
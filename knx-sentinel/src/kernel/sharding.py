@@ -0,0 +1,349 @@
+import asyncio
+import logging
+import math
+import multiprocessing
+import queue
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Request record: seq, value, entity_id length, then the UTF-8 entity_id
+_REQUEST = struct.Struct("<IdH")
+# Result record: seq, z_score, window center (mean, or median for robust engines),
+# the engine's outlier band after the sample (see outlier_bounds), status
+_RESULT = struct.Struct("<IddddB")
+
+# Result status codes (bit 0x80 = anomaly, bit 0x40 = the center is a median)
+_SCORED, _INSUFFICIENT, _STABLE, _ERROR = 0, 1, 2, 3
+_ANOMALY = 0x80
+_MEDIAN = 0x40
+
+# Band of an engine that cannot flag anything yet
+_NO_BAND = (-math.inf, math.inf)
+
+def encode_result(seq: int, analysis: Dict[str, Any], bounds: Tuple[float, float] = _NO_BAND) -> bytes:
+    """Pack a ZScoreEngine result and the engine's outlier band into a fixed-size record."""
+    if "error" in analysis:
+        status = _ERROR
+    elif analysis.get("msg") == "insufficient_data":
+        status = _INSUFFICIENT
+    elif analysis.get("msg") == "stable":
+        status = _STABLE
+    else:
+        status = _SCORED
+    if analysis.get("anomaly"):
+        status |= _ANOMALY
+    if "median" in analysis:
+        status |= _MEDIAN
+        center = analysis["median"]
+    else:
+        center = analysis.get("mean", 0.0)
+    return _RESULT.pack(seq, analysis.get("z_score", 0.0), center, bounds[0], bounds[1], status)
+
+def decode_results(buf: bytes):
+    """
+    Yield (seq, analysis, (low, high)) from a batch of result records,
+    rebuilding the engine's dict shape.
+    """
+    for seq, z_score, center, low, high, status in _RESULT.iter_unpack(buf):
+        code = status & 0x3F
+        if code == _SCORED:
+            analysis = {"z_score": z_score, "anomaly": bool(status & _ANOMALY),
+                        "median" if status & _MEDIAN else "mean": center}
+        elif code == _INSUFFICIENT:
+            analysis = {"z_score": 0.0, "anomaly": False, "msg": "insufficient_data"}
+        elif code == _STABLE:
+            analysis = {"z_score": 0.0, "anomaly": False, "msg": "stable"}
+        else:
+            analysis = {"z_score": 0.0, "anomaly": False, "error": "kernel_error"}
+        yield seq, analysis, (low, high)
+
+def _worker_main(requests, results, streaming: bool, max_entities: int = 0, idle_ttl: float = 0.0,
+                 engine_rules: Optional[List[str]] = None, ewma_half_life: float = 3600.0):
+    """
+    Kernel worker process: owns the engines of its entity slice.
+    EWMA engines are clocked by the worker's receive time (samples carry no timestamp).
+    Results are written by a separate thread so the worker keeps draining its
+    input even when the parent is busy, which rules out a pipe deadlock.
+    """
+    from src.kernel.math_engine import ZScoreEngine, StreamingZScoreEngine, engine_types
+    from src.kernel.registry import EngineRegistry, EngineRules
+    engine_cls = StreamingZScoreEngine if streaming else ZScoreEngine
+    rules = EngineRules(engine_rules, engine_types(engine_cls), engine_cls)
+
+    def factory(entity_id: str):
+        cls = rules.engine_for(entity_id)
+        return cls() if cls.WINDOWED else cls(half_life=ewma_half_life)
+
+    z_engines = EngineRegistry(factory, max_entities=max_entities, idle_ttl=idle_ttl)
+    outgoing: "queue.Queue[Optional[bytes]]" = queue.Queue()
+
+    def sender():
+        while True:
+            chunk = outgoing.get()
+            if chunk is None:
+                break
+            results.send_bytes(chunk)
+        results.close()
+
+    sender_thread = threading.Thread(target=sender, daemon=True)
+    sender_thread.start()
+
+    try:
+        while True:
+            try:
+                buf = requests.recv_bytes()
+            except EOFError:
+                break
+            if not buf:
+                break
+            out = []
+            offset = 0
+            size = _REQUEST.size
+            while offset < len(buf):
+                seq, value, n = _REQUEST.unpack_from(buf, offset)
+                offset += size
+                entity_id = buf[offset:offset + n].decode()
+                offset += n
+                try:
+                    engine = z_engines.get(entity_id)
+                    analysis = engine.process(value)
+                    bounds = engine.outlier_bounds()
+                except Exception as e:
+                    analysis = {"z_score": 0.0, "anomaly": False, "error": str(e)}
+                    bounds = _NO_BAND
+                out.append(encode_result(seq, analysis, bounds))
+            outgoing.put(b"".join(out))
+    finally:
+        outgoing.put(None)
+        sender_thread.join()
+
+class ShardedKernel:
+    """
+    Runs the Z-Score kernel in N worker processes.
+    Entities are assigned to workers by crc32(entity_id), so each worker owns a slice
+    of the engines and every entity keeps its order. Samples and results travel over
+    pipes as compact struct records (no pickling), and submissions made during one
+    event loop iteration are sent as a single message per worker, by a sender thread
+    per worker so a full pipe never blocks the event loop.
+    Results are delivered on the event loop via `on_result(entity_id, value, context, analysis)`.
+
+    Each result also carries the engine's outlier band, so is_outlier() answers the
+    anomaly pre-check in the parent without a round trip. If a worker dies, its pending
+    samples are delivered with an error result and the worker is restarted (with empty
+    engines).
+    """
+    def __init__(self, workers: int, on_result: Callable[[str, float, Any, Dict[str, Any]], None],
+                 streaming: bool = True, max_entities: int = 0, idle_ttl: float = 0.0,
+                 engine_rules: Optional[List[str]] = None, ewma_half_life: float = 3600.0):
+        """
+        :param max_entities: Per-worker engine limit (see EngineRegistry), 0 for unbounded
+        :param idle_ttl: Seconds after which a silent entity's engine is dropped, 0 to keep it
+        :param engine_rules: "pattern=engine" rules (see EngineRules)
+        :param ewma_half_life: Half-life in seconds of the EWMA engines
+        """
+        self.workers = max(1, workers)
+        self.on_result = on_result
+        self.streaming = streaming
+        self.max_entities = max_entities
+        self.idle_ttl = idle_ttl
+        self.engine_rules = list(engine_rules or [])
+        self.ewma_half_life = ewma_half_life
+        self._ctx = multiprocessing.get_context("spawn")
+        self._procs: List[Optional[multiprocessing.Process]] = [None] * self.workers
+        self._res_conns: List[Any] = [None] * self.workers
+        # Per worker: queue of request messages and the thread writing them to the pipe
+        self._senders: List[Optional["queue.Queue[Optional[bytes]]"]] = [None] * self.workers
+        self._sender_threads: List[Optional[threading.Thread]] = [None] * self.workers
+        self._outgoing: List[List[bytes]] = [[] for _ in range(self.workers)]
+        self._pending: Dict[int, Tuple[str, float, Any]] = {}
+        self._seq = 0
+        self._flush_scheduled = False
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # entity_id -> outlier band from its last result, least recently scored first
+        self._bounds: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._max_bounds = max_entities * self.workers
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.restarts = 0
+
+    def start(self):
+        """Spawn the workers and register the result pipes with the running loop."""
+        self._loop = asyncio.get_running_loop()
+        for shard in range(self.workers):
+            self._spawn(shard)
+        logger.info(f"Sharded kernel started with {self.workers} worker process(es)")
+
+    def _spawn(self, shard: int):
+        req_recv, req_send = self._ctx.Pipe(duplex=False)
+        res_recv, res_send = self._ctx.Pipe(duplex=False)
+        proc = self._ctx.Process(target=_worker_main, args=(req_recv, res_send, self.streaming,
+                                                            self.max_entities, self.idle_ttl,
+                                                            self.engine_rules, self.ewma_half_life),
+                                 name=f"knx-kernel-{shard}", daemon=True)
+        proc.start()
+        req_recv.close()
+        res_send.close()
+        outgoing: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        sender = threading.Thread(target=self._sender, args=(req_send, outgoing),
+                                  name=f"knx-kernel-send-{shard}", daemon=True)
+        sender.start()
+        self._procs[shard] = proc
+        self._res_conns[shard] = res_recv
+        self._senders[shard] = outgoing
+        self._sender_threads[shard] = sender
+        self._loop.add_reader(res_recv.fileno(), self._on_readable, shard)
+
+    @staticmethod
+    def _sender(conn, outgoing: "queue.Queue[Optional[bytes]]"):
+        """Write queued request messages to a worker until None; closes the pipe."""
+        try:
+            while True:
+                chunk = outgoing.get()
+                if chunk is None:
+                    break
+                try:
+                    conn.send_bytes(chunk)
+                except OSError:
+                    # Worker gone: its pending samples are failed when the result pipe closes
+                    break
+        finally:
+            conn.close()
+
+    def shard_for(self, entity_id: str) -> int:
+        return zlib.crc32(entity_id.encode()) % self.workers
+
+    def submit(self, entity_id: str, value: float, context: Any = None):
+        """Queue a sample for its worker. `context` is handed back to on_result."""
+        seq = self._seq
+        self._seq = (seq + 1) & 0xFFFFFFFF
+        self._pending[seq] = (entity_id, value, context)
+        name = entity_id.encode()
+        self._outgoing[self.shard_for(entity_id)].append(_REQUEST.pack(seq, value, len(name)) + name)
+        self.submitted += 1
+        if not self._flush_scheduled and self._loop is not None:
+            self._flush_scheduled = True
+            self._loop.call_soon(self.flush)
+
+    def flush(self):
+        """Hand queued samples to the sender threads, one message per worker."""
+        self._flush_scheduled = False
+        for shard, records in enumerate(self._outgoing):
+            if records:
+                self._outgoing[shard] = []
+                self._senders[shard].put(b"".join(records))
+
+    def is_outlier(self, entity_id: str, value: float) -> bool:
+        """
+        Pre-check of whether a value would be flagged, against the band the entity's
+        engine reported with its last result. False for entities without a result yet.
+        """
+        bounds = self._bounds.get(entity_id)
+        return bounds is not None and (value < bounds[0] or value > bounds[1])
+
+    def _on_readable(self, shard: int):
+        try:
+            buf = self._res_conns[shard].recv_bytes()
+        except (EOFError, OSError):
+            self._restart(shard)
+            return
+        self._deliver(buf)
+
+    def _restart(self, shard: int):
+        """A worker exited: fail the samples it still owed and start a fresh one."""
+        conn = self._res_conns[shard]
+        self._loop.remove_reader(conn.fileno())
+        conn.close()
+        self._senders[shard].put(None)
+        proc = self._procs[shard]
+        proc.join(0)
+        if proc.is_alive():
+            proc.terminate()
+
+        # Samples not yet handed to the sender are dropped too (the new worker would
+        # score them against empty engines, and out of order with the failed ones)
+        self._outgoing[shard] = []
+        lost = [seq for seq, (entity_id, _, _) in self._pending.items() if self.shard_for(entity_id) == shard]
+        logger.error(f"Kernel worker {shard} exited (code {proc.exitcode}), "
+                     f"failing {len(lost)} pending sample(s) and restarting it")
+        for seq in lost:
+            entity_id, value, context = self._pending.pop(seq)
+            self._bounds.pop(entity_id, None)
+            self.failed += 1
+            self._complete(entity_id, value, context,
+                           {"z_score": 0.0, "anomaly": False, "error": "kernel_worker_exited"})
+        self.restarts += 1
+        self._spawn(shard)
+
+    def _deliver(self, buf: bytes):
+        bounds = self._bounds
+        for seq, analysis, band in decode_results(buf):
+            entity_id, value, context = self._pending.pop(seq)
+            self.completed += 1
+            bounds[entity_id] = band
+            bounds.move_to_end(entity_id)
+            if self._max_bounds and len(bounds) > self._max_bounds:
+                bounds.popitem(last=False)
+            self._complete(entity_id, value, context, analysis)
+
+    def _complete(self, entity_id: str, value: float, context: Any, analysis: Dict[str, Any]):
+        try:
+            self.on_result(entity_id, value, context, analysis)
+        except Exception as e:
+            logger.error(f"Error in kernel result callback: {e}")
+
+    def stop(self, timeout: float = 5.0):
+        """Flush, let the workers finish their queue, deliver remaining results and join."""
+        self.flush()
+        for shard, outgoing in enumerate(self._senders):
+            if outgoing is None:
+                continue
+            if self._loop is not None:
+                self._loop.remove_reader(self._res_conns[shard].fileno())
+            # Empty message: the worker finishes its input and exits
+            outgoing.put(b"")
+            outgoing.put(None)
+        for sender in self._sender_threads:
+            if sender is not None:
+                sender.join(timeout)
+        for conn in self._res_conns:
+            if conn is None:
+                continue
+            try:
+                while True:
+                    if not conn.poll(timeout):
+                        break
+                    self._deliver(conn.recv_bytes())
+            except (EOFError, OSError):
+                pass
+            conn.close()
+        for proc in self._procs:
+            if proc is None:
+                continue
+            proc.join(timeout)
+            if proc.is_alive():
+                proc.terminate()
+        self._procs = [None] * self.workers
+        self._res_conns = [None] * self.workers
+        self._senders = [None] * self.workers
+        self._sender_threads = [None] * self.workers
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def tracked(self) -> int:
+        """Entities with a result (an estimate of the engines held by the workers)."""
+        return len(self._bounds)
+
+    def stats(self) -> Dict[str, int]:
+        return {"workers": self.workers, "submitted": self.submitted,
+                "completed": self.completed, "in_flight": self.in_flight,
+                "failed": self.failed, "restarts": self.restarts}
@@ -0,0 +1,116 @@
+import math
+import random
+import sys
+from typing import Iterator, List, Optional
+
+class _Node:
+    __slots__ = ("value", "next", "width")
+
+    def __init__(self, value: float, next: List[Optional["_Node"]], width: List[int]):
+        self.value = value
+        self.next = next
+        # width[level]: number of bottom-level steps to next[level]
+        self.width = width
+
+# Terminator: compares greater than every finite value
+_NIL = _Node(math.inf, [], [])
+
+class IndexableSkiplist:
+    """
+    Sorted multiset of finite floats with O(log n) insert, remove and access by rank
+    (indexable skiplist: every link records how many elements it skips).
+    Used for rolling order statistics (median, MAD) over a sliding window.
+    """
+    __slots__ = ("size", "maxlevels", "head")
+
+    def __init__(self, expected_size: int = 64):
+        self.size = 0
+        self.maxlevels = int(1 + math.log2(max(2, expected_size)))
+        self.head = _Node(-math.inf, [_NIL] * self.maxlevels, [1] * self.maxlevels)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Approximate memory used by the nodes, without walking them: node heights are
+        geometric, so a node holds two links (and two widths) on average.
+        """
+        head = self.head
+        node = sys.getsizeof(head) + 2 * sys.getsizeof([None, None]) + sys.getsizeof(0.0)
+        return (sys.getsizeof(self) + sys.getsizeof(head) + sys.getsizeof(head.next)
+                + sys.getsizeof(head.width) + self.size * node)
+
+    def __getitem__(self, index: int) -> float:
+        """Value of rank `index` (0 is the smallest)."""
+        if index < 0:
+            index += self.size
+        if not 0 <= index < self.size:
+            raise IndexError("skiplist index out of range")
+        node = self.head
+        index += 1
+        for level in range(self.maxlevels - 1, -1, -1):
+            while node.width[level] <= index:
+                index -= node.width[level]
+                node = node.next[level]
+        return node.value
+
+    def __iter__(self) -> Iterator[float]:
+        node = self.head.next[0]
+        while node is not _NIL:
+            yield node.value
+            node = node.next[0]
+
+    def insert(self, value: float) -> None:
+        if not math.isfinite(value):
+            raise ValueError(f"Cannot insert non-finite value {value}")
+        maxlevels = self.maxlevels
+        chain = [None] * maxlevels
+        steps_at_level = [0] * maxlevels
+        node = self.head
+        # Last node at each level whose value is <= value
+        for level in range(maxlevels - 1, -1, -1):
+            while node.next[level].value <= value:
+                steps_at_level[level] += node.width[level]
+                node = node.next[level]
+            chain[level] = node
+
+        # Geometric level: half the nodes reach level 2, a quarter level 3...
+        d = min(maxlevels, 1 - int(math.log2(1.0 - random.random())))
+        new = _Node(value, [None] * d, [0] * d)
+        steps = 0
+        for level in range(d):
+            prev = chain[level]
+            new.next[level] = prev.next[level]
+            prev.next[level] = new
+            new.width[level] = prev.width[level] - steps
+            prev.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(d, maxlevels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, value: float) -> None:
+        """Remove one occurrence of `value`. Raises KeyError if absent."""
+        maxlevels = self.maxlevels
+        chain = [None] * maxlevels
+        node = self.head
+        # Last node at each level whose value is < value
+        for level in range(maxlevels - 1, -1, -1):
+            while node.next[level].value < value:
+                node = node.next[level]
+            chain[level] = node
+        target = chain[0].next[0]
+        if target is _NIL or target.value != value:
+            raise KeyError(value)
+
+        # target is the first node >= value, so it follows chain[level] on each of its levels
+        d = len(target.next)
+        for level in range(d):
+            prev = chain[level]
+            prev.width[level] += target.width[level] - 1
+            prev.next[level] = target.next[level]
+        for level in range(d, maxlevels):
+            chain[level].width[level] -= 1
+        self.size -= 1
@@ -0,0 +1,274 @@
+import logging
+import os
+import struct
+import threading
+import time
+import zlib
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.kernel.buffer import WindowStore
+from src.kernel.registry import EngineRegistry
+from src.kernel.watchdog import WatchdogKernel
+
+logger = logging.getLogger(__name__)
+
+# File layout (little endian):
+#   header   magic "KNXS", format version, saved_at (epoch s), engine count, watchdog count
+#   engines  per entity: id length, value count, kind, UTF-8 id, values as float64
+#            (kind 0: window samples, oldest first; kind 1: engine state from get_state())
+#            version 1 files have no kind byte (windows only)
+#   watchdog per address: id length, age (s, -1 if never seen), in alarm, UTF-8 address
+#   trailer  CRC32 of everything before it
+MAGIC = b"KNXS"
+VERSION = 2
+_HEADER = struct.Struct("<4sHdII")
+_WINDOW_V1 = struct.Struct("<HH")
+_ENGINE = struct.Struct("<HHB")
+KIND_WINDOW = 0
+KIND_STATE = 1
+_WATCHDOG = struct.Struct("<HdB")
+_CRC = struct.Struct("<I")
+
+class SnapshotError(ValueError):
+    """The snapshot is unreadable (wrong format or version, truncated or corrupted)."""
+
+class KernelState:
+    """
+    Decoded snapshot: entity windows (oldest first), state of windowless engines (EWMA),
+    both in LRU order, and watchdog (age, in alarm).
+    """
+    def __init__(self, saved_at: float, windows: Dict[str, array], watchdog: Dict[str, Tuple[float, bool]],
+                 states: Optional[Dict[str, array]] = None):
+        self.saved_at = saved_at
+        self.windows = windows
+        self.watchdog = watchdog
+        self.states = states if states is not None else {}
+
+class KernelCapture:
+    """
+    Copy of the kernel state taken on the event loop (see capture_state), so it can be
+    encoded in another thread while the engines keep running.
+    """
+    __slots__ = ("records", "store", "watchdog")
+
+    def __init__(self, records: List[Tuple[str, int, Any]], store: Optional[WindowStore],
+                 watchdog: Dict[str, Tuple[float, bool]]):
+        # (entity_id, kind, row in `store` or values), LRU order
+        self.records = records
+        self.store = store
+        self.watchdog = watchdog
+
+def capture_state(engines: Optional[EngineRegistry], watchdog: Optional[WatchdogKernel]) -> KernelCapture:
+    """
+    Copy what a snapshot needs: the window store in bulk (one copy of its arrays) and
+    each engine's row, or its state for windowless engines. No per-sample work.
+    """
+    records = []
+    store = None
+    if engines is not None:
+        store = engines.store.copy() if engines.store is not None else None
+        for entity_id, engine in engines.items():
+            if not engine.WINDOWED:
+                if engine.samples:
+                    records.append((entity_id, KIND_STATE, engine.get_state()))
+                continue
+            row = getattr(engine.buffer, "row", None) if store is not None else None
+            records.append((entity_id, KIND_WINDOW, engine.buffer.get_all() if row is None else row))
+    return KernelCapture(records, store, watchdog.snapshot() if watchdog is not None else {})
+
+def encode_capture(capture: KernelCapture, saved_at: Optional[float] = None) -> bytes:
+    """Serialize a captured state (safe to call from an executor thread)."""
+    parts = []
+    records = 0
+    for entity_id, kind, values in capture.records:
+        if isinstance(values, int):
+            values = capture.store.values(values)
+        if not values:
+            continue
+        key = entity_id.encode("utf-8")
+        parts.append(_ENGINE.pack(len(key), len(values), kind))
+        parts.append(key)
+        parts.append(array('d', values).tobytes())
+        records += 1
+
+    watchdog_state = capture.watchdog
+    for address, (age, in_alarm) in watchdog_state.items():
+        key = address.encode("utf-8")
+        parts.append(_WATCHDOG.pack(len(key), age, in_alarm))
+        parts.append(key)
+
+    header = _HEADER.pack(MAGIC, VERSION, time.time() if saved_at is None else saved_at,
+                          records, len(watchdog_state))
+    body = header + b"".join(parts)
+    return body + _CRC.pack(zlib.crc32(body))
+
+def encode_state(engines: Optional[EngineRegistry], watchdog: Optional[WatchdogKernel],
+                 saved_at: Optional[float] = None) -> bytes:
+    """Serialize the engine windows (or state, for windowless engines) and watchdog state."""
+    return encode_capture(capture_state(engines, watchdog), saved_at)
+
+def decode_state(data: bytes) -> KernelState:
+    """Parse a snapshot. Raises SnapshotError if it cannot be trusted."""
+    if len(data) < _HEADER.size + _CRC.size:
+        raise SnapshotError("file too short")
+    magic, version, saved_at, records, watchdogs = _HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise SnapshotError("not a kernel snapshot")
+    if version not in (1, VERSION):
+        raise SnapshotError(f"unsupported version {version}")
+    body = memoryview(data)[:-_CRC.size]
+    if zlib.crc32(body) != _CRC.unpack_from(data, len(data) - _CRC.size)[0]:
+        raise SnapshotError("checksum mismatch")
+
+    try:
+        offset = _HEADER.size
+        state_windows: Dict[str, array] = {}
+        state_engines: Dict[str, array] = {}
+        for _ in range(records):
+            if version == 1:
+                key_len, count = _WINDOW_V1.unpack_from(body, offset)
+                kind = KIND_WINDOW
+                offset += _WINDOW_V1.size
+            else:
+                key_len, count, kind = _ENGINE.unpack_from(body, offset)
+                offset += _ENGINE.size
+            entity_id = str(body[offset:offset + key_len], "utf-8")
+            offset += key_len
+            values = array('d')
+            values.frombytes(body[offset:offset + 8 * count])
+            offset += 8 * count
+            if kind == KIND_WINDOW:
+                state_windows[entity_id] = values
+            elif kind == KIND_STATE:
+                state_engines[entity_id] = values
+            else:
+                raise SnapshotError(f"unknown record kind {kind}")
+
+        state_watchdog: Dict[str, Tuple[float, bool]] = {}
+        for _ in range(watchdogs):
+            key_len, age, in_alarm = _WATCHDOG.unpack_from(body, offset)
+            offset += _WATCHDOG.size
+            state_watchdog[str(body[offset:offset + key_len], "utf-8")] = (age, bool(in_alarm))
+            offset += key_len
+    except (struct.error, UnicodeDecodeError, ValueError) as e:
+        raise SnapshotError(f"malformed record: {e}")
+    if offset != len(body):
+        raise SnapshotError("trailing data")
+    return KernelState(saved_at, state_windows, state_watchdog, state_engines)
+
+class KernelSnapshot:
+    """
+    Warm start: the kernel windows and watchdog last-seen times are saved to `path`
+    periodically and on shutdown, and restored on start, so the engines do not
+    have to refill their windows (hours for slow sensors) after every restart.
+
+    The file is written to a temporary file and renamed, so a crash while saving
+    keeps the previous snapshot. Writes are serialized, so the final save on shutdown
+    waits for a periodic one still running in an executor and lands last. A snapshot that cannot be read (other format
+    version, corrupted) is ignored and the agent starts cold.
+    """
+    def __init__(self, path: str, engines: Optional[EngineRegistry], watchdog: Optional[WatchdogKernel]):
+        """
+        :param engines: Engine registry to save and restore (None to skip the windows)
+        :param watchdog: Watchdog to save and restore (None to skip it)
+        """
+        self.path = path
+        self.engines = engines
+        self.watchdog = watchdog
+        self.saves = 0
+        self.errors = 0
+        self.bytes = 0
+        self.restored_entities = 0
+        self.restored_watchdogs = 0
+        self._write_lock = threading.Lock()
+
+    def encode(self) -> bytes:
+        return encode_state(self.engines, self.watchdog)
+
+    def capture(self) -> KernelCapture:
+        """Copy the state to save (on the event loop); see save_capture()."""
+        return capture_state(self.engines, self.watchdog)
+
+    def save_capture(self, capture: KernelCapture) -> bool:
+        """Encode and write a capture (safe to call from an executor thread)."""
+        return self.write(encode_capture(capture))
+
+    def write(self, data: bytes) -> bool:
+        """Atomically replace the snapshot file (safe to call from an executor thread)."""
+        with self._write_lock:
+            return self._write_locked(data)
+
+    def _write_locked(self, data: bytes) -> bool:
+        tmp = self.path + ".tmp"
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(tmp, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            self.errors += 1
+            logger.error(f"Failed to write kernel snapshot {self.path}: {e}")
+            return False
+        self.saves += 1
+        self.bytes = len(data)
+        return True
+
+    def save(self) -> bool:
+        return self.write(self.encode())
+
+    def load(self) -> Optional[KernelState]:
+        """Read the snapshot file; None if there is none or it cannot be trusted."""
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Cannot read kernel snapshot {self.path}: {e}. Starting cold.")
+            return None
+        try:
+            return decode_state(data)
+        except SnapshotError as e:
+            logger.warning(f"Ignoring kernel snapshot {self.path}: {e}. Starting cold.")
+            return None
+
+    def restore(self) -> bool:
+        """Load the snapshot into the engines and the watchdog. :return: True if one was restored"""
+        start = time.perf_counter()
+        state = self.load()
+        if state is None:
+            return False
+        if self.engines is not None:
+            for entity_id, values in state.windows.items():
+                self.engines.get(entity_id).restore(values)
+            # The engine rules may have changed since the snapshot was taken: a window seeds
+            # an EWMA engine, but an EWMA state cannot become a window and is dropped
+            restored_states = 0
+            for entity_id, values in state.states.items():
+                engine = self.engines.get(entity_id)
+                if engine.WINDOWED:
+                    self.engines.remove(entity_id)
+                else:
+                    engine.set_state(values)
+                    restored_states += 1
+            self.restored_entities = len(state.windows) + restored_states
+        if self.watchdog is not None:
+            self.restored_watchdogs = self.watchdog.restore(state.watchdog)
+        logger.info(f"Restored kernel snapshot from {time.time() - state.saved_at:.0f}s ago: "
+                    f"{self.restored_entities} windows, {self.restored_watchdogs} watchdog entities "
+                    f"in {(time.perf_counter() - start) * 1000:.1f}ms")
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "saves": self.saves,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "restored_entities": self.restored_entities,
+            "restored_watchdogs": self.restored_watchdogs,
+        }
@@ -0,0 +1,121 @@
+import logging
+import math
+import time
+from array import array
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.ingestion.filter import FilterManager
+from src.kernel.math_engine import SolarDiagnostic
+
+logger = logging.getLogger(__name__)
+
+DAY_SECONDS = 86400
+
+class SolarElevationCache:
+    """
+    Solar elevation of the site, computed once per `bucket` seconds and shared by all
+    lux sensors. With `precompute`, the whole UTC day is tabulated when the day starts
+    (one entry per bucket) and lookups never compute.
+    """
+    def __init__(self, lat: float, lon: float, bucket: float = 60.0, precompute: bool = False,
+                 clock: Callable[[], float] = time.time):
+        self.lat = lat
+        self.lon = lon
+        self.bucket = max(1.0, float(bucket))
+        self.precompute = precompute
+        self.clock = clock
+        self.computed = 0
+
+        self._bucket_index: Optional[int] = None
+        self._elevation = 0.0
+        self._table_day: Optional[int] = None
+        self._table = array('d')
+
+    def _compute(self, timestamp: float) -> float:
+        day = time.gmtime(timestamp)
+        utc_hour = (timestamp % DAY_SECONDS) / 3600.0
+        self.computed += 1
+        return SolarDiagnostic.calculate_elevation(self.lat, self.lon, utc_hour, day.tm_yday)
+
+    def _build_table(self, day: int):
+        """Tabulate the elevation at the start of every bucket of a UTC day."""
+        start = day * DAY_SECONDS
+        buckets = math.ceil(DAY_SECONDS / self.bucket)
+        self._table = array('d', (self._compute(start + i * self.bucket) for i in range(buckets)))
+        self._table_day = day
+
+    def elevation(self, timestamp: Optional[float] = None) -> float:
+        """Elevation in degrees at the start of the bucket holding `timestamp` (default now)."""
+        timestamp = self.clock() if timestamp is None else timestamp
+        index = int(timestamp // self.bucket)
+        if index == self._bucket_index:
+            return self._elevation
+        if self.precompute:
+            day = int(timestamp // DAY_SECONDS)
+            if day != self._table_day:
+                self._build_table(day)
+            self._elevation = self._table[int((timestamp - day * DAY_SECONDS) // self.bucket)]
+        else:
+            self._elevation = self._compute(index * self.bucket)
+        self._bucket_index = index
+        return self._elevation
+
+class LuxDiagnostic:
+    """
+    Plausibility check of lux sensors against the sun (SolarDiagnostic.validate_sensor).
+
+    The latest value of every entity matching `patterns` is kept, and check() validates
+    all of them in one pass against the cached solar elevation, including sensors that
+    stopped reporting (Home Assistant only sends changes, so a dead sensor stuck at 0 lux
+    goes quiet). `on_change(entity_id, status, lux, elevation)` is called only when a
+    sensor's status changes; sensors start as "ok".
+    """
+    OK = "ok"
+    SUSPECT = "suspect"
+
+    def __init__(self, patterns: List[str], solar: SolarElevationCache,
+                 on_change: Callable[[str, str, float, float], None]):
+        self.filter = FilterManager(patterns)
+        self.solar = solar
+        self.on_change = on_change
+        # entity_id -> latest lux
+        self._lux: Dict[str, float] = {}
+        self._status: Dict[str, str] = {}
+
+        self.checks = 0
+        self.changes = 0
+
+    def matches(self, entity_id: str) -> bool:
+        return self.filter.should_process(entity_id)
+
+    def offer(self, entity_id: str, lux: float):
+        """Record the latest value of a lux sensor (validated on the next check)."""
+        self._lux[entity_id] = lux
+
+    def check(self, timestamp: Optional[float] = None) -> List[Tuple[str, str]]:
+        """Validate every tracked sensor. :return: (entity_id, status) of the sensors that changed"""
+        elevation = self.solar.elevation(timestamp)
+        validate = SolarDiagnostic.validate_sensor
+        changed = []
+        for entity_id, lux in self._lux.items():
+            status = self.OK if validate(lux, elevation) else self.SUSPECT
+            if self._status.get(entity_id, self.OK) != status:
+                self._status[entity_id] = status
+                changed.append((entity_id, status))
+        self.checks += 1
+        self.changes += len(changed)
+        for entity_id, status in changed:
+            if status == self.SUSPECT:
+                logger.warning(f"Lux sensor {entity_id} is suspect: {self._lux[entity_id]} lx "
+                               f"at {elevation} deg solar elevation")
+            self.on_change(entity_id, status, self._lux[entity_id], elevation)
+        return changed
+
+    def stats(self) -> dict:
+        return {
+            "sensors": len(self._lux),
+            "suspect": sum(1 for s in self._status.values() if s == self.SUSPECT),
+            "checks": self.checks,
+            "changes": self.changes,
+            "elevations_computed": self.solar.computed,
+        }
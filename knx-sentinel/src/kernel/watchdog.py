@@ -1,6 +1,7 @@
+import heapq
 import time
 import logging
-from typing import Dict, List, Set, Callable
+from typing import Callable, Dict, List, Optional, Set, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -9,13 +10,26 @@ class WatchdogKernel:
     Monitors a set of 'heartbeat' entities.
     If an entity hasn't reported a value ('on' or 1.0) within `timeout` seconds,
     it triggers a callback (e.g., to publish a '0' via MQTT).
+
+    Deadlines are kept in a min-heap keyed on time.monotonic(), so a check only
+    touches entities that are actually due. Heartbeats re-arm lazily: they just
+    move the entity's deadline, and a stale heap entry is re-pushed when it
+    surfaces. The caller sleeps until `seconds_until_next()`.
     """
 
-    def __init__(self, entities: List[str], timeout: int = 70):
+    def __init__(self, entities: List[str], timeout: int = 70, timeouts: Optional[Dict[str, float]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        """
+        :param timeout: Default timeout in seconds
+        :param timeouts: Optional per-entity timeouts overriding the default
+        :param clock: Monotonic time source (injectable for tests and replay)
+        """
         self.monitored_entities: Set[str] = set(entities)
         self.timeout = timeout
+        self.timeouts: Dict[str, float] = dict(timeouts or {})
+        self.clock = clock
         
-        # Track last "on" time: {entity_id: timestamp}
+        # Track last "on" time: {entity_id: monotonic timestamp}
         self.last_seen: Dict[str, float] = {}
         
         # Track if we are currently in ALARM state for an entity
@@ -23,6 +37,26 @@ class WatchdogKernel:
         # {entity_id: bool_is_in_alarm}
         self.alarm_state: Dict[str, bool] = {}
 
+        # Scheduler: current deadline per armed entity + heap of (deadline, entity) entries,
+        # possibly stale (older than the entity's current deadline)
+        self._deadlines: Dict[str, float] = {}
+        self._heap: List[Tuple[float, str]] = []
+
+        # Called when an entity is armed with a deadline that may precede the next wakeup
+        self.on_rearm: Optional[Callable[[], None]] = None
+
+        # Give every entity a full timeout to report after start
+        now = self.clock()
+        for entity in self.monitored_entities:
+            self._arm(entity, now + self.timeout_for(entity))
+
+    def timeout_for(self, entity_id: str) -> float:
+        return self.timeouts.get(entity_id, self.timeout)
+
+    def _arm(self, entity_id: str, deadline: float):
+        self._deadlines[entity_id] = deadline
+        heapq.heappush(self._heap, (deadline, entity_id))
+
     def process_state(self, entity_id: str, value: float):
         """
         Update the heartbeat for an entity if the value indicates 'alive' (1.0).
@@ -34,28 +68,99 @@ class WatchdogKernel:
         # If value is 0.0, that might be an explicit 'death' signal, but usually
         # heartbeats are just periodic pulses of 1.
         if value > 0.5:
-            self.last_seen[entity_id] = time.time()
+            now = self.clock()
+            self.last_seen[entity_id] = now
+            deadline = now + self.timeout_for(entity_id)
+            if entity_id in self._deadlines:
+                # Lazy re-arm: the heap entry is fixed up when it surfaces
+                self._deadlines[entity_id] = deadline
+            else:
+                # Entity was in alarm (not scheduled): push a fresh deadline
+                self._arm(entity_id, deadline)
+                if self.on_rearm is not None:
+                    self.on_rearm()
             if self.alarm_state.get(entity_id, False):
                  logger.info(f"Watchdog: Entity {entity_id} RECOVERED.")
             self.alarm_state[entity_id] = False
 
-    def check_timeouts(self, on_timeout: Callable[[str], None]):
+    def snapshot(self) -> Dict[str, Tuple[float, bool]]:
         """
-        Check all monitored entities. If any have timed out, call the callback.
-        Should be called periodically (e.g. every 5-10s).
+        Per monitored entity: (seconds since its last heartbeat, or -1 if never seen; in alarm).
+        Ages are relative to now, so they survive a restart (the monotonic clock does not).
         """
-        now = time.time()
-        
-        for entity in self.monitored_entities:
-            # If we've never seen it, initialize to now to give it a chance to start
-            if entity not in self.last_seen:
-                self.last_seen[entity] = now
-            
-            last = self.last_seen[entity]
-            if (now - last) > self.timeout:
-                # TIMEOUT DETECTED
-                if not self.alarm_state.get(entity, False):
-                    # We are entering ALARM state
-                    logger.warning(f"Watchdog: Entity {entity} TIMED OUT (> {self.timeout}s). Publishing '0'.")
-                    self.alarm_state[entity] = True
-                    on_timeout(entity)
+        now = self.clock()
+        return {entity: (now - self.last_seen[entity] if entity in self.last_seen else -1.0,
+                         self.alarm_state.get(entity, False))
+                for entity in self.monitored_entities}
+
+    def restore(self, state: Dict[str, Tuple[float, bool]]) -> int:
+        """
+        Resume from a snapshot() taken before a restart. The countdown continues where it
+        stopped (downtime is not counted, nothing could be observed), and entities that were
+        in alarm stay in alarm without a second timeout being published.
+        :return: Number of entities restored
+        """
+        now = self.clock()
+        restored = 0
+        for entity, (age, in_alarm) in state.items():
+            if entity not in self.monitored_entities:
+                continue
+            restored += 1
+            if in_alarm:
+                self.alarm_state[entity] = True
+                self._deadlines.pop(entity, None)
+                continue
+            if age >= 0:
+                self.last_seen[entity] = now - age
+                self._arm(entity, now + max(0.0, self.timeout_for(entity) - age))
+        return restored
+
+    def check_timeouts(self, on_timeout: Callable[[str], None]) -> Optional[float]:
+        """
+        Fire the callback for every entity whose deadline has passed.
+        Only due heap entries are touched.
+        :return: Seconds until the next deadline, or None if nothing is scheduled
+        """
+        now = self.clock()
+        heap = self._heap
+
+        while heap and heap[0][0] <= now:
+            deadline, entity = heapq.heappop(heap)
+            current = self._deadlines.get(entity)
+            if current is None:
+                continue
+            if current > deadline:
+                # Heartbeat arrived since this entry was pushed
+                heapq.heappush(heap, (current, entity))
+                continue
+
+            # TIMEOUT DETECTED
+            del self._deadlines[entity]
+            if not self.alarm_state.get(entity, False):
+                # We are entering ALARM state
+                logger.warning(f"Watchdog: Entity {entity} TIMED OUT (> {self.timeout_for(entity)}s). Publishing '0'.")
+                self.alarm_state[entity] = True
+                on_timeout(entity)
+
+        return self.seconds_until_next()
+
+    def next_deadline(self) -> Optional[float]:
+        """Monotonic time of the next deadline, or None if nothing is scheduled."""
+        heap = self._heap
+        # Settle stale entries at the top so the caller does not wake up early
+        while heap:
+            deadline, entity = heap[0]
+            current = self._deadlines.get(entity)
+            if current is None:
+                heapq.heappop(heap)
+            elif current > deadline:
+                heapq.heapreplace(heap, (current, entity))
+            else:
+                return deadline
+        return None
+
+    def seconds_until_next(self) -> Optional[float]:
+        deadline = self.next_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline - self.clock())
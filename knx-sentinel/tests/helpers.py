@@ -0,0 +1,7 @@
+class FakeClock:
+    """Manually advanced clock for components that take a `clock` callable."""
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
@@ -0,0 +1,162 @@
+import random
+import unittest
+from unittest import mock
+from src.kernel import batch
+from src.kernel.batch import BatchZScoreScorer, MicroBatcher
+from src.kernel.buffer import WindowStore
+from src.kernel.math_engine import ZScoreEngine
+from src.kernel.registry import EngineRegistry
+from src.kernel.watchdog import WatchdogKernel
+import run
+
+class TestMicroBatcher(unittest.TestCase):
+    def _run(self):
+        rng = random.Random(3)
+        store = WindowStore(window_size=10, capacity=2)
+        results = []
+        batcher = MicroBatcher(store, BatchZScoreScorer(store, threshold=2.0),
+                               lambda eid, val, ctx, analysis: results.append((eid, val, ctx, analysis)))
+        reference = {}
+        expected = []
+        entities = [f"sensor.e{i}" for i in range(7)]
+        seq = 0
+        for _ in range(40):
+            # Several samples per entity per tick, including repeats
+            for _ in range(rng.randint(1, 20)):
+                eid = rng.choice(entities)
+                value = 100.0 + rng.gauss(0, 2) + (30.0 if rng.random() < 0.05 else 0.0)
+                engine = reference.setdefault(eid, ZScoreEngine(window_size=10, threshold=2.0))
+                expected.append((eid, value, seq, engine.process(value)))
+                batcher.add(eid, value, seq)
+                seq += 1
+            batcher.flush()
+        return expected, results
+
+    def _assert_matches(self, expected, results):
+        self.assertEqual(len(expected), len(results))
+        # Per-entity order must be preserved
+        by_entity = {}
+        for eid, value, seq, analysis in results:
+            by_entity.setdefault(eid, []).append((seq, value, analysis))
+        for eid, value, seq, analysis in expected:
+            got_seq, got_value, got = by_entity[eid].pop(0)
+            self.assertEqual((seq, value), (got_seq, got_value))
+            self.assertEqual(analysis.keys(), got.keys())
+            self.assertEqual(analysis["anomaly"], got["anomaly"])
+            self.assertAlmostEqual(analysis["z_score"], got["z_score"], delta=0.002)
+
+    @unittest.skipIf(batch.np is None, "numpy not installed")
+    def test_numpy_matches_per_event_engine(self):
+        self._assert_matches(*self._run())
+
+    def test_python_fallback_matches_per_event_engine(self):
+        with mock.patch.object(batch, "np", None):
+            self._assert_matches(*self._run())
+
+    def test_stable_and_insufficient(self):
+        store = WindowStore(window_size=5)
+        scorer = BatchZScoreScorer(store)
+        a, b = store.row("sensor.a"), store.row("sensor.b")
+        for _ in range(5):
+            store.add(a, 0.1)
+        store.add(b, 1.0)
+        results = scorer.score([a, b], [0.1, 1.0])
+        self.assertEqual(results[0]["msg"], "stable")
+        self.assertEqual(results[1]["msg"], "insufficient_data")
+
+    def test_is_outlier_uses_last_tick_moments(self):
+        store = WindowStore(window_size=10)
+        scorer = BatchZScoreScorer(store)
+        batcher = MicroBatcher(store, scorer, lambda *args: None)
+        reference = ZScoreEngine(window_size=10)
+        for v in [10.0, 11.0, 9.0, 10.5, 9.5, 10.0]:
+            batcher.add("sensor.a", v)
+            reference.process(v)
+        batcher.flush()
+        row = store.row("sensor.a")
+        for value in (10.2, 13.0, 20.0, 5.0):
+            self.assertEqual(scorer.is_outlier(row, value), reference.is_outlier(value))
+        # Rows loaded outside of a tick are computed on first use
+        restored = store.row("sensor.b")
+        store.load(restored, [5.0, 5.0, 5.0])
+        self.assertTrue(scorer.is_outlier(restored, 5.1))
+        self.assertFalse(scorer.is_outlier(restored, 5.0))
+
+    def test_non_finite_samples_stay_out_of_the_window(self):
+        store = WindowStore(window_size=10, capacity=2)
+        results = []
+        batcher = MicroBatcher(store, BatchZScoreScorer(store),
+                               lambda eid, val, ctx, analysis: results.append((ctx, analysis)))
+        for i, value in enumerate([1.0, 2.0, float("nan"), 3.0]):
+            batcher.add("sensor.a", value, i)
+        batcher.flush()
+        self.assertEqual([ctx for ctx, _ in results], [0, 1, 2, 3])
+        self.assertEqual(results[2][1]["error"], "non-finite value nan")
+        self.assertEqual(store.values(store.row("sensor.a")), [1.0, 2.0, 3.0])
+
+    def test_evicted_entity_is_not_scored_and_row_is_reused_clean(self):
+        store = WindowStore(window_size=5, capacity=1)
+        scorer = BatchZScoreScorer(store)
+        engines = EngineRegistry(lambda eid: ZScoreEngine(buffer=store.view(eid)), max_entities=1, store=store)
+        results = []
+        batcher = MicroBatcher(store, scorer, lambda eid, val, ctx, analysis: results.append(eid), engines=engines)
+        for v in [10.0, 11.0, 9.0, 10.0]:
+            engines.get("sensor.a")
+            batcher.add("sensor.a", v)
+        batcher.flush()
+        row = engines.peek("sensor.a").buffer.row
+        self.assertIn(row, scorer.moments)
+
+        engines.get("sensor.a")
+        batcher.add("sensor.a", 50.0)
+        # sensor.b evicts sensor.a before the flush: its row is released and reused
+        engines.get("sensor.b")
+        self.assertNotIn(row, scorer.moments)
+        batcher.flush()
+        self.assertEqual(results, ["sensor.a"] * 4)
+        self.assertEqual(batcher.dropped, 1)
+        self.assertEqual(len(store), 1)
+        self.assertEqual(store.counts[engines.peek("sensor.b").buffer.row], 0)
+        # The new owner of the row does not inherit the old moments
+        self.assertFalse(scorer.is_outlier(engines.peek("sensor.b").buffer.row, 50.0))
+
+class RecordingEgress:
+    def __init__(self):
+        self.published = []
+
+    def publish(self, metric_type, entity_id, payload):
+        self.published.append((entity_id, payload["value"], payload["analysis"]))
+
+class TestBatchModeRouting(unittest.TestCase):
+    def test_robust_entities_are_scored_per_event(self):
+        store = WindowStore(window_size=10)
+        egress = RecordingEgress()
+        with mock.patch.multiple(run, window_store=store, kernel_time=None, deadband=None, rollups=None,
+                                 lux_diagnostic=None, sharded_kernel=None, raw_telemetry=True):
+            run.z_engines = engines = run.make_engine_registry(ZScoreEngine, rules=["sensor.meter=robust"])
+            run.batcher = MicroBatcher(store, BatchZScoreScorer(store),
+                                       lambda eid, val, ctx, analysis: egress.publish("telemetry", eid,
+                                                                                      {"value": val, "analysis": analysis}),
+                                       engines=engines)
+            try:
+                watchdog = WatchdogKernel([])
+                for i, v in enumerate([10.0, 10.2, 9.8, 10.1, 9.9, 10.0]):
+                    for eid in ("sensor.meter", "sensor.temp"):
+                        run.handle_event({"event": {"event_type": "state_changed", "data": {
+                            "entity_id": eid, "new_state": {"state": str(v), "last_updated": str(i)}}}},
+                            egress, watchdog, {})
+                # The robust entity was published immediately, the Z-Score one waits for the tick
+                self.assertEqual({eid for eid, _, _ in egress.published}, {"sensor.meter"})
+                self.assertTrue(run.would_be_anomaly("sensor.meter", "50"))
+                run.batcher.flush()
+                self.assertEqual(len(egress.published), 12)
+                self.assertTrue(run.would_be_anomaly("sensor.temp", "50"))
+                self.assertFalse(run.would_be_anomaly("sensor.temp", "10"))
+                meter = [analysis for eid, _, analysis in egress.published if eid == "sensor.meter"]
+                self.assertIn("median", meter[-1])
+            finally:
+                run.batcher = None
+                run.z_engines = run.make_engine_registry()
+
+if __name__ == '__main__':
+    unittest.main()
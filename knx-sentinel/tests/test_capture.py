@@ -0,0 +1,146 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+import aiohttp
+import run
+from benchmarks.replay import replay
+from src.ingestion.capture import CaptureWriter, capture_files, read_capture, read_capture_set
+from src.ingestion.filter import FilterManager
+from src.ingestion.websocket_client import HomeAssistantClient
+from src.kernel.math_engine import EwmaEngine, RobustZScoreEngine
+
+def state_frame(entity_id: str, state: str, stamp: str) -> str:
+    return json.dumps({"id": 2, "type": "event", "event": {"event_type": "state_changed", "data": {
+        "entity_id": entity_id, "old_state": None,
+        "new_state": {"entity_id": entity_id, "state": state, "attributes": {}, "last_updated": stamp}}}})
+
+def knx_frame(destination: str) -> str:
+    return json.dumps({"id": 3, "type": "event", "event": {"event_type": "knx_event", "time_fired": "t",
+                                                          "data": {"destination": destination}}})
+
+class FrameSource:
+    def __init__(self, frames):
+        self._messages = [SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=f) for f in frames]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for m in self._messages:
+            yield m
+
+class TestCaptureWriter(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "capture", "frames.gz")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_round_trip_and_truncated_tail(self):
+        writer = CaptureWriter(self.path, flush_interval=0)
+        frames = [state_frame("sensor.a", str(i), str(i)) for i in range(100)]
+        for i, frame in enumerate(frames):
+            writer.write(frame, received_at=1000.0 + i)
+        # Readable while still open (sync-flushed, no gzip trailer yet)
+        self.assertEqual([f for _, f in read_capture(self.path)], frames)
+        writer.close()
+        records = list(read_capture(self.path))
+        self.assertEqual(records[0], (1000.0, frames[0]))
+        self.assertEqual(len(records), 100)
+
+    def test_rotation_keeps_order_and_backups(self):
+        writer = CaptureWriter(self.path, max_bytes=1500, backups=3, flush_interval=0)
+        for i in range(3000):
+            writer.write(json.dumps({"type": "event", "n": i, "pad": os.urandom(6).hex()}), received_at=float(i))
+        writer.close()
+        self.assertGreater(writer.rotations, 3)
+        self.assertEqual(len(capture_files(self.path)), 4)
+        stamps = [t for t, _ in read_capture_set(self.path)]
+        self.assertEqual(stamps, sorted(stamps))
+        self.assertEqual(stamps[-1], 2999.0)
+
+    def test_existing_file_is_rotated_on_start(self):
+        CaptureWriter(self.path).close()
+        writer = CaptureWriter(self.path)
+        writer.write("{}", received_at=1.0)
+        writer.close()
+        old = CaptureWriter(self.path)
+        old.close()
+        self.assertEqual(capture_files(self.path), [self.path + ".2", self.path + ".1", self.path])
+
+class TestClientCapture(unittest.IsolatedAsyncioTestCase):
+    async def test_captures_raw_frames_before_filtering(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, "frames.gz")
+            capture = CaptureWriter(path)
+            received = []
+            client = HomeAssistantClient("ws://x/core/websocket", "t", received.append,
+                                         filter_manager=FilterManager(["sensor.knx*"]), capture=capture)
+            frames = [state_frame("light.kitchen", "on", "a"), state_frame("sensor.knx_1", "2", "b")]
+            client.ws = FrameSource(frames)
+            await client._handle_messages()
+            capture.close()
+            self.assertEqual([f for _, f in read_capture(path)], frames)
+        finally:
+            shutil.rmtree(tmp)
+
+class TestReplay(unittest.TestCase):
+    OPTIONS = {"client_id": "c", "site_id": "s", "target_entities": ["sensor.*"],
+               "watchdog_entities": ["6/1/1@10=binary_sensor.heartbeat"]}
+
+    def make_records(self):
+        records = []
+        t = 5000.0
+        for i in range(200):
+            value = "900" if i == 151 else ("500" if i % 2 else "501")
+            records.append((t, state_frame(f"sensor.e{i % 4}", value, str(i))))
+            records.append((t, state_frame("light.kitchen", "on", str(i))))
+            if i < 20:
+                records.append((t, knx_frame("6/1/1")))
+            t += 1.0
+        return records
+
+    def run_replay(self):
+        published = []
+        stats = replay(self.make_records(), self.OPTIONS,
+                       on_publish=lambda t, topic, payload: published.append((t, topic, payload)))
+        return stats, published
+
+    def test_deterministic(self):
+        stats1, first = self.run_replay()
+        stats2, second = self.run_replay()
+        self.assertEqual(first, second)
+        self.assertEqual(stats1["frames"], 420)
+        self.assertTrue(any(json.loads(p)["analysis"].get("anomaly") for _, topic, p in first if "sensor.e" in topic))
+
+    def test_uses_kernel_options(self):
+        options = {**self.OPTIONS, "kernel_engine_rules": ["sensor.e3=ewma", "sensor.e1=robust"],
+                   "kernel_max_entities": 3}
+        replay(self.make_records(), options)
+        self.assertEqual(len(run.z_engines), 3)
+        self.assertIsInstance(run.z_engines.peek("sensor.e1"), RobustZScoreEngine)
+        self.assertIsInstance(run.z_engines.peek("sensor.e3"), EwmaEngine)
+        self.assertIsNone(run.z_engines.peek("sensor.e0"))  # least recently used, evicted
+
+    def test_watchdog_fires_at_virtual_deadline(self):
+        stats, published = self.run_replay()
+        self.assertEqual(stats["timeouts"], 1)
+        timeouts = [(t, json.loads(p)) for t, topic, p in published if topic.endswith("binary_sensor.heartbeat")
+                    and json.loads(p).get("status") == "timeout"]
+        # Last heartbeat at 5019s, timeout 10s
+        self.assertEqual(timeouts[0][0], 5029.0)
+        self.assertEqual(timeouts[0][1]["timestamp"], 5029.0)
+
+    def test_speed_paces_by_capture_time(self):
+        sleeps = []
+        replay([(0.0, knx_frame("1/1/1")), (2.0, knx_frame("1/1/1"))], self.OPTIONS, speed=4, sleep=sleeps.append)
+        self.assertEqual(len(sleeps), 1)
+        self.assertAlmostEqual(sleeps[0], 0.5, places=2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+from src.ingestion.conflation import Conflator
+
+def state_event(entity_id: str, value) -> dict:
+    return {"type": "event", "event": {"event_type": "state_changed",
+                                       "data": {"entity_id": entity_id, "new_state": {"state": str(value)}}}}
+
+def knx_event(destination: str) -> dict:
+    return {"type": "event", "event": {"event_type": "knx_event", "data": {"destination": destination}}}
+
+class TestConflator(unittest.TestCase):
+    def setUp(self):
+        self.delivered = []
+
+    def test_keeps_latest_per_entity(self):
+        c = Conflator(self.delivered.append)
+        for v in range(5):
+            c.offer(state_event("sensor.a", v))
+        c.offer(state_event("sensor.b", 9))
+        self.assertEqual(self.delivered, [])
+        self.assertEqual(c.flush(), 2)
+        states = [(d["event"]["data"]["entity_id"], d["event"]["data"]["new_state"]["state"], d.get("conflated"))
+                  for d in self.delivered]
+        self.assertEqual(states, [("sensor.a", "4", 4), ("sensor.b", "9", None)])
+        self.assertEqual(c.stats()["collapsed"], 4)
+
+    def test_non_state_events_pass_through(self):
+        c = Conflator(self.delivered.append)
+        c.offer(knx_event("6/1/1"))
+        self.assertEqual(len(self.delivered), 1)
+
+    def test_priority_is_never_collapsed(self):
+        c = Conflator(self.delivered.append,
+                      is_priority=lambda d: d["event"]["data"]["new_state"]["state"] == "999")
+        c.offer(state_event("sensor.a", 1))
+        c.offer(state_event("sensor.a", 999))
+        c.offer(state_event("sensor.a", 2))
+        self.assertEqual([d["event"]["data"]["new_state"]["state"] for d in self.delivered], ["999"])
+        self.assertEqual(self.delivered[0]["conflated"], 1)
+        c.flush()
+        self.assertEqual([d["event"]["data"]["new_state"]["state"] for d in self.delivered], ["999", "2"])
+        self.assertEqual(c.stats()["priority"], 1)
+
+    def test_pending_priority_is_delivered_not_replaced(self):
+        checked = []
+
+        def is_priority(d):
+            checked.append(d["event"]["data"]["new_state"]["state"])
+            return checked[-1] == "999"
+
+        c = Conflator(self.delivered.append, is_priority=is_priority)
+        c.offer(state_event("sensor.a", 999))
+        # Nothing to collapse yet: no check
+        self.assertEqual(checked, [])
+        c.offer(state_event("sensor.a", 1))
+        self.assertEqual([d["event"]["data"]["new_state"]["state"] for d in self.delivered], ["999"])
+        c.offer(state_event("sensor.a", 2))
+        c.flush()
+        self.assertEqual([d["event"]["data"]["new_state"]["state"] for d in self.delivered], ["999", "2"])
+        self.assertEqual(self.delivered[1]["conflated"], 1)
+
+if __name__ == '__main__':
+    unittest.main()
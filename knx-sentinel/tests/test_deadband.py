@@ -0,0 +1,61 @@
+import unittest
+from src.egress.deadband import DeadbandFilter, DeadbandRule
+from tests.helpers import FakeClock
+
+class TestDeadbandRule(unittest.TestCase):
+    def test_parse(self):
+        rule = DeadbandRule.parse("sensor.volt*=abs:0.5,pct:1")
+        self.assertEqual((rule.pattern, rule.absolute, rule.percent), ("sensor.volt*", 0.5, 1.0))
+        self.assertEqual(DeadbandRule.parse("'sensor.p=pct:2'").percent, 2.0)
+        with self.assertRaises(ValueError):
+            DeadbandRule.parse("sensor.x")
+        with self.assertRaises(ValueError):
+            DeadbandRule.parse("sensor.x=foo:1")
+
+    def test_band_uses_larger_of_abs_and_pct(self):
+        rule = DeadbandRule("x", absolute=0.5, percent=1.0)
+        self.assertEqual(rule.band(10.0), 0.5)
+        self.assertEqual(rule.band(230.0), 2.3)
+
+class TestDeadbandFilter(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.db = DeadbandFilter(["sensor.volt*=abs:0.5"], keepalive=60, clock=self.clock)
+
+    def test_suppresses_within_band(self):
+        sent = [self.db.should_publish("sensor.volt_l1", v) for v in [230.0, 230.2, 230.4, 230.6, 230.7]]
+        self.assertEqual(sent, [True, False, False, True, False])
+        self.assertEqual(self.db.stats()["suppressed"], 3)
+        self.assertEqual(self.db.stats()["rules"]["sensor.volt*"], {"sent": 2, "suppressed": 3})
+
+    def test_anomaly_and_keepalive_bypass_band(self):
+        self.db.should_publish("sensor.volt_l1", 230.0)
+        self.assertTrue(self.db.should_publish("sensor.volt_l1", 230.1, anomaly=True))
+        self.assertFalse(self.db.should_publish("sensor.volt_l1", 230.1))
+        self.clock.now = 61
+        self.assertTrue(self.db.should_publish("sensor.volt_l1", 230.1))
+
+    def test_unmatched_entities_always_sent(self):
+        self.assertTrue(self.db.should_publish("sensor.temp", 1.0))
+        self.assertTrue(self.db.should_publish("sensor.temp", 1.0))
+        self.assertEqual(self.db.stats()["suppressed"], 0)
+
+    def test_rules_match_like_target_entities(self):
+        db = DeadbandFilter(["sensor.meter=abs:5", "sensor.p?_power=pct:2", "sensor.*=abs:1"], clock=self.clock)
+        self.assertEqual(db.rule_for("sensor.meter").absolute, 5)
+        self.assertEqual(db.rule_for("sensor.p1_power").percent, 2)
+        self.assertEqual(db.rule_for("sensor.p10_power").absolute, 1)
+        self.assertIsNone(db.rule_for("light.sensor"))
+
+    def test_state_is_bounded(self):
+        db = DeadbandFilter(["sensor.*=abs:1"], keepalive=60, clock=self.clock, max_entities=3)
+        for i in range(10):
+            db.should_publish(f"sensor.e{i}", 1.0)
+        self.assertEqual(db.stats()["entities"], 3)
+        self.assertLessEqual(len(db._rule_cache), 3)
+        # Forgotten entities publish their next value
+        self.assertTrue(db.should_publish("sensor.e0", 1.0))
+        self.assertFalse(db.should_publish("sensor.e9", 1.0))
+
+if __name__ == '__main__':
+    unittest.main()
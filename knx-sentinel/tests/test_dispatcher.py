@@ -0,0 +1,104 @@
+import asyncio
+import unittest
+from src.ingestion.dispatcher import EventDispatcher
+
+def state_event(entity_id: str, value: int) -> dict:
+    return {"type": "event", "event": {"event_type": "state_changed",
+                                       "data": {"entity_id": entity_id, "new_state": {"state": str(value)}}}}
+
+def value_of(data: dict) -> int:
+    return int(data["event"]["data"]["new_state"]["state"])
+
+class TestEventDispatcher(unittest.IsolatedAsyncioTestCase):
+    async def test_per_entity_order(self):
+        seen = {}
+        dispatcher = EventDispatcher(lambda d: seen.setdefault(d["event"]["data"]["entity_id"], []).append(value_of(d)),
+                                     workers=3, maxsize=8)
+        dispatcher.start()
+        for i in range(200):
+            await dispatcher.put(state_event(f"sensor.e{i % 5}", i))
+        await dispatcher.stop()
+        self.assertEqual(sum(len(v) for v in seen.values()), 200)
+        for values in seen.values():
+            self.assertEqual(values, sorted(values))
+        self.assertEqual(dispatcher.stats()["processed"], 200)
+
+    async def test_block_applies_backpressure(self):
+        dispatcher = EventDispatcher(lambda d: None, workers=1, maxsize=2, overflow="block")
+        await dispatcher.put(state_event("sensor.a", 1))
+        await dispatcher.put(state_event("sensor.a", 2))
+        put = asyncio.create_task(dispatcher.put(state_event("sensor.a", 3)))
+        await asyncio.sleep(0.05)
+        self.assertFalse(put.done())
+        dispatcher.start()
+        await asyncio.wait_for(put, timeout=1.0)
+        await dispatcher.stop()
+        self.assertEqual(dispatcher.stats()["dropped"], 0)
+
+    async def test_drop_oldest(self):
+        seen = []
+        dispatcher = EventDispatcher(lambda d: seen.append(value_of(d)), workers=1, maxsize=3, overflow="drop_oldest")
+        for i in range(5):
+            await dispatcher.put(state_event(f"sensor.e{i}", i))
+        self.assertEqual(dispatcher.depth, 3)
+        await dispatcher.stop()
+        self.assertEqual(seen, [2, 3, 4])
+        self.assertEqual(dispatcher.stats()["dropped"], 2)
+
+    async def test_drop_oldest_spares_priority(self):
+        seen = []
+        dispatcher = EventDispatcher(lambda d: seen.append(value_of(d)), workers=1, maxsize=3,
+                                     overflow="drop_oldest", is_priority=lambda d: value_of(d) < 2)
+        for i in range(4):
+            await dispatcher.put(state_event(f"sensor.e{i}", i))
+        await dispatcher.stop()
+        self.assertEqual(seen, [0, 1, 3])
+
+    async def test_priority_only_checked_when_full(self):
+        calls = []
+        dispatcher = EventDispatcher(lambda d: None, workers=1, maxsize=2, overflow="drop_oldest",
+                                     is_priority=lambda d: calls.append(value_of(d)) or False)
+        await dispatcher.put(state_event("sensor.a", 1))
+        await dispatcher.put(state_event("sensor.b", 2))
+        self.assertEqual(calls, [])
+        await dispatcher.put(state_event("sensor.c", 3))
+        # Only the entry being shed was evaluated
+        self.assertEqual(calls, [1])
+        await dispatcher.stop()
+
+    async def test_conflate_keeps_latest(self):
+        seen = []
+        dispatcher = EventDispatcher(lambda d: seen.append((d["event"]["data"]["entity_id"], value_of(d))),
+                                     workers=1, maxsize=2, overflow="conflate")
+        await dispatcher.put(state_event("sensor.a", 1))
+        await dispatcher.put(state_event("sensor.b", 2))
+        await dispatcher.put(state_event("sensor.a", 3))
+        await dispatcher.stop()
+        self.assertEqual(seen, [("sensor.a", 3), ("sensor.b", 2)])
+        self.assertEqual(dispatcher.stats()["conflated"], 1)
+
+    async def test_conflate_only_when_full(self):
+        seen = []
+        dispatcher = EventDispatcher(lambda d: seen.append(value_of(d)), workers=1, maxsize=10, overflow="conflate")
+        for i in range(3):
+            await dispatcher.put(state_event("sensor.a", i))
+        await dispatcher.stop()
+        self.assertEqual(seen, [0, 1, 2])
+        self.assertEqual(dispatcher.stats()["conflated"], 0)
+
+    async def test_conflate_never_merges_keyless_events(self):
+        seen = []
+        dispatcher = EventDispatcher(lambda d: seen.append(d["n"]), workers=1, maxsize=2, overflow="conflate")
+        await dispatcher.put({"n": 0})
+        await dispatcher.put({"n": 1})
+        put = asyncio.create_task(dispatcher.put({"n": 2}))
+        await asyncio.sleep(0.05)
+        self.assertFalse(put.done())
+        dispatcher.start()
+        await asyncio.wait_for(put, timeout=1.0)
+        await dispatcher.stop()
+        self.assertEqual(seen, [0, 1, 2])
+        self.assertEqual(dispatcher.stats()["conflated"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
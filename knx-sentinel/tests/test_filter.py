@@ -24,6 +24,42 @@ class TestFilterManager(unittest.TestCase):
         self.assertFalse(fm.should_process("sensor.temp_10")) # ? matches single char
         self.assertFalse(fm.should_process("zwave.switch"))
 
+    def test_matches_fnmatch(self):
+        import fnmatch
+        patterns = ["sensor.knx*", "*_temp_[0-9]", "light.?oom*", "binary_sensor.door"]
+        fm = FilterManager(patterns)
+        candidates = ["sensor.knx_1", "sensor.kitchen_temp_3", "sensor.kitchen_temp_x",
+                      "light.room_1", "light.broom", "binary_sensor.door", "binary_sensor.doors"]
+        for eid in candidates:
+            expected = any(fnmatch.fnmatch(eid, p) for p in patterns)
+            self.assertEqual(fm.should_process(eid), expected, eid)
+            # Second lookup comes from the cache
+            self.assertEqual(fm.should_process(eid), expected, eid)
+
+    def test_update_targets_invalidates_cache(self):
+        fm = FilterManager(["sensor.a*"])
+        self.assertFalse(fm.should_process("sensor.b1"))
+        fm.update_targets(["sensor.b*"])
+        self.assertTrue(fm.should_process("sensor.b1"))
+        self.assertFalse(fm.should_process("sensor.a1"))
+
+    def test_cache_is_bounded(self):
+        fm = FilterManager(["sensor.*"], cache_size=8)
+        for i in range(100):
+            fm.should_process(f"sensor.s{i}")
+        self.assertEqual(len(fm._cache), 8)
+
+    def test_cache_can_be_disabled(self):
+        fm = FilterManager(["sensor.*", "light.kitchen"], cache_size=0)
+        self.assertTrue(fm.should_process("sensor.s1"))
+        self.assertTrue(fm.should_process("light.kitchen"))
+        self.assertFalse(fm.should_process("light.hall"))
+        self.assertEqual(len(fm._cache), 0)
+        # Exact matches only: nothing to cache
+        exact = FilterManager(["light.kitchen"])
+        self.assertTrue(exact.should_process("light.kitchen"))
+        self.assertEqual(len(exact._cache), 0)
+
     def test_null_entity(self):
         fm = FilterManager(["*"])
         self.assertFalse(fm.should_process(None))
@@ -0,0 +1,144 @@
+import asyncio
+import unittest
+from aiohttp import web
+import run
+from benchmarks.bench_pipeline import reset_kernel
+from mock import supervisor
+from src.ingestion.filter import FilterManager
+from src.ingestion.history import HistorySeeder, parse_history
+from src.ingestion.websocket_client import HomeAssistantClient
+
+class TestParseHistory(unittest.TestCase):
+    def test_compressed_and_full_formats(self):
+        items = [{"s": "2", "lu": 20.0}, {"s": "1", "lc": 10.0},
+                 {"state": "3", "last_updated": "1970-01-01T00:00:30+00:00"}]
+        self.assertEqual(parse_history(items), ["1", "2", "3"])
+
+    def test_end_time_excludes_live_states(self):
+        self.assertEqual(parse_history([{"s": "1", "lu": 10.0}, {"s": "2", "lu": 20.0}], end_time=20.0), ["1"])
+
+class TestSeedWindows(unittest.TestCase):
+    def test_non_finite_history_is_skipped(self):
+        reset_kernel(60, True)
+        run.z_engines = run.make_engine_registry(None, rules=["sensor.r*=robust", "sensor.w*=ewma"])
+        history = {eid: ["1.0", "nan", "2.0", "unavailable", "inf", "3.0"]
+                   for eid in ["sensor.r", "sensor.w", "sensor.z"]}
+        self.assertEqual(run.seed_windows(history), 3)
+        for eid in history:
+            engine = run.z_engines.peek(eid)
+            self.assertEqual(engine.samples, 3, eid)
+            self.assertNotIn("error", engine.process(2.0))
+
+class TestHistorySeeder(unittest.IsolatedAsyncioTestCase):
+    async def test_bounded_parallel_chunks(self):
+        in_flight, peak, calls = 0, 0, []
+
+        async def request(type_str, **kwargs):
+            nonlocal in_flight, peak
+            calls.append(kwargs["entity_ids"])
+            in_flight += 1
+            peak = max(peak, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            if "sensor.e10" in kwargs["entity_ids"]:
+                raise RuntimeError("Command failed: recorder busy")
+            return {eid: [{"s": "1.5", "lu": 1.0}] for eid in kwargs["entity_ids"]}
+
+        seeded = {}
+        seeder = HistorySeeder(lambda history: seeded.update(history) or len(history),
+                               concurrency=2, chunk_size=4)
+        entities = [f"sensor.e{i}" for i in range(20)]
+        with self.assertLogs("src.ingestion.history", level="WARNING"):
+            self.assertEqual(await seeder.run(request, entities, end_time=100.0), 16)
+        self.assertEqual(len(calls), 5)
+        self.assertEqual(peak, 2)
+        self.assertNotIn("sensor.e10", seeded)
+        self.assertEqual(seeder.stats()["failed"], 1)
+        self.assertEqual(seeder.stats()["samples"], 16)
+
+def state_frame(entity_id: str, state: str) -> dict:
+    return {"type": "event", "event": {"event_type": "state_changed",
+                                       "data": {"entity_id": entity_id, "new_state": {"state": state}}}}
+
+class TestHeldEvents(unittest.IsolatedAsyncioTestCase):
+    async def test_only_state_changes_of_seeded_entities_are_held(self):
+        delivered = []
+        client = HomeAssistantClient("ws://unused", "token", delivered.append)
+        client._held = []
+        await client._process_frame({"type": "event", "event": {"event_type": "knx_event",
+                                                                "data": {"destination": "6/1/1"}}})
+        await client._process_frame(state_frame("sensor.a", "1"))
+        await client._process_frame(state_frame("sensor.other", "1"))
+        await asyncio.sleep(0)
+        # Watchdog heartbeats are never held
+        self.assertEqual([d["event"]["event_type"] for d in delivered], ["knx_event"])
+
+        await client._release_unseeded({"sensor.a"})
+        await client._process_frame(state_frame("sensor.other", "2"))
+        await client._process_frame(state_frame("sensor.a", "2"))
+        await asyncio.sleep(0)
+        self.assertEqual([d["event"]["data"]["new_state"]["state"] for d in delivered[1:]], ["1", "2"])
+        self.assertEqual(len(client._held), 2)
+
+        await client._release_held()
+        await asyncio.sleep(0)
+        self.assertEqual([(d["event"]["data"]["entity_id"], d["event"]["data"]["new_state"]["state"])
+                          for d in delivered[3:]], [("sensor.a", "1"), ("sensor.a", "2")])
+
+class TestSeedingWithMock(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.add_routes([web.get('/core/websocket', supervisor.websocket_handler)])
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, 'localhost', 8125).start()
+        supervisor.backfill_history(30, interval=10.0)
+        supervisor.HISTORY_DELAY = 0.3
+
+    async def asyncTearDown(self):
+        supervisor.HISTORY_DELAY = 0.0
+        supervisor.MOCK_HISTORY.clear()
+        await self.runner.cleanup()
+
+    async def test_live_events_held_until_seeded(self):
+        log = []
+
+        def on_seed(history):
+            log.append(("seed", sorted(history)))
+            return len(history)
+
+        seeder = HistorySeeder(on_seed, lookback=3600)
+        client = HomeAssistantClient("ws://localhost:8125/core/websocket", "token",
+                                     lambda m: log.append(("event", m["event"]["data"]["new_state"]["state"])),
+                                     filter_manager=FilterManager(["sensor.voltage_*"]),
+                                     history_seeder=seeder)
+        task = asyncio.create_task(client.connect())
+        try:
+            await self._wait_for(lambda: client._held is not None)
+            await asyncio.sleep(0.05)
+            # Sent while the history requests are being answered
+            await supervisor.emit_state("sensor.voltage_L1", "300")
+            await supervisor.emit_state("sensor.voltage_L1", "301")
+            await self._wait_for(lambda: ("event", "301") in log)
+        finally:
+            await client.close()
+            try:
+                await asyncio.wait_for(task, timeout=1.0)
+            except Exception:
+                pass
+
+        self.assertEqual(log[0], ("seed", ["sensor.voltage_L1", "sensor.voltage_L2"]))
+        events = [value for kind, value in log if kind == "event"]
+        self.assertLess(events.index("300"), events.index("301"))
+        self.assertEqual(seeder.stats()["samples"], 60)
+        self.assertTrue(client._seeded)
+
+    async def _wait_for(self, predicate, timeout: float = 5.0):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not predicate():
+            self.assertLess(loop.time(), deadline, "Timed out waiting for condition")
+            await asyncio.sleep(0.01)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,8 +1,10 @@
 import asyncio
 import unittest
 from aiohttp import web
+from mock import supervisor
 from mock.supervisor import websocket_handler
 from src.ingestion.websocket_client import HomeAssistantClient
+from src.ingestion.filter import FilterManager
 import logging
 
 # Mute logs for test clarity
@@ -55,6 +57,49 @@ class TestIntegration(unittest.IsolatedAsyncioTestCase):
         # 1. We expect client to have subscribed (logs would show)
         # 2. We expect to receive at least 1 mock event
         self.assertGreater(len(self.received_messages), 0, "Should have received events from mock server")
+
+    async def test_targeted_subscription(self):
+        client = HomeAssistantClient(
+            supervisor_url="ws://localhost:8124/core/websocket",
+            token="fake_token",
+            on_message=self.callback,
+            filter_manager=FilterManager(["sensor.voltage_*"]),
+            ingestion_mode="targeted"
+        )
+        task = asyncio.create_task(client.connect())
+        try:
+            await self._wait_for(lambda: client.targeted_entities)
+            self.assertEqual(client.targeted_entities, {"sensor.voltage_L1", "sensor.voltage_L2"})
+
+            # Only subscribed entities are delivered, in state_changed shape
+            await supervisor.emit_state("light.kitchen", "on")
+            await supervisor.emit_state("sensor.voltage_L2", "229")
+            await self._wait_for(lambda: any(
+                m["event"]["data"]["new_state"]["state"] == "229" for m in self.received_messages))
+            for m in self.received_messages:
+                self.assertEqual(m["event"]["event_type"], "state_changed")
+                self.assertTrue(m["event"]["data"]["entity_id"].startswith("sensor.voltage_"))
+
+            # New matching entity triggers a re-resolve
+            await supervisor.register_entity("sensor.voltage_L3", "230")
+            await self._wait_for(lambda: "sensor.voltage_L3" in client.targeted_entities)
+            await supervisor.emit_state("sensor.voltage_L3", "241")
+            await self._wait_for(lambda: any(
+                m["event"]["data"]["entity_id"] == "sensor.voltage_L3" for m in self.received_messages))
+        finally:
+            supervisor.MOCK_STATES.pop("sensor.voltage_L3", None)
+            await client.close()
+            try:
+                await asyncio.wait_for(task, timeout=1.0)
+            except Exception:
+                pass
+
+    async def _wait_for(self, predicate, timeout: float = 5.0):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while not predicate():
+            self.assertLess(loop.time(), deadline, "Timed out waiting for condition")
+            await asyncio.sleep(0.05)
         
 if __name__ == "__main__":
     unittest.main()
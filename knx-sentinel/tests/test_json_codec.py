@@ -0,0 +1,30 @@
+import json
+import unittest
+from unittest import mock
+from src.common import json_codec
+
+class TestJsonCodec(unittest.TestCase):
+    PAYLOAD = {"value": float("nan"), "z": [1.5, float("inf"), -float("inf")], "ok": 2.0}
+    EXPECTED = {"value": None, "z": [1.5, None, None], "ok": 2.0}
+
+    def test_non_finite_written_as_null(self):
+        self.assertEqual(json.loads(json_codec.dumps(self.PAYLOAD)), self.EXPECTED)
+
+    def test_stdlib_backend_matches(self):
+        with mock.patch.object(json_codec, "orjson", None):
+            out = json_codec.dumps(self.PAYLOAD)
+        self.assertIsInstance(out, str)
+        self.assertEqual(json.loads(out), self.EXPECTED)
+
+    def test_stdlib_fallback_for_non_str_keys(self):
+        # orjson rejects int keys; the stdlib path must still sanitise
+        out = json_codec.dumps({1: float("nan")})
+        self.assertEqual(json.loads(out), {"1": None})
+
+    def test_round_trip(self):
+        for backend in (json_codec.orjson, None):
+            with mock.patch.object(json_codec, "orjson", backend):
+                self.assertEqual(json_codec.loads(json_codec.dumps({"a": [1, "b"]})), {"a": [1, "b"]})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,8 @@
+import random
+import statistics
 import unittest
-from src.kernel.math_engine import ZScoreEngine, LinearDiagnostic, SolarDiagnostic
-from src.kernel.buffer import BufferManager
+from src.kernel.math_engine import ZScoreEngine, StreamingZScoreEngine, RobustZScoreEngine, EwmaEngine, LinearDiagnostic, SolarDiagnostic
+from src.kernel.buffer import BufferManager, WindowStore
 
 class TestBufferManager(unittest.TestCase):
     def test_circular_buffer(self):
@@ -10,8 +12,52 @@ class TestBufferManager(unittest.TestCase):
         buf.add(3)
         self.assertEqual(buf.get_all(), [1, 2, 3])
         
-        buf.add(4)
+        evicted = buf.add(4)
         self.assertEqual(buf.get_all(), [2, 3, 4]) # 1 should be evicted
+        self.assertEqual(evicted, 1)
+
+    def test_wraps_and_clears(self):
+        buf = BufferManager(maxlen=3)
+        for v in range(10):
+            buf.add(v)
+        self.assertEqual(buf.get_all(), [7, 8, 9])
+        self.assertTrue(buf.is_full())
+        buf.clear()
+        self.assertEqual((buf.size, buf.get_all()), (0, []))
+        self.assertIsNone(buf.add(1.5))
+        self.assertEqual(buf.get_all(), [1.5])
+
+class TestWindowStore(unittest.TestCase):
+    def test_ring_per_row(self):
+        store = WindowStore(window_size=3, capacity=1)
+        a = store.view("sensor.a")
+        b = store.view("sensor.b") # forces the store to grow
+        for v in [1, 2, 3]:
+            self.assertIsNone(a.add(v))
+        b.add(10)
+        self.assertEqual(a.add(4), 1)
+        self.assertEqual(a.get_all(), [2, 3, 4])
+        self.assertEqual(b.get_all(), [10])
+        self.assertTrue(a.is_full())
+        self.assertEqual(b.size, 1)
+        self.assertEqual(store.capacity, 2)
+
+    def test_release_reuses_row(self):
+        store = WindowStore(window_size=4, capacity=2)
+        row = store.row("sensor.a")
+        store.add(row, 5.0)
+        store.release("sensor.a")
+        self.assertEqual(store.row("sensor.b"), row)
+        self.assertEqual(store.values(row), [])
+
+    def test_engine_on_store_matches_private_buffer(self):
+        store = WindowStore(window_size=10)
+        on_store = StreamingZScoreEngine(buffer=store.view("sensor.a"))
+        private = StreamingZScoreEngine(window_size=10)
+        rng = random.Random(1)
+        for _ in range(100):
+            v = rng.uniform(0, 100)
+            self.assertEqual(on_store.process(v), private.process(v))
 
 class TestZScoreEngine(unittest.TestCase):
     def test_stable_detection(self):
@@ -43,6 +89,198 @@ class TestZScoreEngine(unittest.TestCase):
         self.assertTrue(result["anomaly"])
         self.assertGreater(result["z_score"], 2.0)
 
+class TestStreamingZScoreEngine(unittest.TestCase):
+    def test_matches_exact_engine(self):
+        rng = random.Random(42)
+        exact = ZScoreEngine(window_size=20, threshold=2.0)
+        streaming = StreamingZScoreEngine(window_size=20, threshold=2.0, resync_interval=500)
+        for i in range(2000):
+            # Drifting baseline with occasional spikes
+            value = 230.0 + i * 0.01 + rng.gauss(0, 1.5)
+            if i % 97 == 0:
+                value += 25.0
+            expected = exact.process(value)
+            actual = streaming.process(value)
+            self.assertEqual(expected.keys(), actual.keys())
+            self.assertEqual(expected["anomaly"], actual["anomaly"])
+            self.assertAlmostEqual(expected["z_score"], actual["z_score"], delta=0.002)
+            if "mean" in expected:
+                self.assertAlmostEqual(expected["mean"], actual["mean"], delta=0.002)
+
+    def test_stable_after_variance(self):
+        engine = StreamingZScoreEngine(window_size=5)
+        for v in [1.1, 7.3, 2.9, 100.2, 3.3]:
+            engine.process(v)
+        for _ in range(5):
+            result = engine.process(50.0)
+        self.assertEqual(result["msg"], "stable")
+        self.assertEqual(result["z_score"], 0.0)
+
+    def test_is_outlier_matches_exact(self):
+        rng = random.Random(5)
+        exact = ZScoreEngine(window_size=20)
+        streaming = StreamingZScoreEngine(window_size=20)
+        for _ in range(200):
+            v = rng.gauss(50, 2)
+            exact.process(v)
+            streaming.process(v)
+        for probe in [50.0, 55.0, 70.0, 20.0]:
+            self.assertEqual(exact.is_outlier(probe), streaming.is_outlier(probe))
+        self.assertTrue(streaming.is_outlier(70.0))
+        self.assertFalse(streaming.is_outlier(50.0))
+
+    def test_insufficient_data(self):
+        engine = StreamingZScoreEngine(window_size=10)
+        self.assertEqual(engine.process(1.0)["msg"], "insufficient_data")
+        self.assertEqual(engine.process(2.0)["msg"], "insufficient_data")
+
+class TestRobustZScoreEngine(unittest.TestCase):
+    def test_matches_sorted_median_and_mad(self):
+        rng = random.Random(7)
+        engine = RobustZScoreEngine(window_size=15)
+        values = []
+        for _ in range(200):
+            v = rng.choice([rng.gauss(100, 5), float(rng.randint(0, 3))])
+            result = engine.process(v)
+            values.append(v)
+            window = values[-15:]
+            if len(window) < 3:
+                continue
+            median = statistics.median(window)
+            mad = statistics.median(abs(x - median) for x in window)
+            if mad > 0:
+                self.assertAlmostEqual(result["z_score"], round((v - median) / (1.4826 * mad), 3), places=6)
+                self.assertAlmostEqual(result["median"], round(median, 3))
+
+    def test_spike_does_not_mask_next_spike(self):
+        robust, classic = RobustZScoreEngine(window_size=30), ZScoreEngine(window_size=30)
+        for i in range(28):
+            v = 20.0 + (i % 3) * 0.1
+            robust.process(v)
+            classic.process(v)
+        self.assertTrue(robust.process(80.0)["anomaly"])
+        classic.process(80.0)
+        # The first spike inflated the stdev: the classic engine misses the second one
+        self.assertFalse(classic.process(60.0)["anomaly"])
+        self.assertTrue(robust.process(60.0)["anomaly"])
+        self.assertTrue(robust.is_outlier(60.0))
+        self.assertFalse(robust.is_outlier(20.1))
+
+    def test_stepped_meter_and_stable(self):
+        engine = RobustZScoreEngine(window_size=10)
+        for v in [5.0] * 7 + [6.0, 5.0]:
+            result = engine.process(v)
+        # MAD is 0 (most samples on the median): mean absolute deviation is used
+        self.assertEqual(result, {"z_score": 0.0, "anomaly": False, "median": 5.0})
+        self.assertTrue(engine.process(9.0)["anomaly"])
+        flat = RobustZScoreEngine(window_size=5)
+        for _ in range(5):
+            result = flat.process(1.0)
+        self.assertEqual(result["msg"], "stable")
+
+    def test_window_eviction_and_restore(self):
+        store = WindowStore(window_size=4)
+        engine = RobustZScoreEngine(buffer=store.view("sensor.a"))
+        for v in [1.0, 100.0, 2.0, 3.0, 4.0]:
+            engine.process(v)
+        self.assertEqual(list(engine._sorted), [2.0, 3.0, 4.0, 100.0])
+        engine.restore([7.0, 5.0, 6.0])
+        self.assertEqual(list(engine._sorted), [5.0, 6.0, 7.0])
+        self.assertEqual(engine.process(float("nan"))["error"], "non-finite value nan")
+
+class TestEwmaEngine(unittest.TestCase):
+    def test_regular_samples_match_fixed_alpha_ewma(self):
+        # Regular sampling: steady-state weight 1 / (1 - d) gives alpha = 1 - 2^(-dt/half_life)
+        engine = EwmaEngine(half_life=60.0)
+        alpha = 1 - 0.5 ** (10.0 / 60.0)
+        rng = random.Random(3)
+        mean = None
+        for i in range(2000):
+            v = 20.0 + rng.gauss(0, 0.5)
+            engine.process(v, timestamp=1700000000.0 + 10.0 * i)
+            mean = v if mean is None else mean + alpha * (v - mean)
+        self.assertAlmostEqual(engine.get_state()[0], mean, places=6)
+        self.assertAlmostEqual(engine.get_state()[2], 1 / alpha, places=6)
+
+    def test_irregular_timestamps_weigh_by_time(self):
+        engine = EwmaEngine(half_life=3600.0)
+        t = 1700000000.0
+        for i in range(20):
+            engine.process(10.0 + (i % 2) * 0.2, timestamp=t + i)
+        before, _, weight_before, _ = engine.get_state()
+        # One hour of silence halves the weight of everything seen so far
+        engine.process(12.0, timestamp=t + 19 + 3600)
+        mean, _, weight, last_t = engine.get_state()
+        self.assertAlmostEqual(weight, weight_before / 2 + 1, places=9)
+        self.assertAlmostEqual(mean, before + (12.0 - before) / weight, places=9)
+        self.assertEqual(last_t, t + 19 + 3600)
+        # Out-of-order samples do not rewind time
+        engine.process(10.0, timestamp=t)
+        self.assertEqual(engine.get_state()[3], t + 19 + 3600)
+
+    def test_anomaly_and_relearn_after_silence(self):
+        engine = EwmaEngine(half_life=600.0)
+        t = 1700000000.0
+        self.assertEqual(engine.process(21.0, timestamp=t)["msg"], "insufficient_data")
+        for i in range(1, 50):
+            engine.process(21.0 + (i % 3) * 0.1, timestamp=t + 30 * i)
+        self.assertTrue(engine.is_outlier(30.0, timestamp=t + 1500))
+        # The pre-check decays like process(): stale state is not scored
+        self.assertFalse(engine.is_outlier(30.0, timestamp=t + 50 * 30 + 6000))
+        result = engine.process(30.0, "2023-11-14T22:38:20+00:00")
+        self.assertTrue(result["anomaly"])
+        self.assertIn("mean", result)
+        # After 10 half-lives the old state weighs < 1 sample: start learning again
+        self.assertEqual(engine.process(18.0, timestamp=t + 50 * 30 + 6000)["msg"], "insufficient_data")
+
+    def test_constant_memory_and_state_round_trip(self):
+        engine = EwmaEngine(half_life=60.0)
+        self.assertFalse(hasattr(engine, "__dict__"))
+        for i in range(500):
+            engine.process(float(i % 7), timestamp=1000.0 + i)
+        self.assertEqual(engine.samples, 500)
+        copy = EwmaEngine(half_life=60.0)
+        copy.set_state(engine.get_state())
+        self.assertEqual(copy.process(3.0, timestamp=1600.0), engine.process(3.0, timestamp=1600.0))
+
+    def test_restore_and_stable(self):
+        engine = EwmaEngine(half_life=60.0)
+        engine.restore([5.0] * 10)
+        self.assertTrue(engine.is_outlier(5.5))
+        self.assertEqual(engine.process(5.0, timestamp=1000.0)["msg"], "stable")
+        with self.assertRaises(ValueError):
+            EwmaEngine(half_life=0)
+
+class TestNonFinite(unittest.TestCase):
+    def test_rejected_by_windowed_engines(self):
+        for engine in [ZScoreEngine(window_size=5), StreamingZScoreEngine(window_size=5), RobustZScoreEngine(window_size=5)]:
+            engine.restore([1.0, float("nan"), 2.0, float("inf"), 3.0])
+            self.assertEqual(engine.buffer.get_all(), [1.0, 2.0, 3.0])
+            self.assertEqual(engine.process(float("-inf"))["error"], "non-finite value -inf")
+            self.assertEqual(engine.samples, 3)
+            self.assertEqual(engine.process(2.0)["mean" if not isinstance(engine, RobustZScoreEngine) else "median"], 2.0)
+
+class TestOutlierBounds(unittest.TestCase):
+    def test_bounds_agree_with_is_outlier(self):
+        rng = random.Random(9)
+        clock = lambda: 0.0
+        engines = [ZScoreEngine(window_size=20), StreamingZScoreEngine(window_size=20),
+                   RobustZScoreEngine(window_size=20), EwmaEngine(half_life=60, clock=clock)]
+        for engine in engines:
+            low, high = engine.outlier_bounds()
+            self.assertEqual((low, high), (float("-inf"), float("inf")))
+            for _ in range(50):
+                engine.process(rng.gauss(50, 2))
+            low, high = engine.outlier_bounds()
+            for probe in [45.0, 50.0, 55.0, 60.0, 30.0, low - 0.01, high + 0.01]:
+                self.assertEqual(probe < low or probe > high, engine.is_outlier(probe), type(engine).__name__)
+
+    def test_flat_window_band_is_empty(self):
+        engine = StreamingZScoreEngine(window_size=10)
+        for _ in range(5):
+            engine.process(7.0)
+        self.assertEqual(engine.outlier_bounds(), (7.0, 7.0))
+
 class TestLinearDiagnostic(unittest.TestCase):
     def test_slope_calculation(self):
         diag = LinearDiagnostic(window_size=5)
@@ -60,6 +298,38 @@ class TestLinearDiagnostic(unittest.TestCase):
             m = diag.process(10)
         self.assertEqual(m, 0.0)
 
+    def test_irregular_timestamps(self):
+        # y = 0.5 * t sampled at irregular epoch times -> slope 0.5 units/second
+        diag = LinearDiagnostic(window_size=5)
+        t0 = 1700000000.0
+        for dt in [0, 3, 4, 11, 30, 31, 47, 90]:
+            m = diag.process(0.5 * dt, timestamp=t0 + dt)
+        self.assertAlmostEqual(m, 0.5, places=4)
+
+    def test_iso_timestamps(self):
+        diag = LinearDiagnostic(window_size=3)
+        diag.process(20.0, timestamp="2024-01-01T10:00:00+00:00")
+        m = diag.process(21.0, timestamp="2024-01-01T10:00:10.000000+00:00")
+        self.assertAlmostEqual(m, 0.1, places=4)
+
+    def test_matches_full_recompute(self):
+        rng = random.Random(7)
+        diag = LinearDiagnostic(window_size=15, resync_interval=1000)
+        t = 1700000000.0
+        points = []
+        for _ in range(500):
+            t += rng.uniform(0.2, 30.0)
+            y = 21.0 + rng.gauss(0, 0.3)
+            points.append((t, y))
+            m = diag.process(y, timestamp=t)
+        window = points[-15:]
+        n = len(window)
+        mx = sum(p[0] for p in window) / n
+        my = sum(p[1] for p in window) / n
+        expected = (sum((x - mx) * (y - my) for x, y in window) /
+                    sum((x - mx) ** 2 for x, _ in window))
+        self.assertAlmostEqual(m, expected, places=3)
+
 class TestSolarDiagnostic(unittest.TestCase):
     def test_valid_conditions(self):
         # Elevation high (45), Lux high (1000) -> OK
@@ -0,0 +1,78 @@
+import json
+import unittest
+import aiohttp
+from src.common.metrics import Histogram, MetricsRegistry, rss_bytes, start_metrics_server
+from src.egress.deadband import DeadbandFilter
+
+class TestHistogram(unittest.TestCase):
+    def test_buckets_and_quantiles(self):
+        h = Histogram(buckets=(0.001, 0.01, 0.1))
+        for v in [0.0005] * 50 + [0.005] * 49 + [0.5]:
+            h.observe(v)
+        self.assertEqual(h.counts, [50, 49, 0, 1])
+        self.assertEqual(h.count, 100)
+        self.assertEqual(h.quantile(0.5), 0.001)
+        self.assertEqual(h.quantile(0.99), 0.01)
+        self.assertEqual(h.quantile(1.0), float("inf"))
+        # Upper bounds are inclusive, like Prometheus "le"
+        h.observe(0.01)
+        self.assertEqual(h.counts[1], 50)
+
+class TestRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.registry.counter("errors").inc(3)
+        self.registry.gauge("depth").set(7)
+        self.registry.histogram("kernel_seconds", buckets=(0.001, 0.01)).observe(0.002)
+        deadband = DeadbandFilter(["sensor.a*=abs:1", "sensor.b*=pct:5"])
+        deadband.should_publish("sensor.a1", 1.0)
+        self.registry.register("deadband", deadband.stats)
+        self.registry.register("ingest", lambda: {"depth": 2, "received": 10})
+
+    def test_snapshot(self):
+        snap = self.registry.snapshot()
+        self.assertEqual(snap["errors"], 3)
+        self.assertEqual(snap["depth"], 7)
+        self.assertEqual(snap["ingest"], {"depth": 2, "received": 10})
+        self.assertEqual(snap["kernel_seconds"]["count"], 1)
+        json.dumps(snap)
+
+    def test_prometheus_text(self):
+        text = self.registry.prometheus()
+        lines = text.splitlines()
+        self.assertIn("knx_sentinel_errors 3", lines)
+        self.assertIn("knx_sentinel_ingest_received 10", lines)
+        self.assertIn('knx_sentinel_deadband_rules_sent{key="sensor.a*"} 1', lines)
+        self.assertIn('knx_sentinel_kernel_seconds_bucket{le="0.01"} 1', lines)
+        self.assertIn('knx_sentinel_kernel_seconds_bucket{le="+Inf"} 1', lines)
+        # Each family is declared once and its samples are contiguous
+        families = [l.split()[2] for l in lines if l.startswith("# TYPE")]
+        self.assertEqual(len(families), len(set(families)))
+        rule_lines = [i for i, l in enumerate(lines) if l.startswith("knx_sentinel_deadband_rules_sent")]
+        self.assertEqual(rule_lines, list(range(rule_lines[0], rule_lines[0] + 2)))
+
+    def test_failing_provider_is_skipped(self):
+        self.registry.register("broken", lambda: 1 / 0)
+        self.assertNotIn("broken", self.registry.snapshot())
+        self.assertNotIn("broken", self.registry.prometheus())
+
+    def test_process_metrics(self):
+        self.assertGreater(rss_bytes(), 1024 * 1024)
+        self.registry.add_process_metrics()
+        self.assertGreater(self.registry.snapshot()["process_rss_bytes"], 0)
+
+class TestMetricsServer(unittest.IsolatedAsyncioTestCase):
+    async def test_serves_prometheus_text(self):
+        registry = MetricsRegistry()
+        registry.counter("events").inc()
+        runner = await start_metrics_server(registry, 8126, host="127.0.0.1")
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get("http://127.0.0.1:8126/metrics") as resp:
+                    self.assertEqual(resp.status, 200)
+                    self.assertIn("knx_sentinel_events 1", await resp.text())
+        finally:
+            await runner.cleanup()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import asyncio
+import unittest
+from aiohttp import web
+from mock import supervisor
+from mock.scenario import Heartbeat, Scenario, ScenarioGenerator, group_address
+from src.ingestion.websocket_client import HomeAssistantClient
+
+class TestScenario(unittest.TestCase):
+    def test_heartbeat_parse_and_dropout(self):
+        hb = Heartbeat.parse("6/1/1:10:300:120")
+        self.assertEqual((hb.address, hb.interval, hb.dropout_every, hb.dropout_for), ("6/1/1", 10, 300, 120))
+        self.assertTrue(hb.is_up(0))
+        self.assertTrue(hb.is_up(179))
+        self.assertFalse(hb.is_up(181))
+        self.assertTrue(hb.is_up(301))
+        self.assertTrue(Heartbeat.parse("6/1/2").is_up(1e6))
+        with self.assertRaises(ValueError):
+            Heartbeat.parse("6/1/1:10:300")
+
+    def test_rate_profile_cycles(self):
+        scenario = Scenario(entities=10, profile=[(10, 100), (2, 5000)])
+        self.assertEqual(scenario.rate_at(0), 100)
+        self.assertEqual(scenario.rate_at(11), 5000)
+        self.assertEqual(scenario.rate_at(12.5), 100)
+        self.assertEqual(Scenario(entities=10, firehose=True).rate_at(5), 0)
+
+    def test_generator_mix(self):
+        scenario = Scenario(entities=100, numeric_share=0.5, binary_share=0.2, knx_share=0.25,
+                            group_addresses=300, attribute_bytes=64, seed=3)
+        gen = ScenarioGenerator(scenario)
+        self.assertEqual((len(gen.numeric), len(gen.binary), len(gen.text)), (50, 20, 30))
+        self.assertEqual(len(gen.initial_states()), 100)
+        self.assertEqual(len(gen.attributes["padding"]), 64)
+        self.assertEqual(group_address(257), "1/1/1")
+
+        events = [gen.next_event() for _ in range(4000)]
+        knx = [e for e in events if e[0] == "knx_event"]
+        self.assertAlmostEqual(len(knx) / len(events), 0.25, delta=0.03)
+        for _, entity_id, state in events:
+            if entity_id.startswith("binary_sensor."):
+                self.assertIn(state, ("on", "off"))
+            elif entity_id.startswith("sensor.load_mode_"):
+                self.assertIn(state, ScenarioGenerator.TEXT_STATES)
+            elif entity_id.startswith("sensor.load_"):
+                float(state)
+
+class TestScenarioServer(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.saved_states = dict(supervisor.MOCK_STATES)
+        self.app = web.Application()
+        self.app.add_routes([web.get('/core/websocket', supervisor.websocket_handler)])
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        self.site = web.TCPSite(self.runner, 'localhost', 8125)
+        await self.site.start()
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+        supervisor.load_scenario(None)
+        supervisor.MOCK_STATES.clear()
+        supervisor.MOCK_STATES.update(self.saved_states)
+
+    async def test_firehose_with_knx_and_heartbeat(self):
+        supervisor.load_scenario(Scenario(entities=50, firehose=True, knx_share=0.2, duration=0.5, seed=1,
+                                          heartbeats=[Heartbeat("6/1/1", interval=0.05)]))
+        self.assertIn("sensor.load_0", supervisor.MOCK_STATES)
+        received = []
+        client = HomeAssistantClient("ws://localhost:8125/core/websocket", "fake_token", received.append)
+        task = asyncio.create_task(client.connect())
+        try:
+            await asyncio.sleep(1.0)
+        finally:
+            await client.close()
+            task.cancel()
+        types = {m["event"]["event_type"] for m in received}
+        self.assertEqual(types, {"state_changed", "knx_event"})
+        self.assertGreater(len(received), 500)
+        self.assertTrue(any(m["event"]["data"].get("destination") == "6/1/1" for m in received))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,222 @@
+import asyncio
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+import paho.mqtt.client as mqtt
+from src.egress.mqtt import MQTTEgress
+from src.egress.outbox import Outbox
+
+class FakeClient:
+    """Captures publishes instead of talking to a broker."""
+    def __init__(self):
+        self.published = []
+        self.connected = False
+        # Acknowledge publishes immediately (as if the broker sent PUBACK)
+        self.acks = True
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        self.published.append((topic, payload, qos))
+        info = mqtt.MQTTMessageInfo(len(self.published))
+        if self.acks:
+            info._set_as_published()
+        return info
+
+    def is_connected(self):
+        return self.connected
+
+    def loop_stop(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+def make_egress(**config) -> MQTTEgress:
+    egress = MQTTEgress({"client_id": "c", "site_id": "s", "mqtt_outbox_enabled": False, **config})
+    egress.client = FakeClient()
+    return egress
+
+class TestBatchedEgress(unittest.TestCase):
+    def test_unbatched_publishes_per_entity(self):
+        egress = make_egress()
+        egress.publish("telemetry", "sensor.a", {"value": 1.0})
+        topic, payload, qos = egress.client.published[0]
+        self.assertEqual(topic, "knx-monitor/c/s/telemetry/sensor.a")
+        self.assertEqual(json.loads(payload), {"value": 1.0})
+        self.assertEqual(qos, 1)
+
+    def test_flush_on_count(self):
+        egress = make_egress(mqtt_batch_enabled=True, mqtt_batch_max_count=3)
+        for i in range(7):
+            egress.publish("telemetry", f"sensor.e{i}", {"value": i})
+        self.assertEqual(len(egress.client.published), 2)
+        topic, body, _ = egress.client.published[0]
+        self.assertEqual(topic, "knx-monitor/c/s/batch")
+        items = json.loads(body)
+        self.assertEqual([it["id"] for it in items], ["sensor.e0", "sensor.e1", "sensor.e2"])
+        self.assertEqual(items[0], {"type": "telemetry", "id": "sensor.e0", "payload": {"value": 0}})
+
+        # stop() flushes the remainder
+        egress.stop()
+        self.assertEqual(len(json.loads(egress.client.published[-1][1])), 1)
+
+    def test_flush_on_bytes(self):
+        egress = make_egress(mqtt_batch_enabled=True, mqtt_batch_max_bytes=200)
+        for i in range(10):
+            egress.publish("telemetry", "sensor.a", {"value": i, "pad": "x" * 40})
+        for _, body, _ in egress.client.published:
+            self.assertLessEqual(len(body), 200)
+            json.loads(body)
+
+    def test_flush_on_latency(self):
+        egress = make_egress(mqtt_batch_enabled=True, mqtt_batch_max_latency_ms=50)
+        # No broker: drive the flush loop directly
+        t = threading.Thread(target=egress._batch_loop, daemon=True)
+        t.start()
+        egress.publish("telemetry", "sensor.a", {"value": 1})
+        deadline = time.time() + 2
+        while not egress.client.published and time.time() < deadline:
+            time.sleep(0.01)
+        egress.stop()
+        self.assertEqual(len(egress.client.published), 1)
+
+    def test_per_entity_topics_kept(self):
+        egress = make_egress(mqtt_batch_enabled=True, mqtt_batch_per_entity_topics=True)
+        egress.publish("telemetry", "sensor.a", {"value": 1})
+        self.assertEqual(egress.client.published[0][0], "knx-monitor/c/s/telemetry/sensor.a")
+        egress.stop()
+        self.assertEqual(egress.client.published[-1][0], "knx-monitor/c/s/batch")
+
+class TestProviders(unittest.IsolatedAsyncioTestCase):
+    async def test_providers_run_on_the_loop(self):
+        egress = make_egress()
+        egress.loop = asyncio.get_running_loop()
+        threads = []
+
+        def failing():
+            raise RuntimeError("dict changed size during iteration")
+
+        egress.heartbeat_fields["ok"] = lambda: threads.append(threading.get_ident()) or 1
+        egress.heartbeat_fields["broken"] = failing
+        egress.metrics_provider = lambda: {"thread": threading.get_ident()}
+        fields = await asyncio.to_thread(egress._on_loop, egress._heartbeat_fields)
+        metrics = await asyncio.to_thread(egress._on_loop, egress.metrics_provider)
+        # A failing provider is left out, the others are still reported
+        self.assertEqual(fields, {"ok": 1})
+        self.assertEqual(threads, [threading.get_ident()])
+        self.assertEqual(metrics["thread"], threading.get_ident())
+
+class TestOutbox(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "outbox.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_fifo_and_persistence(self):
+        box = Outbox(self.path)
+        for i in range(5):
+            box.put(f"t/{i}", f"p{i}")
+        rows = box.peek(limit=2)
+        self.assertEqual([r[1] for r in rows], ["t/0", "t/1"])
+        box.delete([r[0] for r in rows])
+        box.close()
+
+        reopened = Outbox(self.path)
+        self.assertEqual(len(reopened), 3)
+        self.assertEqual([r[2] for r in reopened.peek()], [b"p2", b"p3", b"p4"])
+        reopened.close()
+
+    def test_size_cap_drop_oldest(self):
+        box = Outbox(self.path, max_bytes=100)
+        for i in range(20):
+            box.put("t", b"x" * 9 + bytes([i]))
+        self.assertLessEqual(box.size_bytes, 100)
+        self.assertEqual(box.peek(limit=1)[0][2][-1], 10)
+        self.assertEqual(box.evicted, 10)
+        box.close()
+
+    def test_size_cap_drop_newest(self):
+        box = Outbox(self.path, max_bytes=30, eviction="drop_newest")
+        results = [box.put("t", b"x" * 10) for _ in range(4)]
+        self.assertEqual(results, [True, True, True, False])
+        box.close()
+
+    def test_puts_are_written_in_batches(self):
+        box = Outbox(self.path)
+        box.FLUSH_COUNT = 4
+        on_disk = lambda: sqlite3.connect(self.path).execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        for i in range(3):
+            box.put("t", f"p{i}")
+        # Buffered in memory, but already counted
+        self.assertEqual((len(box), on_disk()), (3, 0))
+        box.put("t", "p3")
+        self.assertEqual(on_disk(), 4)
+        box.put("t", "p4")
+        box.flush()
+        self.assertEqual(on_disk(), 5)
+        box.close()
+
+    def test_egress_stores_while_offline_and_drains_in_order(self):
+        egress = make_egress(mqtt_outbox_enabled=True, mqtt_outbox_path=self.path, mqtt_outbox_drain_rate=1000)
+        for i in range(5):
+            egress.publish("telemetry", "sensor.a", {"value": i})
+        self.assertEqual(egress.client.published, [])
+        self.assertEqual(len(egress.outbox), 5)
+
+        egress.client.connected = True
+        egress.publish("telemetry", "sensor.a", {"value": 99})  # live traffic goes straight out
+        egress.drain_thread = threading.Thread(target=egress._drain_loop, daemon=True)
+        egress.drain_thread.start()
+        egress._drain_wakeup.set()
+        deadline = time.time() + 2
+        while len(egress.outbox) and time.time() < deadline:
+            time.sleep(0.01)
+        egress.stop()
+        values = [json.loads(p)["value"] for _, p, _ in egress.client.published]
+        self.assertEqual(values, [99, 0, 1, 2, 3, 4])
+
+    def test_unacknowledged_messages_stay_in_outbox(self):
+        egress = make_egress(mqtt_outbox_enabled=True, mqtt_outbox_path=self.path, mqtt_outbox_drain_rate=1000)
+        egress.OUTBOX_ACK_TIMEOUT = 0.05
+        for i in range(3):
+            egress.publish("telemetry", "sensor.a", {"value": i})
+        egress.client.connected = True
+        egress.client.acks = False
+        drain = threading.Thread(target=egress._drain_loop, daemon=True)
+        drain.start()
+        egress._drain_wakeup.set()
+        deadline = time.time() + 2
+        while len(egress.client.published) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.1)
+        # Queued by paho but never acknowledged: still in the outbox after a restart
+        self.assertEqual(len(egress.outbox), 3)
+        egress.client.acks = True
+        egress._drain_wakeup.set()
+        deadline = time.time() + 2
+        while len(egress.outbox) and time.time() < deadline:
+            time.sleep(0.01)
+        egress.stop()
+        box = Outbox(self.path)
+        self.assertEqual(len(box), 0)
+        box.close()
+
+    def test_stats_counters(self):
+        egress = make_egress(mqtt_outbox_enabled=True, mqtt_outbox_path=self.path)
+        egress.publish("telemetry", "sensor.a", {"value": 1})
+        egress.client.connected = True
+        egress.publish("telemetry", "sensor.a", {"value": 2})
+        egress.publish("telemetry", "sensor.a", {"value": object()})  # not serializable
+        stats = egress.stats()
+        self.assertEqual((stats["outboxed"], stats["published"], stats["errors"]), (1, 1, 1))
+        self.assertEqual(stats["outbox_depth"], 1)
+        self.assertTrue(stats["connected"])
+        egress.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from src.kernel.buffer import WindowStore
+from src.kernel.math_engine import (StreamingZScoreEngine, ZScoreEngine, RobustZScoreEngine, LinearDiagnostic,
+                                    EwmaEngine, engine_types)
+from src.kernel.registry import EngineRegistry, EngineRules
+from tests.helpers import FakeClock
+
+class TestEngineRegistry(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.store = WindowStore(window_size=5, capacity=2)
+
+    def make(self, **kwargs) -> EngineRegistry:
+        return EngineRegistry(lambda eid: StreamingZScoreEngine(buffer=self.store.view(eid)),
+                              store=self.store, clock=self.clock, **kwargs)
+
+    def test_lru_cap_releases_rows(self):
+        registry = self.make(max_entities=3)
+        for eid in ["a", "b", "c"]:
+            registry.get(eid).process(1.0)
+        registry.get("a")  # a is now most recent
+        registry.get("d")
+        self.assertEqual(len(registry), 3)
+        self.assertNotIn("b", registry)
+        self.assertNotIn("b", self.store.rows)
+        self.assertEqual(registry.evicted_lru, 1)
+        # Rows are reused: the store does not grow past what 3 entities need
+        for i in range(100):
+            registry.get(f"x{i}")
+        self.assertEqual(len(self.store), 3)
+        self.assertLessEqual(self.store.capacity, 4)
+
+    def test_idle_ttl(self):
+        registry = self.make(idle_ttl=60)
+        registry.get("old")
+        self.clock.now = 30
+        registry.get("recent")
+        self.clock.now = 61
+        registry.get("new")
+        self.assertNotIn("old", registry)
+        self.assertIn("recent", registry)
+        self.clock.now = 200
+        self.assertEqual(registry.evict_idle(), 2)
+        self.assertEqual(registry.stats()["evicted_idle"], 3)
+        self.assertEqual(len(self.store), 0)
+
+    def test_peek_does_not_create_or_touch(self):
+        registry = self.make(max_entities=2)
+        self.assertIsNone(registry.peek("a"))
+        registry.get("a")
+        registry.get("b")
+        registry.peek("a")
+        registry.get("c")
+        self.assertNotIn("a", registry)
+
+    def test_evicted_entity_starts_fresh(self):
+        registry = self.make(max_entities=1)
+        for v in [1.0, 2.0, 3.0]:
+            registry.get("a").process(v)
+        registry.get("b")
+        self.assertEqual(registry.get("a").process(10.0)["msg"], "insufficient_data")
+
+    def test_nbytes_is_bounded(self):
+        registry = self.make(max_entities=100)
+        for i in range(1000):
+            registry.get(f"sensor.e{i}").process(float(i))
+        full = registry.nbytes
+        for i in range(1000, 5000):
+            registry.get(f"sensor.e{i}").process(float(i))
+        self.assertEqual(registry.nbytes, full)
+        self.assertEqual(registry.stats()["entities"], 100)
+
+    def test_nbytes_per_engine_type(self):
+        rules = EngineRules(["sensor.r*=robust", "sensor.w*=ewma"], engine_types(), StreamingZScoreEngine)
+        registry = EngineRegistry(lambda eid: rules.engine_for(eid)(), clock=self.clock)
+        for eid in ["sensor.z", "sensor.r", "sensor.w"]:
+            for v in range(30):
+                registry.get(eid).process(float(v))
+        engines = [registry.peek(eid) for eid in ["sensor.z", "sensor.r", "sensor.w"]]
+        # Each engine counts for its own size
+        self.assertGreater(registry.nbytes, sum(e.nbytes for e in engines))
+        zscore, robust, ewma = (e.nbytes for e in engines)
+        # The skiplist mirroring the window is counted, the EWMA state has no window
+        self.assertGreater(robust, zscore + 30 * 50)
+        self.assertLess(ewma, zscore)
+
+class TestEngineRules(unittest.TestCase):
+    def test_first_match_wins(self):
+        rules = EngineRules(["sensor.*_energy=robust", "sensor.*=zscore", "'sensor.gas_meter = robust'"],
+                            engine_types(StreamingZScoreEngine), StreamingZScoreEngine)
+        self.assertIs(rules.engine_for("sensor.main_energy"), RobustZScoreEngine)
+        self.assertIs(rules.engine_for("sensor.temp"), StreamingZScoreEngine)
+        self.assertIs(rules.engine_for("light.kitchen"), StreamingZScoreEngine)
+        self.assertIs(EngineRules(["sensor.*_co2=ewma"], engine_types(), ZScoreEngine).engine_for("sensor.bath_co2"),
+                      EwmaEngine)
+
+    def test_invalid_rules(self):
+        for spec in ["sensor.*", "=robust", "sensor.*=kalman"]:
+            with self.assertRaises(ValueError):
+                EngineRules([spec], engine_types(), ZScoreEngine)
+
+class TestCompactEngines(unittest.TestCase):
+    def test_engines_have_no_instance_dict(self):
+        for engine in (ZScoreEngine(), StreamingZScoreEngine(), RobustZScoreEngine(), LinearDiagnostic()):
+            self.assertFalse(hasattr(engine, "__dict__"), type(engine).__name__)
+            self.assertFalse(hasattr(engine.buffer, "__dict__"))
+
+if __name__ == '__main__':
+    unittest.main()
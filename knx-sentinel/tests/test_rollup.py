@@ -0,0 +1,51 @@
+import unittest
+from src.kernel.rollup import RollupEngine, parse_resolution
+from tests.helpers import FakeClock
+
+class TestRollupEngine(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(1_800_000_000.0)  # aligned to the hour
+        self.emitted = []
+        self.rollups = RollupEngine(["1m", "15m"], lambda res, eid, p: self.emitted.append((res, eid, p)),
+                                    clock=self.clock)
+
+    def test_parse_resolution(self):
+        self.assertEqual([parse_resolution(r) for r in ("30s", "1m", "15m", "1h", "1d")],
+                         [30, 60, 900, 3600, 86400])
+        for bad in ("0m", "5", "1w", ""):
+            with self.assertRaises(ValueError):
+                parse_resolution(bad)
+
+    def test_buckets_aligned_and_emitted_on_next_sample(self):
+        start = self.clock.now
+        for offset, value in [(5, 3.0), (20, 1.0), (59, 2.0)]:
+            self.rollups.add("sensor.a", value, start + offset)
+        self.assertEqual(self.emitted, [])
+        self.rollups.add("sensor.a", 10.0, start + 61)
+        self.assertEqual(self.emitted, [("1m", "sensor.a", {
+            "start": start, "end": start + 60, "count": 3, "min": 1.0, "max": 3.0, "mean": 2.0, "last": 2.0})])
+
+    def test_flush_closes_quiet_entities(self):
+        start = self.clock.now
+        self.rollups.add("sensor.a", 1.0, start + 10)
+        self.rollups.add("sensor.b", 5.0, start + 30)
+        self.assertEqual(self.rollups.flush(start + 59), 0)
+        self.assertEqual(self.rollups.flush(start + 60), 2)
+        self.assertEqual(sorted(eid for res, eid, _ in self.emitted), ["sensor.a", "sensor.b"])
+        self.assertEqual(self.rollups.flush(start + 900), 2)
+        self.assertEqual([res for res, _, _ in self.emitted[2:]], ["15m", "15m"])
+        # Nothing open any more: quiet entities are forgotten
+        self.assertEqual(self.rollups.stats()["entities"], 0)
+
+    def test_flush_all_marks_partial(self):
+        self.rollups.add("sensor.a", 4.0, self.clock.now + 10)
+        self.clock.now += 30
+        self.assertEqual(self.rollups.flush_all(), 2)
+        self.assertTrue(all(p["partial"] for _, _, p in self.emitted))
+        self.assertEqual(self.rollups.stats()["entities"], 0)
+
+    def test_next_boundary(self):
+        self.assertEqual(self.rollups.next_boundary(self.clock.now + 1), self.clock.now + 60)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import asyncio
+import math
+import os
+import signal
+import random
+import unittest
+from src.kernel.math_engine import StreamingZScoreEngine
+from src.kernel.sharding import ShardedKernel, decode_results, encode_result
+
+class TestResultRecords(unittest.TestCase):
+    def test_round_trip(self):
+        cases = [
+            {"z_score": 0.0, "anomaly": False, "msg": "insufficient_data"},
+            {"z_score": 0.0, "anomaly": False, "msg": "stable"},
+            {"z_score": 4.25, "anomaly": True, "mean": 230.5},
+            {"z_score": -0.5, "anomaly": False, "mean": 1.0},
+            {"z_score": 5.0, "anomaly": True, "median": 12.0},
+        ]
+        bounds = [(-math.inf, math.inf), (1.0, 1.0), (220.0, 241.0), (0.5, 1.5), (2.0, 22.0)]
+        buf = b"".join(encode_result(i, c, b) for i, (c, b) in enumerate(zip(cases, bounds)))
+        self.assertEqual(list(decode_results(buf)), [(i, c, b) for i, (c, b) in enumerate(zip(cases, bounds))])
+
+class TestShardedKernel(unittest.IsolatedAsyncioTestCase):
+    async def test_matches_in_process_engines(self):
+        results = []
+        kernel = ShardedKernel(3, lambda eid, val, ctx, analysis: results.append((eid, val, ctx, analysis)))
+        kernel.start()
+        try:
+            rng = random.Random(11)
+            reference = {}
+            expected = []
+            for i in range(600):
+                eid = f"sensor.e{rng.randrange(20)}"
+                value = rng.gauss(100, 5)
+                engine = reference.setdefault(eid, StreamingZScoreEngine())
+                expected.append((eid, value, i, engine.process(value)))
+                kernel.submit(eid, value, i)
+                if i % 50 == 0:
+                    await asyncio.sleep(0)
+            deadline = asyncio.get_running_loop().time() + 20
+            while len(results) < len(expected) and asyncio.get_running_loop().time() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            kernel.stop()
+
+        self.assertEqual(len(results), len(expected))
+        # Per-entity order is preserved and results match the in-process engine
+        for eid in {e[0] for e in expected}:
+            self.assertEqual([r for r in results if r[0] == eid], [e for e in expected if e[0] == eid])
+        # The pre-check in the parent agrees with the engines' own is_outlier
+        self.assertEqual(kernel.tracked, len(reference))
+        for eid, engine in reference.items():
+            for value in (100.0, 120.0, 60.0):
+                self.assertEqual(kernel.is_outlier(eid, value), engine.is_outlier(value))
+
+    async def test_dead_worker_fails_pending_and_restarts(self):
+        results = []
+        kernel = ShardedKernel(1, lambda eid, val, ctx, analysis: results.append((ctx, analysis)))
+        kernel.start()
+        loop = asyncio.get_running_loop()
+        try:
+            kernel.submit("sensor.a", 1.0, "before")
+            deadline = loop.time() + 20
+            while not results and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            os.kill(kernel._procs[0].pid, signal.SIGKILL)
+            kernel._procs[0].join(5)
+            kernel.submit("sensor.a", 2.0, "lost")
+            deadline = loop.time() + 20
+            while kernel.restarts == 0 and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+            kernel.submit("sensor.a", 3.0, "after")
+            while len(results) < 3 and loop.time() < deadline:
+                await asyncio.sleep(0.05)
+        finally:
+            kernel.stop()
+        self.assertEqual([ctx for ctx, _ in results], ["before", "lost", "after"])
+        self.assertEqual(results[1][1]["error"], "kernel_worker_exited")
+        self.assertEqual(results[2][1]["msg"], "insufficient_data")
+        self.assertEqual((kernel.restarts, kernel.failed, kernel.in_flight), (1, 1, 0))
+
+if __name__ == '__main__':
+    unittest.main()
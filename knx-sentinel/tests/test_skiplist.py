@@ -0,0 +1,38 @@
+import bisect
+import random
+import unittest
+from src.kernel.skiplist import IndexableSkiplist
+
+class TestIndexableSkiplist(unittest.TestCase):
+    def test_matches_sorted_list(self):
+        rng = random.Random(1)
+        skiplist, reference = IndexableSkiplist(60), []
+        for _ in range(5000):
+            if reference and rng.random() < 0.5:
+                value = rng.choice(reference)
+                reference.remove(value)
+                skiplist.remove(value)
+            else:
+                value = float(rng.randint(0, 20))  # plenty of duplicates
+                bisect.insort(reference, value)
+                skiplist.insert(value)
+            self.assertEqual(len(skiplist), len(reference))
+            if reference:
+                i = rng.randrange(len(reference))
+                self.assertEqual(skiplist[i], reference[i])
+        self.assertEqual(list(skiplist), reference)
+        if reference:
+            self.assertEqual(skiplist[-1], reference[-1])
+
+    def test_errors(self):
+        skiplist = IndexableSkiplist()
+        skiplist.insert(1.0)
+        with self.assertRaises(KeyError):
+            skiplist.remove(2.0)
+        with self.assertRaises(IndexError):
+            skiplist[1]
+        with self.assertRaises(ValueError):
+            skiplist.insert(float("inf"))
+
+if __name__ == '__main__':
+    unittest.main()
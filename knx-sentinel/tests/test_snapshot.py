@@ -0,0 +1,203 @@
+import os
+import shutil
+import struct
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from src.kernel.buffer import WindowStore
+from src.kernel.math_engine import EwmaEngine, StreamingZScoreEngine, ZScoreEngine
+from src.kernel.registry import EngineRegistry
+from src.kernel.snapshot import (MAGIC, KernelSnapshot, SnapshotError, capture_state, decode_state, encode_capture,
+                                 encode_state)
+from src.kernel.watchdog import WatchdogKernel
+from tests.helpers import FakeClock
+
+def make_registry(window_size=5, engine_cls=StreamingZScoreEngine):
+    store = WindowStore(window_size=window_size, capacity=4)
+    return EngineRegistry(lambda eid: engine_cls(buffer=store.view(eid)), store=store)
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, "state", "kernel_state.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_round_trip_resumes_scoring(self):
+        engines = make_registry()
+        for v in [10.0, 11.0, 9.0, 10.0, 10.5, 9.5, 10.2]:
+            engines.get("sensor.temp").process(v)
+        engines.get("sensor.one").process(1.0)
+        reference = engines.get("sensor.temp").process(10.1)
+
+        self.assertTrue(KernelSnapshot(self.path, engines, None).save())
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+        restored = make_registry()
+        snapshot = KernelSnapshot(self.path, restored, None)
+        self.assertTrue(snapshot.restore())
+        self.assertEqual(snapshot.stats()["restored_entities"], 2)
+        self.assertEqual(restored.get("sensor.one").buffer.get_all(), [1.0])
+        # Same window, same moments: the next sample scores as if there was no restart
+        self.assertEqual(restored.get("sensor.temp").process(10.1), engines.get("sensor.temp").process(10.1))
+        self.assertNotEqual(reference.get("msg"), "insufficient_data")
+
+    def test_capture_is_detached(self):
+        engines = make_registry()
+        for v in [1.0, 2.0, 3.0]:
+            engines.get("sensor.a").process(v)
+        capture = capture_state(engines, None)
+        # The engines keep running while the capture is encoded elsewhere
+        engines.get("sensor.a").process(4.0)
+        engines.get("sensor.b").process(5.0)
+        state = decode_state(encode_capture(capture))
+        self.assertEqual(list(state.windows), ["sensor.a"])
+        self.assertEqual(list(state.windows["sensor.a"]), [1.0, 2.0, 3.0])
+
+    def test_smaller_window_keeps_latest_values(self):
+        engines = make_registry(window_size=5)
+        for v in range(7):
+            engines.get("sensor.a").process(float(v))
+        state = decode_state(encode_state(engines, None))
+
+        smaller = make_registry(window_size=3, engine_cls=ZScoreEngine)
+        smaller.get("sensor.a").restore(state.windows["sensor.a"])
+        self.assertEqual(smaller.get("sensor.a").buffer.get_all(), [4.0, 5.0, 6.0])
+        self.assertTrue(smaller.get("sensor.a").buffer.is_full())
+
+    def test_watchdog_countdown_resumes(self):
+        clock = FakeClock(1000.0)
+        wd = WatchdogKernel(["6/1/1", "6/1/2", "6/1/3"], timeout=60, clock=clock)
+        clock.now += 61
+        fired = []
+        wd.check_timeouts(fired.append)
+        self.assertEqual(sorted(fired), ["6/1/1", "6/1/2", "6/1/3"])
+        wd.process_state("6/1/3", 1.0)
+        clock.now += 20
+        state = decode_state(encode_state(None, wd)).watchdog
+
+        # Restart: new process, unrelated monotonic clock, one address removed from the config
+        clock2 = FakeClock(5.0)
+        wd2 = WatchdogKernel(["6/1/1", "6/1/3", "6/1/4"], timeout=60, clock=clock2)
+        self.assertEqual(wd2.restore(state), 2)
+        fired = []
+        clock2.now += 40
+        wd2.check_timeouts(fired.append)
+        # 6/1/3 was seen 20s before the snapshot: 40s left
+        self.assertEqual(fired, ["6/1/3"])
+        # 6/1/1 was (and stays) in alarm, so no second timeout; 6/1/4 gets its full timeout
+        clock2.now += 20
+        wd2.check_timeouts(fired.append)
+        self.assertEqual(fired, ["6/1/3", "6/1/4"])
+        self.assertTrue(wd2.alarm_state["6/1/1"])
+
+    def test_corrupted_or_foreign_files_start_cold(self):
+        engines = make_registry()
+        engines.get("sensor.a").process(1.0)
+        data = encode_state(engines, None)
+
+        flipped = bytearray(data)
+        flipped[-10] ^= 0xFF
+        future = bytearray(data)
+        struct.pack_into("<H", future, 4, 99)
+        for bad in (data[:-3], bytes(flipped), b"garbage" * 10, bytes(future), b""):
+            with self.assertRaises(SnapshotError):
+                decode_state(bad)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path, "wb") as f:
+                f.write(bad)
+            restored = make_registry()
+            with self.assertLogs("src.kernel.snapshot", level="WARNING"):
+                self.assertFalse(KernelSnapshot(self.path, restored, None).restore())
+            self.assertEqual(len(restored), 0)
+
+    def test_ewma_state_round_trip(self):
+        def registry():
+            store = WindowStore(window_size=5, capacity=4)
+            return EngineRegistry(lambda eid: EwmaEngine(half_life=60.0) if eid.startswith("sensor.co2")
+                                  else StreamingZScoreEngine(buffer=store.view(eid)), store=store)
+        engines = registry()
+        for i in range(30):
+            engines.get("sensor.co2").process(400.0 + i % 4, timestamp=1000.0 + 20 * i)
+        engines.get("sensor.temp").process(21.0)
+        engines.get("sensor.co2_idle")
+        state = decode_state(encode_state(engines, None))
+        self.assertEqual(list(state.windows), ["sensor.temp"])
+        self.assertEqual(list(state.states), ["sensor.co2"])
+
+        self.assertTrue(KernelSnapshot(self.path, engines, None).save())
+        restored = registry()
+        snapshot = KernelSnapshot(self.path, restored, None)
+        self.assertTrue(snapshot.restore())
+        self.assertEqual(snapshot.stats()["restored_entities"], 2)
+        self.assertEqual(restored.get("sensor.co2").process(420.0, timestamp=1700.0),
+                         engines.get("sensor.co2").process(420.0, timestamp=1700.0))
+
+    def test_changed_rules_skip_mismatched_states(self):
+        store = WindowStore(window_size=5, capacity=4)
+        engines = EngineRegistry(lambda eid: EwmaEngine(half_life=60.0) if eid == "sensor.co2"
+                                 else StreamingZScoreEngine(buffer=store.view(eid)), store=store)
+        for i in range(10):
+            engines.get("sensor.co2").process(400.0 + i, timestamp=1000.0 + i)
+            engines.get("sensor.temp").process(20.0 + i % 3)
+        self.assertTrue(KernelSnapshot(self.path, engines, None).save())
+
+        # Rules swapped: sensor.co2 is now windowed, sensor.temp is EWMA
+        store = WindowStore(window_size=5, capacity=4)
+        restored = EngineRegistry(lambda eid: EwmaEngine(half_life=60.0) if eid == "sensor.temp"
+                                  else StreamingZScoreEngine(buffer=store.view(eid)), store=store)
+        snapshot = KernelSnapshot(self.path, restored, None)
+        self.assertTrue(snapshot.restore())
+        # The window seeds the EWMA engine, the EWMA state is dropped (no engine, no row)
+        self.assertEqual(snapshot.stats()["restored_entities"], 1)
+        self.assertEqual(restored.peek("sensor.temp").samples, 5)
+        self.assertNotIn("sensor.co2", restored)
+        self.assertEqual(store.rows, {})
+
+    def test_writes_are_serialized(self):
+        snapshot = KernelSnapshot(self.path, make_registry(), None)
+        writes = []
+        original = snapshot._write_locked
+        def slow_write(data):
+            writes.append(("start", data))
+            time.sleep(0.05)
+            writes.append(("end", data))
+            return original(data)
+        snapshot._write_locked = slow_write
+        threads = [threading.Thread(target=snapshot.write, args=(bytes([i]) * 8,)) for i in range(3)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # Never two writers on the temporary file at once
+        self.assertEqual([kind for kind, _ in writes], ["start", "end"] * 3)
+        self.assertEqual(snapshot.saves, 3)
+
+    def test_reads_version_1(self):
+        body = struct.pack("<4sHdII", MAGIC, 1, 1000.0, 1, 0) + struct.pack("<HH", 8, 2) + b"sensor.a"
+        body += struct.pack("<2d", 1.0, 2.0)
+        state = decode_state(body + struct.pack("<I", zlib.crc32(body)))
+        self.assertEqual(list(state.windows["sensor.a"]), [1.0, 2.0])
+        self.assertEqual(state.states, {})
+
+    def test_missing_file(self):
+        self.assertFalse(KernelSnapshot(self.path, make_registry(), None).restore())
+
+    def test_restore_respects_registry_bound(self):
+        engines = make_registry()
+        for i in range(10):
+            engines.get(f"sensor.e{i}").process(float(i))
+        data = encode_state(engines, None)
+        store = WindowStore(window_size=5)
+        bounded = EngineRegistry(lambda eid: StreamingZScoreEngine(buffer=store.view(eid)),
+                                 max_entities=3, store=store)
+        for entity_id, values in decode_state(data).windows.items():
+            bounded.get(entity_id).restore(values)
+        # Snapshot is in LRU order: the most recently updated entities survive
+        self.assertEqual([eid for eid, _ in bounded.items()], ["sensor.e7", "sensor.e8", "sensor.e9"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import calendar
+import unittest
+from src.kernel.math_engine import SolarDiagnostic
+from src.kernel.solar import LuxDiagnostic, SolarElevationCache
+
+# Dubai, summer solstice
+LAT, LON = 25.2, 55.3
+NOON = calendar.timegm((2026, 6, 21, 8, 0, 0))   # ~12:00 local
+NIGHT = calendar.timegm((2026, 6, 21, 20, 0, 0))  # ~00:00 local
+
+class TestSolarElevationCache(unittest.TestCase):
+    def test_once_per_bucket(self):
+        cache = SolarElevationCache(LAT, LON, bucket=60)
+        first = cache.elevation(NOON)
+        for offset in range(1, 60):
+            self.assertEqual(cache.elevation(NOON + offset), first)
+        self.assertEqual(cache.computed, 1)
+        cache.elevation(NOON + 60)
+        self.assertEqual(cache.computed, 2)
+        self.assertEqual(first, SolarDiagnostic.calculate_elevation(LAT, LON, 8.0, 172))
+        self.assertGreater(first, 60)
+        self.assertLess(cache.elevation(NIGHT), 0)
+
+    def test_daily_table_matches_per_bucket(self):
+        table = SolarElevationCache(LAT, LON, bucket=300, precompute=True)
+        live = SolarElevationCache(LAT, LON, bucket=300)
+        for t in range(NOON - 8 * 3600, NOON + 16 * 3600, 997):
+            self.assertEqual(table.elevation(t), live.elevation(t))
+        # One table of 288 buckets for the whole day
+        self.assertEqual(table.computed, 288)
+
+class TestLuxDiagnostic(unittest.TestCase):
+    def setUp(self):
+        self.published = []
+        self.lux = LuxDiagnostic(["sensor.*_lux"], SolarElevationCache(LAT, LON),
+                                 lambda eid, status, lux, elev: self.published.append((eid, status)))
+
+    def test_publishes_only_on_status_change(self):
+        self.assertTrue(self.lux.matches("sensor.roof_lux"))
+        self.assertFalse(self.lux.matches("sensor.roof_temp"))
+        self.lux.offer("sensor.roof_lux", 0.0)
+        self.lux.offer("sensor.garden_lux", 20000.0)
+        self.lux.check(NIGHT)
+        self.assertEqual(self.published, [])
+
+        # Next day at noon: the dead sensor has not reported since, it is still checked
+        self.lux.check(NIGHT + 12 * 3600)
+        self.lux.check(NIGHT + 12 * 3600 + 60)
+        self.assertEqual(self.published, [("sensor.roof_lux", "suspect")])
+        self.assertEqual(self.lux.stats()["suspect"], 1)
+
+        self.lux.offer("sensor.roof_lux", 15000.0)
+        self.lux.check(NIGHT + 12 * 3600 + 120)
+        self.assertEqual(self.published[-1], ("sensor.roof_lux", "ok"))
+        self.assertEqual(self.lux.stats()["changes"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
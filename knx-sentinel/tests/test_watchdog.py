@@ -0,0 +1,73 @@
+import unittest
+from src.kernel.watchdog import WatchdogKernel
+from tests.helpers import FakeClock
+
+class TestWatchdogKernel(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(1000.0)
+        self.fired = []
+
+    def test_timeout_fires_once(self):
+        wd = WatchdogKernel(["6/1/1"], timeout=10, clock=self.clock)
+        self.assertEqual(wd.check_timeouts(self.fired.append), 10)
+        self.clock.now += 10.5
+        wd.check_timeouts(self.fired.append)
+        self.clock.now += 30
+        self.assertIsNone(wd.check_timeouts(self.fired.append))
+        self.assertEqual(self.fired, ["6/1/1"])
+        self.assertTrue(wd.alarm_state["6/1/1"])
+
+    def test_heartbeat_rearms_lazily(self):
+        wd = WatchdogKernel(["6/1/1"], timeout=10, clock=self.clock)
+        for _ in range(5):
+            self.clock.now += 8
+            wd.process_state("6/1/1", 1.0)
+            wd.check_timeouts(self.fired.append)
+        self.assertEqual(self.fired, [])
+        # Only one heap entry per entity despite many heartbeats
+        self.assertEqual(len(wd._heap), 1)
+        self.assertAlmostEqual(wd.seconds_until_next(), 10)
+
+    def test_recovery_rearms_and_wakes(self):
+        wakeups = []
+        wd = WatchdogKernel(["6/1/1"], timeout=10, clock=self.clock)
+        wd.on_rearm = lambda: wakeups.append(True)
+        self.clock.now += 11
+        wd.check_timeouts(self.fired.append)
+        wd.process_state("6/1/1", 1.0)
+        self.assertEqual(wakeups, [True])
+        self.assertFalse(wd.alarm_state["6/1/1"])
+        self.clock.now += 11
+        wd.check_timeouts(self.fired.append)
+        self.assertEqual(self.fired, ["6/1/1", "6/1/1"])
+
+    def test_per_address_timeouts(self):
+        wd = WatchdogKernel(["6/1/1", "6/1/2"], timeout=60, timeouts={"6/1/2": 5}, clock=self.clock)
+        self.assertEqual(wd.seconds_until_next(), 5)
+        self.clock.now += 6
+        wd.check_timeouts(self.fired.append)
+        self.assertEqual(self.fired, ["6/1/2"])
+
+    def test_ignores_unmonitored_and_zero(self):
+        wd = WatchdogKernel(["6/1/1"], timeout=10, clock=self.clock)
+        wd.process_state("6/1/9", 1.0)
+        self.clock.now += 9
+        wd.process_state("6/1/1", 0.0)
+        self.clock.now += 2
+        wd.check_timeouts(self.fired.append)
+        self.assertEqual(self.fired, ["6/1/1"])
+        self.assertNotIn("6/1/9", wd.last_seen)
+
+    def test_scales_without_full_scans(self):
+        entities = [f"1/1/{i}" for i in range(5000)]
+        wd = WatchdogKernel(entities, timeout=60, clock=self.clock)
+        self.clock.now += 30
+        for e in entities:
+            wd.process_state(e, 1.0)
+        self.clock.now += 31
+        wd.check_timeouts(self.fired.append)
+        self.assertEqual(self.fired, [])
+        self.assertAlmostEqual(wd.seconds_until_next(), 29)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import json
+import unittest
+from types import SimpleNamespace
+import aiohttp
+from src.ingestion.websocket_client import HomeAssistantClient
+from src.ingestion.filter import FilterManager
+
+def state_changed_frame(entity_id: str, **dumps_kwargs) -> str:
+    return json.dumps({
+        "id": 2,
+        "type": "event",
+        "event": {
+            "event_type": "state_changed",
+            "data": {
+                "entity_id": entity_id,
+                "old_state": {"entity_id": entity_id, "state": "1", "attributes": {"friendly_name": "x"}},
+                "new_state": {"entity_id": entity_id, "state": "2", "attributes": {"friendly_name": "x"}},
+            },
+        },
+    }, **dumps_kwargs)
+
+class TestRawPrefilter(unittest.TestCase):
+    def setUp(self):
+        self.client = HomeAssistantClient("ws://localhost/core/websocket", "token", lambda m: None,
+                                          filter_manager=FilterManager(["sensor.knx*"]))
+
+    def test_rejects_non_target_event(self):
+        self.assertTrue(self.client._reject_raw(state_changed_frame("light.kitchen")))
+        self.assertTrue(self.client._reject_raw(state_changed_frame("light.kitchen", separators=(",", ":"))))
+
+    def test_keeps_target_event(self):
+        self.assertFalse(self.client._reject_raw(state_changed_frame("sensor.knx_temp")))
+
+    def test_keeps_non_event_frames(self):
+        result = json.dumps({"id": 3, "type": "result", "success": True,
+                             "result": [{"entity_id": "light.kitchen", "state": "on"}]})
+        self.assertFalse(self.client._reject_raw(result))
+        knx = json.dumps({"id": 4, "type": "event", "event": {"event_type": "knx_event",
+                                                             "data": {"destination": "6/1/1"}}})
+        self.assertFalse(self.client._reject_raw(knx))
+        self.assertFalse(self.client._reject_raw(json.dumps({"type": "auth_ok"})))
+
+    def test_no_filter_keeps_everything(self):
+        client = HomeAssistantClient("ws://localhost/core/websocket", "token", lambda m: None)
+        self.assertFalse(client._reject_raw(state_changed_frame("light.kitchen")))
+
+class FrameSource:
+    def __init__(self, frames):
+        self._messages = [SimpleNamespace(type=aiohttp.WSMsgType.TEXT, data=f) for f in frames]
+
+    def __aiter__(self):
+        return self._iter()
+
+    async def _iter(self):
+        for m in self._messages:
+            yield m
+
+class TestCounters(unittest.IsolatedAsyncioTestCase):
+    async def test_ingest_counters(self):
+        delivered = []
+        client = HomeAssistantClient("ws://localhost/core/websocket", "token", delivered.append,
+                                     filter_manager=FilterManager(["sensor.knx*"]))
+        # "type" after the nested event: not caught by the raw pre-filter, filtered after decoding
+        late_type = json.dumps({"id": 5, "event": {"event_type": "state_changed",
+                                                   "data": {"entity_id": "light.hall"}}, "type": "event"})
+        client.ws = FrameSource([state_changed_frame("light.kitchen"), state_changed_frame("sensor.knx_1"),
+                                 late_type, json.dumps({"type": "result", "id": 1, "success": True})])
+        await client._handle_messages()
+        self.assertEqual(client.stats(), {"frames": 4, "prefiltered": 1, "filtered": 1, "delivered": 1})
+
+class TestTriggerTranslation(unittest.TestCase):
+    def test_trigger_to_state_changed(self):
+        frame = {"id": 9, "type": "event", "event": {"variables": {"trigger": {
+            "platform": "state", "entity_id": "sensor.a",
+            "from_state": {"state": "1"}, "to_state": {"state": "2", "last_updated": "t"}}}}}
+        out = HomeAssistantClient._trigger_to_state_changed(frame)
+        self.assertEqual(out["event"]["event_type"], "state_changed")
+        self.assertEqual(out["event"]["data"]["entity_id"], "sensor.a")
+        self.assertEqual(out["event"]["data"]["new_state"]["state"], "2")
+        self.assertEqual(out["event"]["time_fired"], "t")
+
+if __name__ == '__main__':
+    unittest.main()